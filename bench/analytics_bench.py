@@ -0,0 +1,84 @@
+# analytics_bench.py
+"""
+Accuracy and cost of the response-time QuantileSketch (quiz_common/analytics.py)
+against exact quantiles of the same values, for several response-time shapes
+(uniform, lognormal, bimodal, many near-zero) and sample sizes. Reports the
+worst relative error over the checked quantiles, the buckets kept (the
+sketch's memory) against the values added, and add() cost. Exits with 1 if
+any error exceeds the sketch's relative accuracy, so it doubles as a check:
+
+    python bench/analytics_bench.py --samples 100 10000 1000000 --out analytics.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from quiz_common.analytics import RELATIVE_ACCURACY, QuantileSketch
+
+CHECKED = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1.0)
+
+
+def shapes(rng):
+    """Response times in seconds, as seen for a 20 s question."""
+    return {
+        "uniform": lambda: rng.uniform(0.05, 20.0),
+        "lognormal": lambda: rng.lognormvariate(0.5, 1.0),
+        "bimodal": lambda: abs(rng.gauss(0.4, 0.1)) if rng.random() < 0.7 else abs(rng.gauss(12.0, 3.0)),
+        "near_zero": lambda: 0.0 if rng.random() < 0.2 else rng.expovariate(50.0),
+    }
+
+
+def exact(sorted_values, q):
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+def bench(shape, draw, n):
+    values = [draw() for _ in range(n)]
+    sketch = QuantileSketch()
+    start = time.perf_counter()
+    for value in values:
+        sketch.add(value)
+    add_ns = (time.perf_counter() - start) / n * 1e9
+    values.sort()
+    worst = 0.0
+    for q in CHECKED:
+        want, got = exact(values, q), sketch.quantile(q)
+        if want > sketch.min_value:
+            worst = max(worst, abs(got - want) / want)
+        else:
+            worst = max(worst, 0.0 if got <= sketch.min_value else 1.0)
+    return {"shape": shape, "samples": n, "worst_relative_error": round(worst, 5),
+            "buckets": len(sketch.buckets), "add_ns": round(add_ns)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QuantileSketch accuracy against exact quantiles")
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 10000, 1000000])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    results = []
+    for n in args.samples:
+        for shape, draw in shapes(rng).items():
+            r = bench(shape, draw, n)
+            results.append(r)
+            flag = "ok" if r["worst_relative_error"] <= RELATIVE_ACCURACY else "OUT OF BOUND"
+            print(f"{shape:>10} n={n:>8}: worst error {r['worst_relative_error']:.3%} ({flag}), "
+                  f"{r['buckets']} buckets, add {r['add_ns']} ns")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.out}")
+    if any(r["worst_relative_error"] > RELATIVE_ACCURACY for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# player_bench.py
+"""
+Memory per player of the servers' player bookkeeping: the quiz_common
+PlayerTable with server_tcp's PlayerRegistry and RankedScores (TCP) or an
+addr -> id KeyIndex over the conns column (UDP), against the name-keyed dicts
+both servers used before.
+Connections and sockets are allocated before measuring, so only the per-player
+tables are counted; usernames are counted in both layouts. The per-connection
+QuizProtocol object (__slots__) is measured against the same attributes kept
+in an instance __dict__.
+Both tables find names (and UDP addresses) through quiz_common's KeyIndex, an
+array of ids, so no id is kept as an int object.
+
+    python bench/player_bench.py --players 1000 100000 --out players.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tcp_quiz"))
+sys.path.insert(0, ROOT)
+from leaderboard import RankedScores
+from players import PlayerRegistry
+from server_tcp import QuizProtocol
+from quiz_common.players import KeyIndex, PlayerTable
+
+
+class Conn:
+    __slots__ = ("fd", "addr")
+
+    def __init__(self, i):
+        self.fd = i + 3
+        self.addr = ("127.0.0.1", 10000 + i % 50000, i)
+
+
+def tcp_table(conns):
+    table = PlayerTable()
+    registry = PlayerRegistry(table)
+    scores = RankedScores(table.points)
+    for i, conn in enumerate(conns):
+        pid = table.intern(f"player{i:06d}")
+        registry.add(pid, conn)
+        scores.add(pid)
+    return table, registry, scores
+
+
+def tcp_dicts(conns):
+    """server_tcp's previous layout: registry dicts plus name-keyed ranked scores."""
+    by_name, fds, names, points, bucket = {}, {}, {}, {}, {}
+    for i, conn in enumerate(conns):
+        name = f"player{i:06d}"
+        by_name[name] = conn
+        fds[name] = conn.fd
+        names[conn.fd] = name
+        points[name] = 0
+        bucket[name] = None
+    return by_name, fds, names, points, {0: bucket}
+
+
+def udp_table(conns):
+    table = PlayerTable()
+    clients = KeyIndex(table.conns)
+    for i, conn in enumerate(conns):
+        pid = table.intern(f"player{i:06d}")
+        table.conns[pid] = conn.addr
+        clients.add(conn.addr, pid)
+    return table, clients
+
+
+def udp_dicts(conns):
+    """server_udp's previous layout: addr -> name and name -> points."""
+    clients, scores = {}, {}
+    for i, conn in enumerate(conns):
+        name = f"player{i:06d}"
+        clients[conn.addr] = name
+        scores[name] = 0
+    return clients, scores
+
+
+class DictProtocol(asyncio.Protocol):
+    pass
+
+
+def protocols(conns, cls=QuizProtocol):
+    """One joined player's protocol object per connection, attributes as after a join."""
+    out = []
+    for i, conn in enumerate(conns):
+        proto = cls.__new__(cls)
+        for attr in QuizProtocol.__slots__:
+            setattr(proto, attr, None)
+        proto.addr, proto.pid, proto.binary, proto.dropped, proto.accepted = conn.addr, i, False, 0, 1.0
+        out.append(proto)
+    return out
+
+
+def measure(build, conns):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build(conns)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used / len(conns)
+
+
+def answer_path_us(n_players, rounds=20000):
+    """Award + rank of one player, the server_tcp hot path, per call."""
+    table, registry, scores = tcp_table([Conn(i) for i in range(n_players)])
+    start = time.perf_counter()
+    for i in range(rounds):
+        pid = i * 7919 % n_players
+        scores.award(pid, 10)
+        scores.rank(pid)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def bench(n_players):
+    conns = [Conn(i) for i in range(n_players)]
+    result = {"players": n_players}
+    for name, build in (("tcp_table", tcp_table), ("tcp_dicts", tcp_dicts),
+                        ("udp_table", udp_table), ("udp_dicts", udp_dicts),
+                        ("conn_slots", protocols), ("conn_dict", lambda c: protocols(c, DictProtocol))):
+        result[f"{name}_bytes_per_player"] = round(measure(build, conns), 1)
+    for new, old in (("tcp_table", "tcp_dicts"), ("udp_table", "udp_dicts"), ("conn_slots", "conn_dict")):
+        result[f"{new}_saving"] = round(1 - result[f"{new}_bytes_per_player"] / result[f"{old}_bytes_per_player"], 3)
+    result["answer_path_us"] = round(answer_path_us(n_players), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-player memory of the player tables")
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    results = []
+    for n in args.players:
+        r = bench(n)
+        results.append(r)
+        print(f"{n:>7} players, B/player: TCP tables {r['tcp_table_bytes_per_player']} "
+              f"(dicts {r['tcp_dicts_bytes_per_player']}, {-r['tcp_table_saving']:+.0%}) | "
+              f"TCP connection {r['conn_slots_bytes_per_player']} "
+              f"(__dict__ {r['conn_dict_bytes_per_player']}, {-r['conn_slots_saving']:+.0%}) | "
+              f"UDP tables {r['udp_table_bytes_per_player']} "
+              f"(dicts {r['udp_dicts_bytes_per_player']}, {-r['udp_table_saving']:+.0%}) | "
+              f"award+rank {r['answer_path_us']} us")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+# quiz_bench.py
+"""
+Load generator and latency benchmark for the TCP and UDP quiz servers.
+Starts the server as a subprocess, drives N simulated players over the same
+wire format as client_tcp.py / client_udp.py, plays one full quiz and reports:
+- join throughput and join latency (connect/send join -> welcome)
+- question fan-out latency: per-player receipt of each question, measured from
+  the first player's receipt of it (the server prints no send timestamp)
+- feedback fan-out latency: per-player receipt of the feedback line, measured
+  from the moment player 0 sent the correct answer that triggered it
+- answer-to-feedback latency for the answering player
+- server CPU seconds and RSS (Linux /proc; None elsewhere)
+- TCP: the server's socket writes per player (quiz_socket_writes_total from
+  its metrics endpoint, one per coalesced send()) and host TCP segments sent
+  per player (/proc/net/snmp OutSegs, both ends of the loopback; None elsewhere)
+TCP players answer the server's heartbeat pings with pongs, so a run longer
+than its idle timeout measures a full room rather than one being reaped.
+Results are written as JSON so runs can be compared:
+
+    python bench/quiz_bench.py --protocol tcp --players 10 1000 10000 --out tcp.json
+    python bench/quiz_bench.py --protocol tcp --players 1000 --baseline tcp.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TCP_DIR = os.path.join(ROOT, "tcp_quiz")
+UDP_DIR = os.path.join(ROOT, "udp_quiz")
+sys.path.insert(0, ROOT)
+from quiz_common.questions import QuestionBank, answer_letter
+HOST = "127.0.0.1"
+PORT = 8888
+METRICS_PORT = 9898  # the TCP server's metrics endpoint during a run
+DELIM = b"\n"
+
+
+def percentiles(samples):
+    """Summary in milliseconds: count, p50, p99, max."""
+    if not samples:
+        return {"count": 0, "p50": None, "p99": None, "max": None}
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))] * 1000
+    return {"count": len(s), "p50": round(pick(0.50), 3), "p99": round(pick(0.99), 3),
+            "max": round(s[-1] * 1000, 3)}
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def proc_usage(pid):
+    """(cpu_seconds, rss_mb, peak_rss_mb) for pid from /proc, or Nones."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        rss = peak = None
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+        return cpu, rss, peak
+    except (OSError, ValueError, IndexError):
+        return None, None, None
+
+
+def tcp_segments_sent():
+    """Host-wide TCP segments sent so far (Linux /proc/net/snmp OutSegs), or None."""
+    try:
+        with open("/proc/net/snmp") as f:
+            rows = [line.split() for line in f if line.startswith("Tcp:")]
+        return int(rows[1][rows[0].index("OutSegs")])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def scrape(port, name):
+    """Value of an unlabelled metric from a server's Prometheus endpoint, or None."""
+    try:
+        with urllib.request.urlopen(f"http://{HOST}:{port}/metrics", timeout=5) as resp:
+            text = resp.read().decode()
+    except OSError:
+        return None
+    for line in text.splitlines():
+        metric, _, value = line.partition(" ")
+        if metric == name:
+            return float(value)
+    return None
+
+
+class ServerProcess:
+    """Run a quiz server as a subprocess and feed host commands to its stdin."""
+
+    def __init__(self, protocol, port, log_path=None, extra_args=()):
+        self.protocol = protocol
+        # a fresh score journal per run, so no run resumes or inherits scores from another, and
+        # its analytics next to it, out of the source tree
+        self.tmp = tempfile.TemporaryDirectory(prefix="quiz_bench_")
+        journal = os.path.join(self.tmp.name, "scores.journal")
+        analytics = os.path.join(self.tmp.name, "analytics")
+        env = dict(os.environ, QUIZ_JOURNAL=journal, QUIZ_ANALYTICS=analytics)
+        if protocol == "tcp":
+            cmd = [sys.executable, "server_tcp.py", "--port", str(port), "--journal", journal,
+                   "--analytics", analytics, "--metrics-port", str(METRICS_PORT), *extra_args]
+            cwd = TCP_DIR
+        else:
+            cmd = [sys.executable, "server_udp.py", *extra_args]
+            cwd = UDP_DIR
+        self.log = open(log_path, "a") if log_path else subprocess.DEVNULL
+        self.proc = subprocess.Popen(cmd, cwd=cwd, stdin=subprocess.PIPE, stdout=self.log,
+                                     stderr=subprocess.STDOUT, text=True, env=env)
+
+    def command(self, line):
+        self.proc.stdin.write(line + "\n")
+        self.proc.stdin.flush()
+
+    def usage(self):
+        return proc_usage(self.proc.pid)
+
+    def stop(self):
+        try:
+            self.command("quit" if self.protocol == "tcp" else "")
+            self.proc.stdin.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        if self.log is not subprocess.DEVNULL:
+            self.log.close()
+        self.tmp.cleanup()
+
+
+async def wait_for_tcp(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, w = await asyncio.open_connection(HOST, port)
+            w.close()
+            return True
+        except OSError:
+            await asyncio.sleep(0.1)
+    return False
+
+
+class Run:
+    """Timestamps collected during one benchmark run (all time.monotonic())."""
+
+    def __init__(self, n_players, n_questions):
+        self.n = n_players
+        self.join_latency = []
+        self.join_failed = 0
+        self.joined = 0
+        self.all_joined = asyncio.Event()
+        self.question_recv = [[] for _ in range(n_questions)]
+        self.feedback_recv = [[] for _ in range(n_questions)]
+        self.answer_sent = [None] * n_questions
+        self.answer_to_feedback = []
+        self.finished = 0
+        self.all_finished = asyncio.Event()
+
+    def mark_joined(self, latency):
+        self.join_latency.append(latency)
+        self.joined += 1
+        if self.joined + self.join_failed >= self.n:
+            self.all_joined.set()
+
+    def mark_failed(self):
+        self.join_failed += 1
+        if self.joined + self.join_failed >= self.n:
+            self.all_joined.set()
+
+    def mark_finished(self):
+        self.finished += 1
+        if self.finished >= self.joined:
+            self.all_finished.set()
+
+
+# --- TCP players --------------------------------------------------------------
+
+async def tcp_player(i, run, answers, port, connect_sem):
+    async with connect_sem:
+        try:
+            reader, writer = await asyncio.open_connection(HOST, port)
+            start = time.monotonic()
+            writer.write(f"join:bench{i}".encode() + DELIM)
+            line = await asyncio.wait_for(reader.readline(), 30)
+        except (OSError, asyncio.TimeoutError):
+            run.mark_failed()
+            return
+    if not line.startswith(b"welcome:"):
+        run.mark_failed()
+        writer.close()
+        return
+    run.mark_joined(time.monotonic() - start)
+    qi = -1
+    try:
+        while True:
+            line = await reader.readline()
+            now = time.monotonic()
+            if not line:
+                break
+            if line.startswith(b"question:"):
+                qi += 1
+                if qi < len(run.question_recv):
+                    run.question_recv[qi].append(now)
+                if i == 0 and qi < len(run.answer_sent):
+                    run.answer_sent[qi] = time.monotonic()
+                    text = line[len(b"question:"):].split(b"|", 1)[0].decode()
+                    writer.write(f"answer:{answers.get(text, '')}".encode() + DELIM)
+            elif line.startswith(b"feedback:") and 0 <= qi < len(run.feedback_recv):
+                run.feedback_recv[qi].append(now)
+                if i == 0 and run.answer_sent[qi] is not None:
+                    run.answer_to_feedback.append(now - run.answer_sent[qi])
+            elif line.startswith(b"ping:"):
+                writer.write(b"pong:" + line[len(b"ping:"):].rstrip(DELIM) + DELIM)  # stay clear of the reaper
+            elif line.startswith(b"quiz_over:"):
+                break
+    finally:
+        run.mark_finished()
+        writer.close()
+
+
+def bank_answers(path, key, answer):
+    """Map question key -> answer for every question in a bank (benchmarks use small banks)."""
+    bank = QuestionBank(path)
+    questions = [bank.get(i) for i in range(len(bank))]
+    return {key(q): answer(q) for q in questions}
+
+
+def tcp_answers(path=os.path.join(TCP_DIR, "questions.txt")):
+    return bank_answers(path, lambda q: q["q"], lambda q: q["a"])
+
+
+def udp_answers(path=os.path.join(UDP_DIR, "questions.jsonl")):
+    return bank_answers(path, lambda q: q["id"], answer_letter)
+
+
+# --- UDP players --------------------------------------------------------------
+
+class UdpPlayer(asyncio.DatagramProtocol):
+    def __init__(self, i, run, answers):
+        self.i = i
+        self.run = run
+        self.answers = answers
+        self.qi = -1
+        self.start = None
+        self.joined = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.start = time.monotonic()
+        transport.sendto(f"join:bench{self.i}".encode())
+
+    def datagram_received(self, data, addr):
+        now = time.monotonic()
+        run = self.run
+        if data.startswith(b"Welcome") and not self.joined:
+            self.joined = True
+            run.mark_joined(now - self.start)
+        elif data.startswith(b"question"):
+            self.qi += 1
+            if self.qi < len(run.question_recv):
+                run.question_recv[self.qi].append(now)
+            if self.i == 0 and self.qi < len(run.answer_sent):
+                run.answer_sent[self.qi] = time.monotonic()
+                qid = data.split(b":", 1)[0][len(b"question "):].decode()
+                self.transport.sendto(f"answer:{self.answers.get(qid, '')}".encode())
+        elif data.startswith(b"broadcast:") and b"Game over" in data:
+            run.mark_finished()
+        elif data.startswith(b"broadcast:") and 0 <= self.qi < len(run.feedback_recv) \
+                and (b"answered correctly" in data or b"Correct answer" in data):
+            run.feedback_recv[self.qi].append(now)
+            if self.i == 0 and run.answer_sent[self.qi] is not None:
+                run.answer_to_feedback.append(now - run.answer_sent[self.qi])
+
+
+# --- one run ------------------------------------------------------------------
+
+async def bench_once(protocol, n_players, port, connect_concurrency, timeout, log_path, server_args):
+    answers = tcp_answers() if protocol == "tcp" else udp_answers()
+    run = Run(n_players, len(answers))
+    server = ServerProcess(protocol, port, log_path, server_args)
+    loop = asyncio.get_running_loop()
+    transports = []
+    tasks = []
+    try:
+        if protocol == "tcp":
+            if not await wait_for_tcp(port):
+                raise RuntimeError("server did not start")
+        else:
+            await asyncio.sleep(1.0)
+        cpu0, _, _ = server.usage()
+        segments0 = tcp_segments_sent()
+        join_start = time.monotonic()
+        if protocol == "tcp":
+            sem = asyncio.Semaphore(connect_concurrency)
+            tasks = [asyncio.create_task(tcp_player(i, run, answers, port, sem)) for i in range(n_players)]
+        else:
+            for i in range(n_players):
+                tr, _ = await loop.create_datagram_endpoint(
+                    lambda i=i: UdpPlayer(i, run, answers), remote_addr=(HOST, PORT))
+                transports.append(tr)
+                if i % connect_concurrency == 0:
+                    await asyncio.sleep(0)
+        try:
+            await asyncio.wait_for(run.all_joined.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        join_elapsed = time.monotonic() - join_start
+        _, rss_joined, _ = server.usage()
+
+        server.command("start" if protocol == "tcp" else "")
+        try:
+            await asyncio.wait_for(run.all_finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        cpu1, rss_end, peak = server.usage()
+        wall = time.monotonic() - join_start
+        segments1 = tcp_segments_sent()
+        writes = scrape(METRICS_PORT, "quiz_socket_writes_total") if protocol == "tcp" else None
+    finally:
+        for t in tasks:
+            t.cancel()
+        for tr in transports:
+            tr.close()
+        server.stop()
+
+    question_lat, feedback_lat = [], []
+    for recvs in run.question_recv:
+        if recvs:
+            first = min(recvs)
+            question_lat.extend(t - first for t in recvs)
+    for qi, recvs in enumerate(run.feedback_recv):
+        if run.answer_sent[qi] is not None:
+            feedback_lat.extend(t - run.answer_sent[qi] for t in recvs)
+    expected = run.joined * len(answers)
+    cpu = None if cpu0 is None or cpu1 is None else round(cpu1 - cpu0, 3)
+    per_player = lambda total: round(total / run.joined, 2) if total is not None and run.joined else None
+    return {
+        "protocol": protocol,
+        "players": n_players,
+        "joined": run.joined,
+        "join_failed": run.join_failed + (n_players - run.joined - run.join_failed),
+        "join_seconds": round(join_elapsed, 3),
+        "joins_per_sec": round(run.joined / join_elapsed, 1) if join_elapsed else None,
+        "join_latency_ms": percentiles(run.join_latency),
+        "question_fanout_ms": percentiles(question_lat),
+        "feedback_fanout_ms": percentiles(feedback_lat),
+        "answer_to_feedback_ms": percentiles(run.answer_to_feedback),
+        "questions_missed": expected - sum(len(r) for r in run.question_recv),
+        "server": {
+            "cpu_seconds": cpu,
+            "cpu_percent": round(100 * cpu / wall, 1) if cpu is not None and wall else None,
+            "rss_mb_joined": rss_joined and round(rss_joined, 1),
+            "rss_mb_end": rss_end and round(rss_end, 1),
+            "peak_rss_mb": peak and round(peak, 1),
+            "socket_writes_per_player": per_player(writes),
+            "tcp_segments_per_player": per_player(None if protocol != "tcp" or segments0 is None or segments1 is None
+                                                  else segments1 - segments0),
+        },
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print p99/CPU ratios against a baseline file; returns the list of regressions."""
+    base = {(r["protocol"], r["players"]): r for r in baseline.get("runs", [])}
+    regressions = []
+    for r in results:
+        b = base.get((r["protocol"], r["players"]))
+        if b is None:
+            continue
+        for key in ("join_latency_ms", "question_fanout_ms", "feedback_fanout_ms", "answer_to_feedback_ms"):
+            new, old = r[key]["p99"], b[key]["p99"]
+            if new is None or not old:
+                continue
+            ratio = new / old
+            flag = "REGRESSION" if ratio > tolerance else "ok"
+            print(f"{r['protocol']} n={r['players']:<6} {key:<24} p99 {old:9.3f} -> {new:9.3f} ms  x{ratio:.2f}  {flag}")
+            if ratio > tolerance:
+                regressions.append((r["protocol"], r["players"], key, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quiz server load generator / latency benchmark")
+    parser.add_argument("--protocol", choices=["tcp", "udp"], default="tcp")
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--port", type=int, default=PORT, help="TCP server port (the UDP server is fixed)")
+    parser.add_argument("--connect-concurrency", type=int, default=256,
+                        help="TCP connects in flight at once (UDP: joins sent per loop pass)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for joins / quiz end")
+    parser.add_argument("--server-log", help="append server stdout here instead of discarding it")
+    parser.add_argument("--server-arg", action="append", default=[], help="extra argument for the server")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against a previous results JSON")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="p99 ratio counted as a regression")
+    args = parser.parse_args()
+
+    fd_limit = raise_fd_limit()
+    results = []
+    for n in args.players:
+        if n + 64 > fd_limit:
+            print(f"⚠ {n} players needs more than the fd limit ({fd_limit}); results will show failed joins")
+        print(f"▶ {args.protocol} with {n} players ...")
+        r = asyncio.run(bench_once(args.protocol, n, args.port, args.connect_concurrency,
+                                   args.timeout, args.server_log, args.server_arg))
+        results.append(r)
+        print(f"  joined {r['joined']}/{n} ({r['joins_per_sec']}/s)  "
+              f"question fan-out p99 {r['question_fanout_ms']['p99']} ms  "
+              f"feedback fan-out p99 {r['feedback_fanout_ms']['p99']} ms  "
+              f"server cpu {r['server']['cpu_seconds']} s, rss {r['server']['rss_mb_end']} MB"
+              + (f", {r['server']['socket_writes_per_player']} writes and "
+                 f"{r['server']['tcp_segments_per_player']} TCP segments per player" if args.protocol == "tcp" else ""))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpus": os.cpu_count(), "hostname": socket.gethostname()},
+        "runs": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Saved results to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
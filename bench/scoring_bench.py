@@ -0,0 +1,109 @@
+# scoring_bench.py
+"""
+Close-of-question cost of speed scoring (quiz_common/scoring.py) as the
+number of answers grows: scoring the batch (NumPy and pure Python), then
+applying the awards to server_tcp's RankedScores with award_many() against
+one award() per player, and everyone's rank with ranks() against rank().
+Every player answers; a quarter of them correctly.
+
+    python bench/scoring_bench.py --answers 1000 10000 50000 --out scoring.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tcp_quiz"))
+sys.path.insert(0, ROOT)
+from leaderboard import RankedScores
+from quiz_common import scoring
+from quiz_common.players import PlayerTable
+
+POINTS = 10
+QUESTION_TIME = 20
+
+
+def fill(batch, n, rng):
+    batch.open(4, 0, 0.0)
+    for pid in range(n):
+        batch.add(pid, rng.randrange(4), rng.uniform(0, QUESTION_TIME))
+
+
+def close_ms(n, vectorized, rounds):
+    """Median batch.close() time over rounds questions."""
+    rng = random.Random(1)
+    batch = scoring.AnswerBatch(POINTS, QUESTION_TIME, vectorized=vectorized)
+    times = []
+    for _ in range(rounds):
+        fill(batch, n, rng)
+        start = time.perf_counter()
+        batch.close()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def ranked(n):
+    table = PlayerTable()
+    scores = RankedScores(table.points)
+    for i in range(n):
+        scores.add(table.intern(f"player{i:06d}"))
+    return table, scores
+
+
+def award_ms(n, rounds):
+    """Median time to apply one question's awards and compute every player's rank:
+    (award_many + ranks, award loop + rank loop)."""
+    rng = random.Random(1)
+    batch = scoring.AnswerBatch(POINTS, QUESTION_TIME, vectorized=False)
+    (table, fast), (_, slow) = ranked(n), ranked(n)
+    batched, looped = [], []
+    for _ in range(rounds):
+        fill(batch, n, rng)
+        awards = batch.close().awards
+        start = time.perf_counter()
+        fast.award_many(awards)
+        ranks = fast.ranks()
+        [ranks[table.points[pid]] for pid in range(n)]
+        batched.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for pid, points in awards:
+            slow.award(pid, points)
+        [slow.rank(pid) for pid in range(n)]
+        looped.append(time.perf_counter() - start)
+    return tuple(sorted(t)[len(t) // 2] * 1000 for t in (batched, looped))
+
+
+def bench(n, rounds):
+    result = {"answers": n, "python_close_ms": round(close_ms(n, False, rounds), 3)}
+    if scoring.numpy is not None:
+        result["numpy_close_ms"] = round(close_ms(n, True, rounds), 3)
+    result["award_many_ms"], result["award_loop_ms"] = (round(t, 3) for t in award_ms(n, rounds))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Close-of-question cost of speed scoring")
+    parser.add_argument("--answers", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--rounds", type=int, default=5, help="questions per size (median reported)")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    if scoring.numpy is None:
+        print("ℹ️ NumPy not installed: pure-Python scoring only")
+    results = []
+    for n in args.answers:
+        r = bench(n, args.rounds)
+        results.append(r)
+        numpy_ms = f"{r['numpy_close_ms']} ms" if "numpy_close_ms" in r else "-"
+        print(f"{n:>7} answers: score python {r['python_close_ms']} ms, numpy {numpy_ms} | "
+              f"awards+ranks batched {r['award_many_ms']} ms, per player {r['award_loop_ms']} ms")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# wire_bench.py
+"""
+Encode/parse cost of the text and binary TCP protocols (tcp_quiz/wire.py) on
+leaderboard frames of growing size.
+
+    python bench/wire_bench.py --entries 10 1000 10000 --out wire.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tcp_quiz"))
+import wire
+
+
+def best_of(fn, number, repeat=5):
+    """Best per-call time in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def bench(n_entries):
+    entries = [(f"player{i:06d}", (n_entries - i) * 10) for i in range(n_entries)]
+    text = wire.encode_text("leaderboard_top", entries)
+    binary = wire.encode_binary("leaderboard_top", entries)
+    line = text.decode().rstrip("\n")
+    number = max(1, 20000 // n_entries)
+
+    def parse_binary():
+        return wire.FrameDecoder().feed(binary)
+
+    assert wire.decode_text(line)[1][0] == parse_binary()[0][1][0] == entries
+    result = {
+        "entries": n_entries,
+        "text_bytes": len(text),
+        "binary_bytes": len(binary),
+        "text_encode_us": best_of(lambda: wire.encode_text("leaderboard_top", entries), number),
+        "binary_encode_us": best_of(lambda: wire.encode_binary("leaderboard_top", entries), number),
+        "text_parse_us": best_of(lambda: wire.decode_text(line), number),
+        "binary_parse_us": best_of(parse_binary, number),
+    }
+    for key in ("encode", "parse"):
+        result[f"{key}_speedup"] = round(result[f"text_{key}_us"] / result[f"binary_{key}_us"], 2)
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in result.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text vs binary wire protocol micro-benchmark")
+    parser.add_argument("--entries", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    results = []
+    for n in args.entries:
+        r = bench(n)
+        results.append(r)
+        print(f"{n:>6} entries: {r['text_bytes']:>8} B text / {r['binary_bytes']:>8} B binary | "
+              f"encode {r['text_encode_us']:>9.1f} / {r['binary_encode_us']:>9.1f} us (x{r['encode_speedup']}) | "
+              f"parse {r['text_parse_us']:>9.1f} / {r['binary_parse_us']:>9.1f} us (x{r['parse_speedup']})")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"runs": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Code shared by the TCP and UDP quiz servers."""
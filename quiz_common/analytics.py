@@ -0,0 +1,219 @@
+# analytics.py
+"""
+Per-question analytics for the quiz servers, collected as answers arrive:
+answers per option, correctness rate and response-time quantiles (time from
+the question opening to the answer being read).
+Response times go into a QuantileSketch, a log-bucketed sketch (DDSketch):
+a value x is counted in bucket ceil(log_gamma(x)) with
+gamma = (1 + a) / (1 - a), so any quantile it reports is within a relative
+error a (RELATIVE_ACCURACY) of the exact one. It keeps at most MAX_BUCKETS
+counters however many answers arrive (1 ms .. 60 s needs about 550 at 1%),
+and never stores the answers themselves. A player's first answer to a
+question is the one that counts.
+At quiz_over the servers write the game's rows with export() as
+<name>.json and <name>.csv; table() is the console view. Single-threaded:
+use it from the thread that handles answers.
+"""
+
+import csv
+import json
+import math
+import os
+
+RELATIVE_ACCURACY = 0.01
+MAX_BUCKETS = 2048  # beyond this the lowest buckets are merged (only the smallest quantiles lose accuracy)
+MIN_VALUE = 1e-6  # seconds; smaller response times are counted as 0
+QUANTILES = (0.5, 0.9, 0.99)
+CSV_FIELDS = ("question", "text", "answers", "correct", "correct_rate",
+              "p50_ms", "p90_ms", "p99_ms", "max_ms", "options", "other")
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, max_buckets=MAX_BUCKETS, min_value=MIN_VALUE):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.buckets = {}  # bucket index -> count
+        self.zeros = 0  # values <= min_value
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= self.min_value:
+            self.zeros += 1
+            return
+        i = math.ceil(math.log(value) / self._log_gamma)
+        buckets = self.buckets
+        buckets[i] = buckets.get(i, 0) + 1
+        if len(buckets) > self.max_buckets:
+            lowest = min(buckets)
+            n = buckets.pop(lowest)
+            buckets[min(buckets)] += n
+
+    def merge(self, other):
+        """Add another sketch's counts (same relative accuracy), e.g. from another worker."""
+        for i, n in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + n
+        while len(self.buckets) > self.max_buckets:
+            n = self.buckets.pop(min(self.buckets))
+            self.buckets[min(self.buckets)] += n
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimate of the q-quantile (the value at rank q * (count - 1) in sorted order)."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if seen > rank:
+            return max(self.min, 0.0)
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen > rank:
+                value = 2 * self.gamma ** i / (self.gamma + 1)  # midpoint (in relative error) of the bucket
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def snapshot(self):
+        return {"buckets": list(self.buckets.items()), "zeros": self.zeros, "count": self.count,
+                "sum": self.sum, "min": self.min if self.count else None, "max": self.max if self.count else None}
+
+    def restore(self, snap):
+        self.buckets = dict(snap["buckets"])
+        self.zeros, self.count, self.sum = snap["zeros"], snap["count"], snap["sum"]
+        if self.count:
+            self.min, self.max = snap["min"], snap["max"]
+
+    def __len__(self):
+        return self.count
+
+
+class QuestionStats:
+    """One question's answers per option, correct count and response-time sketch."""
+
+    def __init__(self, qid, text, options, correct):
+        self.qid = qid
+        self.text = text
+        self.options = list(options)
+        self.correct = correct  # index of the right option, -1 if it is not among them
+        self.counts = [0] * len(self.options)
+        self.other = 0  # answers that are not one of the options
+        self.right = 0
+        self.times = QuantileSketch()
+
+    def add(self, option, elapsed):
+        if 0 <= option < len(self.counts):
+            self.counts[option] += 1
+            if option == self.correct:
+                self.right += 1
+        else:
+            self.other += 1
+        self.times.add(elapsed)
+
+    def snapshot(self):
+        return {"qid": self.qid, "text": self.text, "options": self.options, "correct": self.correct,
+                "counts": self.counts, "other": self.other, "right": self.right, "times": self.times.snapshot()}
+
+    @classmethod
+    def restored(cls, snap):
+        stats = cls(snap["qid"], snap["text"], snap["options"], snap["correct"])
+        stats.counts, stats.other, stats.right = snap["counts"], snap["other"], snap["right"]
+        stats.times.restore(snap["times"])
+        return stats
+
+    def row(self):
+        answers = len(self.times)
+        row = {"question": self.qid, "text": self.text, "answers": answers, "correct": self.right,
+               "correct_rate": round(self.right / answers, 4) if answers else 0.0}
+        for q in QUANTILES:
+            row[f"p{round(q * 100)}_ms"] = round(self.times.quantile(q) * 1000, 3)
+        row["max_ms"] = round(self.times.max * 1000, 3) if answers else 0.0
+        row["options"] = dict(zip(self.options, self.counts))
+        row["other"] = self.other
+        return row
+
+
+class GameAnalytics:
+    """QuestionStats for every question of one game, in the order they were asked."""
+
+    def __init__(self):
+        self.questions = []
+        self.current = None
+        self.opened = 0.0
+        self._answered = bytearray()  # player id -> 1 once it answered the open question
+
+    def open(self, qid, text, options, correct, opened):
+        """A question opened at perf_counter() time `opened`."""
+        self.current = QuestionStats(qid, text, options, correct)
+        self.questions.append(self.current)
+        self.opened = opened
+        self._answered = bytearray(len(self._answered))
+
+    def answer(self, pid, option, received):
+        """Player pid's answer (option index, -1 for none) read at perf_counter() time `received`."""
+        if self.current is None:
+            return
+        if pid >= len(self._answered):
+            self._answered.extend(bytes(pid + 1 - len(self._answered)))
+        if self._answered[pid]:
+            return
+        self._answered[pid] = 1
+        self.current.add(option, max(received - self.opened, 0.0))
+
+    def close(self):
+        self.current = None
+
+    def snapshot(self):
+        """JSON-able state, including the open question and who has answered it (server handoff)."""
+        return {"questions": [stats.snapshot() for stats in self.questions],
+                "open": self.current is not None, "opened": self.opened,
+                "answered": [pid for pid, done in enumerate(self._answered) if done]}
+
+    def restore(self, snap):
+        self.questions = [QuestionStats.restored(q) for q in snap["questions"]]
+        self.current = self.questions[-1] if snap["open"] else None
+        self.opened = snap["opened"]
+        self._answered = bytearray(max(snap["answered"], default=-1) + 1)
+        for pid in snap["answered"]:
+            self._answered[pid] = 1
+
+    def rows(self):
+        return [stats.row() for stats in self.questions]
+
+    def export(self, path):
+        """Write rows() to <path>.json and <path>.csv; returns both paths."""
+        rows = self.rows()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+        with open(path + ".csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for row in rows:
+                options = ";".join(f"{option}={n}" for option, n in row["options"].items())
+                writer.writerow(dict(row, options=options))
+        return path + ".json", path + ".csv"
+
+    def table(self):
+        """Console lines, one per question."""
+        lines = []
+        for row in self.rows():
+            options = ", ".join(f"{option} {n}" for option, n in row["options"].items())
+            lines.append(f"Q{row['question']}: {row['answers']} answers, {row['correct_rate']:.0%} correct, "
+                         f"p50 {row['p50_ms']:g} ms p90 {row['p90_ms']:g} ms p99 {row['p99_ms']:g} ms | "
+                         f"{options}" + (f", other {row['other']}" if row["other"] else "")
+                         + f" | {row['text']}")
+        return lines
@@ -0,0 +1,170 @@
+# journal.py
+"""
+Append-only score journal with group commit, snapshots and crash recovery.
+Servers append small records as things happen:
+    {"seq": 12, "op": "award", "room": "main", "user": "alice", "points": 10}
+ops: join, award, awards (one question's points for many players,
+{"points": {user: points}}), game (the sampled question list), question
+(index opened), finish, reset (the host dropped the room's scores; journals
+written before it was named may say close). append() only applies the record
+to the in-memory state and queues one JSON line, so it costs microseconds on
+the answer path.
+A writer thread wakes every flush_interval and writes everything queued with one
+write() and one fsync() (group commit). After snapshot_every records it also
+writes the whole state to <journal>.snap (temp file, fsync, rename) and
+truncates the journal. Recovery loads the snapshot, replays the journal records
+with a higher seq and stops at a torn last line. The result is
+    state = {room: {"scores": {user: points}, "questions": [qid, ...] or None, "position": i}}
+so a restarted server can restore scores, give a returning player their points
+back and resume a game at the question it was on.
+"""
+
+import json
+import os
+import threading
+
+FLUSH_INTERVAL = 0.05  # seconds between group commits
+SNAPSHOT_EVERY = 10000  # records between snapshots
+
+
+def new_room():
+    return {"scores": {}, "questions": None, "position": 0}
+
+
+def apply(state, rec):
+    """Fold one journal record into state."""
+    op = rec["op"]
+    if op in ("reset", "close"):
+        state.pop(rec["room"], None)
+        return
+    room = state.setdefault(rec["room"], new_room())
+    if op == "join":
+        room["scores"].setdefault(rec["user"], 0)
+    elif op == "award":
+        room["scores"][rec["user"]] = room["scores"].get(rec["user"], 0) + rec["points"]
+    elif op == "awards":
+        scores = room["scores"]
+        for user, points in rec["points"].items():
+            scores[user] = scores.get(user, 0) + points
+    elif op == "game":
+        room["questions"] = rec["questions"]
+        room["position"] = 0
+    elif op == "question":
+        room["position"] = rec["index"]
+    elif op == "finish":
+        room["questions"] = None
+        room["position"] = 0
+
+
+def recover(path):
+    """(state, last seq) from <path>.snap plus the journal records after it."""
+    state, seq = {}, 0
+    try:
+        with open(path + ".snap") as f:
+            snap = json.load(f)
+        state, seq = snap["state"], snap["seq"]
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # torn write at the tail: everything after it is lost anyway
+                if rec["seq"] > seq:
+                    apply(state, rec)
+                    seq = rec["seq"]
+    except OSError:
+        pass
+    return state, seq
+
+
+class Journal:
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, snapshot_every=SNAPSHOT_EVERY, fsync=True):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.state, self.seq = recover(path)
+        self.commits = 0  # group commits written
+        self._pending = []
+        self._since_snapshot = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()  # one flush writes at a time
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._file = open(path, "ab")
+        self._writer = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._writer.start()
+
+    def room(self, name):
+        """Copy of a room's recovered/current state, or None."""
+        with self._lock:
+            room = self.state.get(name)
+            if room is None:
+                return None
+            questions = room["questions"]
+            return {"scores": dict(room["scores"]), "position": room["position"],
+                    "questions": list(questions) if questions is not None else None}
+
+    def append(self, op, room, **fields):
+        with self._lock:
+            self.seq += 1
+            rec = {"seq": self.seq, "op": op, "room": room, **fields}
+            apply(self.state, rec)
+            self._pending.append(json.dumps(rec, ensure_ascii=False))
+            self._since_snapshot += 1
+            if len(self._pending) == 1:
+                self._wake.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._wake.wait_for(lambda: self._pending or self._closed)
+                # let a burst of appends collect into one commit
+                self._wake.wait_for(lambda: self._closed, self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """Write and fsync everything appended so far (and snapshot if due)."""
+        with self._io_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            lines, self._pending = self._pending, []
+            snap = None
+            if self._since_snapshot >= self.snapshot_every:
+                snap = json.dumps({"seq": self.seq, "state": self.state}, ensure_ascii=False)
+                self._since_snapshot = 0
+        if lines:
+            self._file.write(("\n".join(lines) + "\n").encode())
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.commits += 1
+        if snap is not None:
+            self._write_snapshot(snap)
+
+    def _write_snapshot(self, snap):
+        tmp = self.path + ".snap.tmp"
+        with open(tmp, "w") as f:
+            f.write(snap)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.path + ".snap")
+        # records up to the snapshot's seq are skipped on replay, so a crash before or
+        # after this truncate recovers the same state
+        self._file.truncate(0)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        self._writer.join()
+        self._file.close()
@@ -0,0 +1,173 @@
+# metrics.py
+"""
+Counters, gauges and histograms for the quiz servers.
+A Registry renders its metrics as Prometheus text (serve() exposes it over HTTP
+on a local port) and as a short human summary for the host console `stats`
+command. Updates take a per-metric lock, so they are safe from any thread.
+"""
+
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; fits sub-millisecond socket work up to multi-second waits
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _labels(labelname, value):
+    return f'{{{labelname}="{value}"}}' if labelname else ""
+
+
+class Counter:
+    def __init__(self, name, help, labelname=None):
+        self.name = name
+        self.help = help
+        self.labelname = labelname
+        self.values = {}  # label value (None without a label) -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, label=None):
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def total(self):
+        return sum(self.values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label, value in sorted(self.values.items(), key=lambda kv: str(kv[0])):
+            lines.append(f"{self.name}{_labels(self.labelname, label)} {value}")
+        if not self.values:
+            lines.append(f"{self.name} 0")
+        return lines
+
+
+class Gauge:
+    """A value that is set, or read from fn() at render time."""
+
+    def __init__(self, name, help, fn=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.get()}"]
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {seen}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelname=None):
+        return self._add(Counter(name, help, labelname))
+
+    def gauge(self, name, help, fn=None):
+        return self._add(Gauge(name, help, fn))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Short console summary, one metric per line."""
+        lines = []
+        for m in self.metrics:
+            if isinstance(m, Histogram):
+                avg = m.sum / m.count if m.count else 0.0
+                lines.append(f"{m.name}: n={m.count} avg={avg * 1000:.3f}ms "
+                             f"p50<={m.quantile(0.5) * 1000:g}ms p99<={m.quantile(0.99) * 1000:g}ms "
+                             f"max={m.max * 1000:.3f}ms")
+            elif isinstance(m, Counter) and m.labelname:
+                parts = ", ".join(f"{k}={v}" for k, v in sorted(m.values.items(), key=lambda kv: str(kv[0])))
+                lines.append(f"{m.name}: {m.total()} ({parts})" if parts else f"{m.name}: 0")
+            elif isinstance(m, Counter):
+                lines.append(f"{m.name}: {m.total()}")
+            else:
+                lines.append(f"{m.name}: {m.get()}")
+        return "\n".join(lines)
+
+
+def serve(registry, host="127.0.0.1", port=9100):
+    """Serve registry.render() at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,132 @@
+# players.py
+"""
+Compact player table for the quiz servers.
+A player is a small int id handed out by intern(name). The id indexes flat
+columns: points (an array of machine ints) and conns (whatever the server
+keeps per player, a connection or an address; None while the player is away).
+Each name string is stored once, in names[id], and the servers' answer,
+scoring and broadcast paths carry ids instead of name keys. A name always maps
+to the same id, so one name has exactly one score, and a player who leaves
+keeps their points in the column for when they come back.
+Names are found through a KeyIndex over the names column rather than a dict:
+a dict would hold an int object per id on top of its entry, which at 100k
+players costs more than the columns it indexes. A server can index another
+column the same way (server_udp looks players up by address in conns).
+Ids are never reused; a table lives as long as its room (or server).
+"""
+
+from array import array
+
+FREE, GONE = -1, -2  # KeyIndex slots that hold no id: never used, or removed
+
+
+class KeyIndex:
+    """Hash index key -> id over a column that holds each id's key (None: not indexed).
+    Open addressing with linear probing in an array of machine ints, so an entry costs a
+    few bytes and no Python objects; keys are compared against the column. Reads may run
+    in another thread than writes: a resize swaps in a fully built slot array."""
+
+    def __init__(self, keys):
+        self.keys = keys  # id -> key, the column this indexes
+        self.slots = array("i", [FREE]) * 8
+        self.filled = 0  # slots that are not FREE
+        self.live = 0
+
+    def get(self, key):
+        """Id indexed under key, or None."""
+        slots, keys = self.slots, self.keys
+        mask = len(slots) - 1
+        i = hash(key) & mask
+        while True:
+            pid = slots[i]
+            if pid == FREE:
+                return None
+            if pid >= 0 and keys[pid] == key:
+                return pid
+            i = (i + 1) & mask
+
+    def add(self, key, pid):
+        """Index pid under key; keys[pid] must already be key and key not indexed yet."""
+        if (self.filled + 1) * 3 > len(self.slots) * 2:
+            self._resize()
+        slots = self.slots
+        mask = len(slots) - 1
+        i = hash(key) & mask
+        while slots[i] >= 0:
+            i = (i + 1) & mask
+        if slots[i] == FREE:
+            self.filled += 1
+        slots[i] = pid
+        self.live += 1
+
+    def remove(self, key):
+        """Stop indexing key; returns its id, or None if it was not indexed."""
+        slots, keys = self.slots, self.keys
+        mask = len(slots) - 1
+        i = hash(key) & mask
+        while True:
+            pid = slots[i]
+            if pid == FREE:
+                return None
+            if pid >= 0 and keys[pid] == key:
+                slots[i] = GONE
+                self.live -= 1
+                return pid
+            i = (i + 1) & mask
+
+    def _resize(self):
+        """Rebuild at a load of at most a half, dropping the GONE slots."""
+        size = 8
+        while size < (self.live + 1) * 2:
+            size *= 2
+        slots = array("i", [FREE]) * size
+        mask = size - 1
+        keys = self.keys
+        for pid in self.slots:
+            if pid >= 0:
+                i = hash(keys[pid]) & mask
+                while slots[i] != FREE:
+                    i = (i + 1) & mask
+                slots[i] = pid
+        self.slots = slots
+        self.filled = self.live
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        """The indexed keys, in id order."""
+        return (key for key in self.keys if key is not None)
+
+    def __len__(self):
+        return self.live
+
+
+class PlayerTable:
+    def __init__(self):
+        self.names = []  # id -> name
+        self.ids = KeyIndex(self.names)  # name -> id (the intern table)
+        self.points = array("q")  # id -> score
+        self.conns = []  # id -> connection or address, None while away
+
+    def intern(self, name, points=0):
+        """Id of name, adding the player with points if the name is new."""
+        pid = self.ids.get(name)
+        if pid is None:
+            pid = len(self.names)
+            self.names.append(name)
+            self.points.append(points)
+            self.conns.append(None)
+            self.ids.add(name, pid)
+        return pid
+
+    def get(self, name):
+        """Id of name, or None."""
+        return self.ids.get(name)
+
+    def scores(self):
+        """{name: points} for every player, present or away."""
+        return dict(zip(self.names, self.points))
+
+    def __len__(self):
+        return len(self.names)
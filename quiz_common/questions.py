@@ -0,0 +1,181 @@
+# questions.py
+"""
+Indexed question bank shared by the TCP and UDP servers.
+A bank is a JSON-lines file, one question per line:
+    {"id": "1", "category": "geo", "q": "Capital of France?", "options": ["Paris", "Rome"], "a": "Paris"}
+Beside it a compact binary index (<bank>.idx) records the byte offset and length
+of every line, grouped by category. The index is built once (the only time the
+whole bank is parsed) and rebuilt when the bank's size or mtime changes. Both
+files are memory-mapped, so opening a bank of hundreds of thousands of
+questions parses nothing and sampling only decodes the questions it returns.
+Pre-encoded `question` frames for each server are cached per question.
+
+    python -m quiz_common.questions convert old_questions.json bank.jsonl
+    python -m quiz_common.questions index bank.jsonl
+"""
+
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from functools import lru_cache
+
+MAGIC = b"QIDX1\0"
+HEADER = struct.Struct("<6sQQII")  # magic, bank size, bank mtime_ns, count, n_categories
+CATEGORY = struct.Struct("<HII")   # name length, first record, end record (name bytes follow)
+RECORD = struct.Struct("<QI")      # byte offset, length
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+FRAME_CACHE = 4096  # encoded frames kept per bank
+
+
+def normalize(raw, fallback_id=None):
+    """Question dict in bank schema from bank or legacy server_udp records
+    ('question', 'options' as 'a)x | b)y', 'correct_answer' as a letter)."""
+    if "q" in raw:
+        q = dict(raw)
+    else:
+        options = raw.get("options", [])
+        if isinstance(options, str):
+            options = [opt.strip().split(")", 1)[-1].strip() for opt in options.split("|")]
+        answer = raw.get("correct_answer", raw.get("a", ""))
+        if len(answer) == 1 and answer in LETTERS[:len(options)]:
+            answer = options[LETTERS.index(answer)]
+        q = {"q": raw.get("question", ""), "options": options, "a": answer}
+        for key in ("id", "category"):
+            if key in raw:
+                q[key] = raw[key]
+    q.setdefault("id", str(fallback_id) if fallback_id is not None else "")
+    q.setdefault("category", "")
+    return q
+
+
+def tcp_frame(q):
+    return f"question:{q['q']}|{'|'.join(q['options'])}\n".encode()
+
+
+def udp_frame(q):
+    opts = " | ".join(f"{LETTERS[i]}){opt}" for i, opt in enumerate(q["options"]))
+    return f"question {q['id']}: {q['q']}\n{opts}".encode()
+
+
+FRAMES = {"tcp": tcp_frame, "udp": udp_frame}
+
+
+def answer_letter(q):
+    """Letter of the correct option ('' if the answer is not among the options)."""
+    try:
+        return LETTERS[q["options"].index(q["a"])]
+    except ValueError:
+        return ""
+
+
+def build_index(bank_path, index_path):
+    """Scan the bank once and write its index; returns the index bytes."""
+    st = os.stat(bank_path)
+    by_category = {}
+    with open(bank_path, "rb") as f:
+        offset = 0
+        for line in f:
+            length = len(line.rstrip(b"\r\n"))
+            if line.strip():
+                category = json.loads(line).get("category", "")
+                by_category.setdefault(category, []).append((offset, length))
+            offset += len(line)
+    parts = []
+    records = []
+    for name in sorted(by_category):
+        encoded = name.encode()
+        start = len(records)
+        records.extend(by_category[name])
+        parts.append(CATEGORY.pack(len(encoded), start, len(records)) + encoded)
+    data = b"".join([HEADER.pack(MAGIC, st.st_size, st.st_mtime_ns, len(records), len(parts))]
+                    + parts + [RECORD.pack(off, length) for off, length in records])
+    try:
+        with open(index_path, "wb") as f:
+            f.write(data)
+    except OSError:
+        pass  # read-only location: keep the index in memory only
+    return data
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class QuestionBank:
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self._data = _map(path)
+        self._index = self._load_index()
+        _, _, _, self.count, n_categories = HEADER.unpack_from(self._index, 0)
+        pos = HEADER.size
+        self.categories = {}  # name -> (first record, end record)
+        for _ in range(n_categories):
+            name_len, start, end = CATEGORY.unpack_from(self._index, pos)
+            pos += CATEGORY.size
+            name = bytes(self._index[pos:pos + name_len]).decode()
+            pos += name_len
+            self.categories[name] = (start, end)
+        self._records = pos
+        self.frame = lru_cache(maxsize=FRAME_CACHE)(self._frame)
+
+    def _load_index(self):
+        st = os.stat(self.path)
+        try:
+            index = _map(self.index_path)
+            if len(index) >= HEADER.size:
+                magic, size, mtime_ns, _, _ = HEADER.unpack_from(index, 0)
+                if magic == MAGIC and size == st.st_size and mtime_ns == st.st_mtime_ns:
+                    return index
+        except OSError:
+            pass
+        return build_index(self.path, self.index_path)
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, i):
+        """Undecoded JSON bytes of question i (index order)."""
+        offset, length = RECORD.unpack_from(self._index, self._records + i * RECORD.size)
+        return self._data[offset:offset + length]
+
+    def get(self, i):
+        return normalize(json.loads(self.raw(i)), fallback_id=i + 1)
+
+    def _frame(self, i, kind):
+        return FRAMES[kind](self.get(i))
+
+    def sample(self, n, category=None, rng=random):
+        """Up to n question indexes, from one category if given. A bank (or category)
+        with no more than n questions is returned whole, in file order."""
+        start, end = self.categories.get(category, (0, 0)) if category is not None else (0, self.count)
+        if end - start <= n:
+            return sorted(range(start, end), key=lambda i: RECORD.unpack_from(
+                self._index, self._records + i * RECORD.size)[0])
+        return [start + k for k in rng.sample(range(end - start), n)]
+
+
+def convert(src, dst):
+    """Write a legacy {"questions": [...]} JSON file as a bank."""
+    with open(src) as f:
+        items = json.load(f)["questions"]
+    with open(dst, "w") as f:
+        for n, raw in enumerate(items, 1):
+            f.write(json.dumps(normalize(raw, fallback_id=n), ensure_ascii=False) + "\n")
+    return len(items)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "convert":
+        print(f"Converted {convert(sys.argv[2], sys.argv[3])} questions")
+    elif len(sys.argv) == 3 and sys.argv[1] == "index":
+        bank = QuestionBank(sys.argv[2])
+        print(f"Indexed {len(bank)} questions in {len(bank.categories)} categories")
+    else:
+        print(__doc__)
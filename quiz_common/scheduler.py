@@ -0,0 +1,82 @@
+# scheduler.py
+"""
+Monotonic-clock timer heap for quiz pacing (question deadlines, gaps, idle timeouts).
+It has the same call_at / call_later / time() / handle.cancel() surface as an
+asyncio event loop, whose own timer heap the TCP server uses directly. The
+threaded UDP server runs one Scheduler in its quiz thread and blocks on its
+message queue for exactly timeout() seconds, then calls run_due(). Nothing
+polls, and a transition fires as soon as it is due, however many games share
+the scheduler. Not thread-safe: schedule from the thread that runs it.
+"""
+
+import heapq
+import itertools
+import time
+
+
+class TimerHandle:
+    __slots__ = ("when", "seq", "callback", "args", "cancelled")
+
+    def __init__(self, when, seq, callback, args):
+        self.when = when
+        self.seq = seq
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+class Scheduler:
+    def __init__(self, clock=time.monotonic, lag=None):
+        self.clock = clock
+        self.lag = lag  # histogram observing how late each timer ran, in seconds
+        self._heap = []
+        self._seq = itertools.count()
+
+    def time(self):
+        return self.clock()
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(when, next(self._seq), callback, args)
+        heapq.heappush(self._heap, handle)
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def _drop_cancelled(self):
+        heap = self._heap
+        while heap and heap[0].cancelled:
+            heapq.heappop(heap)
+
+    def timeout(self):
+        """Seconds until the next timer is due (0 if overdue), or None when nothing is scheduled."""
+        self._drop_cancelled()
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0].when - self.clock())
+
+    def run_due(self):
+        """Run every timer that is due, in deadline order; returns how many ran."""
+        ran = 0
+        heap = self._heap
+        while True:
+            self._drop_cancelled()
+            if not heap:
+                return ran
+            now = self.clock()
+            if heap[0].when > now:
+                return ran
+            handle = heapq.heappop(heap)
+            if self.lag is not None:
+                self.lag.observe(now - handle.when)
+            handle.callback(*handle.args)
+            ran += 1
+
+    def __len__(self):
+        return sum(not handle.cancelled for handle in self._heap)
@@ -0,0 +1,154 @@
+# scoring.py
+"""
+Time-weighted scoring of every answer to a question (the servers' "speed"
+scoring mode; the default "first" mode gives POINTS to the first correct
+answer only and closes the question there).
+While a question is open, each player's first answer is appended to
+preallocated columns: player id, option index and receive time
+(time.perf_counter(), like the servers' receive stamps). At close, the whole
+batch is scored at once. A correct answer gets
+
+    floor + round((points - floor) * (1 - elapsed / time_limit))  speed: points .. floor
+    + STREAK_BONUS * min(streak, STREAK_CAP)                       correct answers in a row before it
+
+with floor = points * SPEED_FLOOR. Answers are also counted per option.
+A player's streak ends with a wrong answer or no answer.
+With NumPy installed, batches of VECTOR_MIN answers or more are scored in
+one vectorized pass over views of the same buffers (no copy). Without NumPy,
+or for smaller batches, a pure-Python loop does the same arithmetic with the
+same results (both round halves to even).
+"""
+
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:  # optional: the pure-Python path scores the same
+    numpy = None
+
+SPEED_FLOOR = 0.5  # fraction of the points a correct answer still gets at the deadline
+STREAK_BONUS = 2   # extra points per earlier correct answer in a row
+STREAK_CAP = 5     # streak length that earns the largest bonus
+VECTOR_MIN = 256   # batches at least this big go through NumPy when it is installed
+CAPACITY = 1024    # answers preallocated per question; the columns double when full
+
+# awards: [(id, points)] for the correct answers, in arrival order (fastest first);
+# counts: answers per option index; answers: players who answered
+Scored = namedtuple("Scored", "awards counts answers")
+
+
+def _zeros(typecode, n):
+    return array(typecode, bytes(n * array(typecode).itemsize))
+
+
+class AnswerBatch:
+    """One question's answers at a time, for player ids of a quiz_common PlayerTable."""
+
+    def __init__(self, points, time_limit, capacity=CAPACITY, vectorized=None):
+        self.points = points
+        self.floor = int(points * SPEED_FLOOR)
+        self.time_limit = time_limit
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+        self.pids = _zeros("q", capacity)
+        self.options = _zeros("q", capacity)  # option index, -1 for an answer that is no option
+        self.times = _zeros("d", capacity)
+        self.n = 0
+        self.answered = bytearray()  # id -> 1 once it answered the open question
+        self.streaks = array("q")  # id -> correct answers in a row
+        self.n_options = 0
+        self.correct = -1
+        self.opened = 0.0
+
+    def open(self, n_options, correct, opened):
+        """Start collecting answers to a question with n_options options (correct: the right
+        index, -1 if none is) opened at perf_counter() time `opened`."""
+        self.n = 0
+        self.answered = bytearray(len(self.answered))
+        self.n_options = n_options
+        self.correct = correct
+        self.opened = opened
+
+    def add(self, pid, option, received):
+        """Record pid's answer. Only a player's first answer counts; False for a repeat."""
+        if pid >= len(self.answered):
+            self.answered.extend(bytes(pid + 1 - len(self.answered)))
+            self.streaks.extend(_zeros("q", pid + 1 - len(self.streaks)))
+        if self.answered[pid]:
+            return False
+        self.answered[pid] = 1
+        n = self.n
+        if n == len(self.pids):
+            for column in (self.pids, self.options, self.times):
+                column.extend(column)
+        self.pids[n] = pid
+        self.options[n] = option if 0 <= option < self.n_options else -1
+        self.times[n] = received
+        self.n = n + 1
+        return True
+
+    def has_answered(self, pid):
+        """True once pid answered the open question."""
+        return pid < len(self.answered) and self.answered[pid] == 1
+
+    def close(self):
+        """Score the collected answers and update the streaks; returns Scored."""
+        if self.vectorized and self.n >= VECTOR_MIN:
+            return self._close_numpy()
+        return self._close_python()
+
+    def _close_python(self):
+        pids, options, times, streaks = self.pids, self.options, self.times, self.streaks
+        counts = [0] * self.n_options
+        awards = []
+        correct, opened, limit = self.correct, self.opened, self.time_limit
+        floor, span, bonus, cap = self.floor, self.points - self.floor, STREAK_BONUS, STREAK_CAP
+        for i in range(self.n):
+            option = options[i]
+            if option < 0:
+                continue
+            counts[option] += 1
+            if option == correct:
+                pid = pids[i]
+                elapsed = min(max(times[i] - opened, 0.0), limit)
+                awards.append((pid, floor + round(span * (1.0 - elapsed / limit)) + bonus * min(streaks[pid], cap)))
+        self.streaks = _zeros("q", len(streaks))  # every streak ends but the ones that go on
+        for pid, _ in awards:
+            self.streaks[pid] = streaks[pid] + 1
+        return Scored(awards, counts, self.n)
+
+    def _close_numpy(self):
+        n = self.n
+        pids = numpy.frombuffer(self.pids, numpy.int64, n)
+        options = numpy.frombuffer(self.options, numpy.int64, n)
+        times = numpy.frombuffer(self.times, numpy.float64, n)
+        streaks = numpy.frombuffer(self.streaks, numpy.int64)
+        valid = options >= 0
+        counts = numpy.bincount(options[valid], minlength=self.n_options)
+        hit = (options == self.correct) & valid
+        winners = pids[hit]
+        elapsed = numpy.clip(times[hit] - self.opened, 0.0, self.time_limit)
+        speed = numpy.rint((self.points - self.floor) * (1.0 - elapsed / self.time_limit)).astype(numpy.int64)
+        streak = streaks[winners]
+        points = self.floor + speed + STREAK_BONUS * numpy.minimum(streak, STREAK_CAP)
+        streaks[:] = 0
+        streaks[winners] = streak + 1
+        return Scored(list(zip(winners.tolist(), points.tolist())), counts.tolist(), n)
+
+    def snapshot(self):
+        """The open question's answers and the streaks, as JSON-able data (server handoff)."""
+        n = self.n
+        return {"n_options": self.n_options, "correct": self.correct, "opened": self.opened,
+                "pids": self.pids[:n].tolist(), "options": self.options[:n].tolist(),
+                "times": self.times[:n].tolist(), "streaks": self.streaks.tolist()}
+
+    def restore(self, snap):
+        """Continue from snapshot() (taken in this or another process on the same clock)."""
+        self.streaks = array("q", snap["streaks"])
+        self.answered = bytearray(len(self.streaks))
+        self.open(snap["n_options"], snap["correct"], snap["opened"])
+        for pid, option, received in zip(snap["pids"], snap["options"], snap["times"]):
+            self.add(pid, option, received)
+
+    def __len__(self):
+        return self.n
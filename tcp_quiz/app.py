@@ -2,14 +2,16 @@
 """
 Streamlit UI for the quiz. Uses tcp_client module for networking.
 - Call 'Join Server' (sidebar) to start the local tcp_client (persistent).
-- The UI polls tcp_client.get_state() each rerun and renders the present state.
+- The UI renders tcp_client.get_state() each rerun, then blocks in tcp_client.wait_for_change()
+  until the state changes (or REFRESH seconds pass) before rerunning.
 - When answering, the UI calls tcp_client.send_answer(answer).
 """
 
 import streamlit as st
-import time
 import client  # our module above
 
+REFRESH = 1.0  # seconds between reruns when nothing changes
+
 st.set_page_config(page_title="QuizNet (TCP)", layout="centered")
 st.title("🎮 QuizNet (UI)")
 
@@ -41,11 +43,13 @@ if not state["connected"]:
         for m in state["messages"][-10:]:
             st.write(m)
     # refresh slowly so user can click join
-    time.sleep(1)
+    client.wait_for_change(state["version"], timeout=REFRESH)
     st.rerun()
 else:
     st.sidebar.write(f"👤 You: **{state['username']}**")
     st.sidebar.write(f"🎯 Score: **{state['score']}**")
+    if state["rank"]:
+        st.sidebar.write(f"📈 Rank: **{state['rank']}** of {state['players']}")
     st.sidebar.markdown("---")
 
 # Show messages
@@ -57,8 +61,8 @@ if state["messages"]:
 # Waiting for host
 if not state["game_started"] and not state["game_over"]:
     st.info("⏳ Waiting for host to start the quiz...")
-    # lightweight refresh loop while waiting
-    time.sleep(1.5)
+    # rerun as soon as the host starts (or something else changes)
+    client.wait_for_change(state["version"], timeout=REFRESH)
     st.rerun()
 
 # Game active
@@ -84,8 +88,8 @@ if state["game_started"] and not state["game_over"]:
 # Live leaderboard (main area)
 if state["leaderboard"]:
     st.subheader("🏅 Live Leaderboard")
-    sorted_lb = sorted(state["leaderboard"].items(), key=lambda x: x[1], reverse=True)
-    for user, pts in sorted_lb:
+    # already top-K in rank order (see client_tcp)
+    for user, pts in state["leaderboard"].items():
         if user == state["username"]:
             st.markdown(f"**{user}: {pts} pts**")
         else:
@@ -95,14 +99,13 @@ if state["leaderboard"]:
 if state["game_over"]:
     st.success("🏁 Quiz Over")
     st.subheader("🏆 Final Leaderboard")
-    sorted_lb = sorted(state["leaderboard"].items(), key=lambda x: x[1], reverse=True)
-    for user, pts in sorted_lb:
+    for user, pts in state["leaderboard"].items():
         st.write(f"{user}: {pts} pts")
     if state["messages"]:
         st.write("---")
         for m in state["messages"]:
             st.write(m)
 
-# Small auto-refresh so UI updates as tcp_client updates state
-time.sleep(1.0)
+# Rerun when tcp_client state changes, so updates show immediately without busy polling
+client.wait_for_change(state["version"], timeout=REFRESH)
 st.rerun()
@@ -1,26 +1,44 @@
 # tcp_client.py
 """
-Threaded TCP client module used by Streamlit UI.
+TCP client module used by Streamlit UI.
+One I/O thread per client runs a selector loop: it reads and frames server messages
+straight into state, and writes queued messages as soon as send_answer() wakes it.
 - Start a persistent client with start_client(username, host, port).
+  start_client(..., binary=True) joins with join+bin: and speaks the binary framing in wire.py.
 - send_answer(answer) to send framed 'answer:...' messages to server.
 - get_state() returns a snapshot dict with current fields:
-    { "connected", "username", "question", "options", "leaderboard", "feedback", "score", "game_started", "game_over", "messages" }
-- stop_client() to close the socket and stop threads (optional).
+    { "connected", "username", "question", "options", "leaderboard", "feedback", "score", "rank", "players", "game_started", "game_over", "messages", "version" }
+  "leaderboard" holds only the server's top-K, already in rank order; "messages" the latest MESSAGES_SHOWN
+  log lines (the log itself keeps MAX_MESSAGES). Snapshots are cached per version: treat them as read-only.
+- Every change bumps "version". get_state(since_version) returns None if nothing changed since then,
+  else only the fields that did (plus "version"). wait_for_change(version, timeout) blocks until the
+  state moves past version and returns the new version.
+- stop_client() to close the socket and stop the I/O thread (optional); takes effect at once.
+- The server's heartbeat pings are answered with a pong by the I/O thread itself; they never reach state.
 """
 
+import selectors
 import socket
 import threading
-import queue
-import time
+from collections import deque
+
+import wire
+from framing import LineBuffer, LineTooLong
 
 DELIM = "\n"
+MAX_MESSAGES = 200  # message log ring buffer
+MESSAGES_SHOWN = 20  # log lines returned by get_state()
+RECV_SIZE = 65536
 
 # Module-level singleton state
 _client_sock = None
-_listener_thread = None
-_send_queue = None
-_recv_queue = None
+_io_thread = None
+_wake_w = None  # write end of the I/O loop's wakeup socketpair
+_out = bytearray()  # bytes waiting to be written by the I/O loop
+_out_lock = threading.Lock()
+_binary = False
 _state_lock = threading.Lock()
+_state_changed = threading.Condition(_state_lock)
 _state = {
     "connected": False,
     "username": "",
@@ -29,202 +47,237 @@ _state = {
     "leaderboard": {},
     "feedback": "",
     "score": 0,
+    "rank": 0,
+    "players": 0,
     "game_started": False,
     "game_over": False,
-    "messages": [],
+    "messages": deque(maxlen=MAX_MESSAGES),
 }
+_version = 0
+_field_versions = dict.fromkeys(_state, 0)  # field -> version of its last change
+_snapshot = None  # (version, full get_state() result)
 
 _stop_event = threading.Event()
 
 
+def _set(**fields):
+    """Update state fields, bump the version and wake waiters. Caller holds _state_lock."""
+    global _version
+    _version += 1
+    for key, value in fields.items():
+        _state[key] = value
+        _field_versions[key] = _version
+    _state_changed.notify_all()
+
+
+def _log(line):
+    """Append to the message log. Caller holds _state_lock."""
+    _state["messages"].append(line)
+    _set(messages=_state["messages"])
+
+
 def _enqueue_recv(line):
     """Process raw server line into state (runs in listener thread)."""
     line = line.strip()
     if not line:
         return
-    # Keep raw messages for debugging
+    kind, args = wire.decode_text(line)
+    if kind == "ping":
+        _send(wire.encode_text("pong", args[0]))
+        return
+    _apply(kind, args, line)
+
+
+def _enqueue_msg(kind, args):
+    """Process a decoded binary frame into state, logging it in text form."""
+    if kind == "unknown":
+        return
+    if kind == "ping":
+        _send(wire.encode_binary("pong", args[0]))
+        return
+    _apply(kind, args, wire.encode_text(kind, *args).decode().rstrip(DELIM))
+
+
+def _apply(kind, args, line):
+    """Apply one message to state and log it once: readable text for welcome/quiz_over/error,
+    the raw line for everything else (kept for debugging)."""
     with _state_lock:
-        _state["messages"].append(line)
-    # Basic parsing
-    if line.startswith("welcome:"):
-        with _state_lock:
-            _state["messages"].append(line.split("welcome:", 1)[1])
-    elif line.startswith("start_quiz"):
-        with _state_lock:
-            _state["game_started"] = True
-    elif line.startswith("question:"):
-        payload = line.split("question:", 1)[1]
-        parts = payload.split("|")
-        with _state_lock:
-            _state["question"] = parts[0]
-            _state["options"] = parts[1:] if len(parts) > 1 else []
-            _state["feedback"] = ""
-    elif line.startswith("feedback:"):
-        with _state_lock:
-            _state["feedback"] = line.split("feedback:", 1)[1]
-    elif line.startswith("leaderboard:"):
-        payload = line.split("leaderboard:", 1)[1]
-        lb = {}
-        if payload:
-            for entry in payload.split("|"):
-                if ":" in entry:
-                    u, p = entry.split(":", 1)
-                    try:
-                        lb[u] = int(p)
-                    except:
-                        lb[u] = 0
-        with _state_lock:
-            _state["leaderboard"] = lb
-            if _state["username"] in lb:
-                _state["score"] = lb[_state["username"]]
-    elif line.startswith("quiz_over:"):
-        with _state_lock:
-            _state["game_over"] = True
-            _state["messages"].append(line.split("quiz_over:", 1)[1])
-    elif line.startswith("error:"):
-        with _state_lock:
-            _state["messages"].append("ERROR: " + line.split("error:", 1)[1])
-    else:
-        # generic
-        with _state_lock:
-            _state["messages"].append(line)
-
-
-def _listener(sock, recv_q: queue.Queue):
-    """Listener thread: read bytes, split on DELIM, put lines into recv_q."""
-    buffer = ""
-    sock.settimeout(1.0)
-    while not _stop_event.is_set():
-        try:
-            data = sock.recv(4096).decode()
-            if not data:
-                # Connection closed by server
-                recv_q.put("error:Connection closed by server")
-                break
-            buffer += data
-            while DELIM in buffer:
-                line, buffer = buffer.split(DELIM, 1)
-                recv_q.put(line)
-        except socket.timeout:
-            continue
-        except Exception as e:
-            recv_q.put(f"error:Listener exception: {e}")
-            break
-    # mark stopped
+        if kind == "welcome":
+            _log(args[0])
+            return
+        _log("ERROR: " + args[0] if kind == "error" else args[0] if kind == "quiz_over" else line)
+        if kind == "start_quiz":
+            _set(game_started=True)
+        elif kind == "question":
+            _set(question=args[0], options=list(args[1]), feedback="")
+        elif kind == "feedback":
+            _set(feedback=args[0])
+        elif kind == "leaderboard_top":
+            _set(leaderboard=dict(args[0]))
+        elif kind == "leaderboard_delta":
+            lb = dict(_state["leaderboard"])
+            for u, p in args[0]:
+                if p is None:
+                    lb.pop(u, None)
+                else:
+                    lb[u] = p
+            # keep rank order (only top-K entries, stable for ties)
+            _set(leaderboard=dict(sorted(lb.items(), key=lambda x: x[1], reverse=True)))
+        elif kind == "rank":
+            rank, points, players = args
+            _set(rank=rank, score=points, players=players)
+        elif kind == "quiz_over":
+            _set(game_over=True)
+
+
+def _wake():
+    try:
+        _wake_w.send(b"\0")
+    except (AttributeError, OSError):
+        pass  # already pending, or the loop has exited
+
+
+def _send(data):
+    """Queue framed bytes for the I/O loop and wake it to write them now."""
+    with _out_lock:
+        _out.extend(data)
+    _wake()
+
+
+def _io_loop(sock, wake_r, wake_w, stop):
+    """I/O thread: read and apply server messages, flush _out, until stopped or disconnected."""
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+    sel.register(wake_r, selectors.EVENT_READ)
+    framer = wire.FrameDecoder() if _binary else LineBuffer(max_line=wire.MAX_FRAME)
+    writing = False
     try:
-        sock.close()
-    except:
-        pass
-
-
-def _sender(sock, send_q: queue.Queue):
-    """Sender thread: take messages from send_q and send them framed."""
-    while not _stop_event.is_set():
-        try:
-            msg = send_q.get(timeout=0.5)
-        except queue.Empty:
-            continue
-        try:
-            sock.sendall((msg + DELIM).encode())
-        except Exception:
-            # failed to send -> put error into recv queue so listener/main can see
-            try:
-                _recv_queue.put("error:Failed to send message")
-            except:
-                pass
-
-
-def start_client(username, host="127.0.0.1", port=8888, timeout=5.0):
+        while not stop.is_set():
+            for key, events in sel.select():
+                if key.fileobj is wake_r:
+                    wake_r.recv(4096)
+                    continue
+                if events & selectors.EVENT_READ:
+                    data = sock.recv(RECV_SIZE)
+                    if not data:
+                        # Connection closed by server
+                        _enqueue_recv("error:Connection closed by server")
+                        return
+                    if _binary:
+                        for msg in framer.feed(data):
+                            _enqueue_msg(*msg)
+                    else:
+                        for line in framer.feed(data):
+                            _enqueue_recv(line)
+            with _out_lock:
+                if _out:
+                    try:
+                        del _out[:sock.send(_out)]
+                    except BlockingIOError:
+                        pass
+                    except OSError:
+                        _enqueue_recv("error:Failed to send message")
+                        return
+                pending = bool(_out)
+            if pending != writing:
+                writing = pending
+                sel.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE if pending else selectors.EVENT_READ)
+    except (OSError, LineTooLong, wire.FrameTooLarge) as e:
+        _enqueue_recv(f"error:Listener exception: {e}")
+    finally:
+        sel.close()
+        for closing in (sock, wake_r, wake_w):
+            closing.close()
+
+
+def start_client(username, host="127.0.0.1", port=8888, timeout=5.0, binary=False):
     """
     Start and connect the singleton client.
     Safe to call multiple times; if already running, returns True.
+    binary=True negotiates the length-prefixed binary protocol at join time.
     """
-    global _client_sock, _listener_thread, _send_queue, _recv_queue, _listener_thread, _send_thread
+    global _client_sock, _io_thread, _wake_w, _binary, _stop_event
 
     if _state["connected"]:
         return True
 
-    _stop_event.clear()
+    _stop_event = threading.Event()  # per connection, so a stopping I/O thread can't be revived
 
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((host, port))
-        sock.setblocking(True)
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setblocking(False)
     except Exception as e:
         with _state_lock:
-            _state["messages"].append(f"error:Connect failed: {e}")
+            _log(f"error:Connect failed: {e}")
         return False
 
-    # queues
-    _send_queue = queue.Queue()
-    _recv_queue = queue.Queue()
-
-    # set module vars
-    _client_sock = sock
-    _send_thread = threading.Thread(target=_sender, args=(sock, _send_queue), daemon=True)
-    _listener_thread = threading.Thread(target=_listener, args=(sock, _recv_queue), daemon=True)
+    _binary = binary
+    wake_r, _wake_w = socket.socketpair()
+    wake_r.setblocking(False)
+    _wake_w.setblocking(False)
+    with _out_lock:
+        _out.clear()
 
     # set username and connected flag
     with _state_lock:
-        _state["username"] = username
-        _state["connected"] = True
-        _state["messages"].append(f"Connected (local client) as {username}")
-
-    # start threads
-    _send_thread.start()
-    _listener_thread.start()
-
-    # send join message
-    _send_queue.put(f"join:{username}")
-
-    # start a small internal worker thread that drains recv_queue and applies to state
-    def _drain_worker():
-        while not _stop_event.is_set():
-            try:
-                line = _recv_queue.get(timeout=0.5)
-            except queue.Empty:
-                continue
-            # process the line (runs in this worker thread)
-            _enqueue_recv(line)
-        # cleanup on exit
-    threading.Thread(target=_drain_worker, daemon=True).start()
+        _set(username=username, connected=True)
+        _log(f"Connected (local client) as {username}")
 
+    _client_sock = sock
+    _send((f"join+bin:{username}" if binary else f"join:{username}").encode() + DELIM.encode())
+    _io_thread = threading.Thread(target=_io_loop, args=(sock, wake_r, _wake_w, _stop_event), daemon=True)
+    _io_thread.start()
     return True
 
 
 def send_answer(answer):
-    """Queue an 'answer:...' message to the server. Returns True if enqueued."""
-    if not _state["connected"] or _client_sock is None or _send_queue is None:
+    """Send an 'answer:...' message to the server now. Returns True if queued for the I/O thread."""
+    if not _state["connected"] or _client_sock is None:
         return False
-    _send_queue.put(f"answer:{answer}")
+    _send(wire.encode("answer", answer, binary=_binary))
     return True
 
 
-def get_state():
-    """Return a shallow copy snapshot of current state (safe to call from Streamlit)."""
+def _copy(key):
+    value = _state[key]
+    if key == "messages":
+        return list(value)[-MESSAGES_SHOWN:]
+    if key == "options":
+        return list(value)
+    if key == "leaderboard":
+        return dict(value)
+    return value
+
+
+def get_state(since_version=None):
+    """Snapshot of current state (safe to call from Streamlit). With since_version: None when
+    nothing changed since, else just the changed fields and "version"."""
+    global _snapshot
     with _state_lock:
-        return {
-            "connected": _state["connected"],
-            "username": _state["username"],
-            "question": _state["question"],
-            "options": list(_state["options"]),
-            "leaderboard": dict(_state["leaderboard"]),
-            "feedback": _state["feedback"],
-            "score": _state["score"],
-            "game_started": _state["game_started"],
-            "game_over": _state["game_over"],
-            "messages": list(_state["messages"][-20:]),
-        }
+        if since_version is not None:
+            if since_version >= _version:
+                return None
+            changed = {key: _copy(key) for key, v in _field_versions.items() if v > since_version}
+            changed["version"] = _version
+            return changed
+        if _snapshot is None or _snapshot[0] != _version:
+            full = {key: _copy(key) for key in _state}
+            full["version"] = _version
+            _snapshot = (_version, full)
+        return _snapshot[1]
+
+
+def wait_for_change(since_version, timeout=None):
+    """Block until the state version passes since_version (or timeout); returns the current version."""
+    with _state_changed:
+        _state_changed.wait_for(lambda: _version > since_version, timeout)
+        return _version
 
 
 def stop_client():
-    """Stop the threads and close socket."""
+    """Stop the I/O thread; it closes the socket on its way out."""
     _stop_event.set()
-    try:
-        if _client_sock:
-            _client_sock.close()
-    except:
-        pass
+    _wake()
     with _state_lock:
-        _state["connected"] = False
+        _set(connected=False)
     return True
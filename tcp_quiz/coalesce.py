@@ -0,0 +1,76 @@
+# coalesce.py
+"""
+Per-connection write coalescing for asyncio transports (server_tcp, relay).
+Everything a game tick produces for one connection (e.g. feedback, the
+leaderboard delta and the player's rank when a question closes) is appended to
+that connection's buffer, and the buffers are written once the event loop has
+run the callbacks that were ready in this iteration: one transport.write(),
+which is one send() while the socket keeps up, per connection per tick
+instead of one per frame. Sockets run with TCP_NODELAY, so a flushed batch
+(a question frame included) goes out at once instead of waiting on Nagle
+and delayed ACKs. keepalive() tunes TCP keepalive probes on the same sockets.
+"""
+
+import asyncio
+import socket
+
+
+def nodelay(transport):
+    """Turn off Nagle on a TCP transport (asyncio does by default; done here explicitly)."""
+    sock = transport.get_extra_info("socket")
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def keepalive(transport, idle, interval, probes):
+    """Turn on TCP keepalive: after `idle` silent seconds the kernel probes every `interval`
+    seconds and resets the connection after `probes` unanswered ones, so a peer that vanished
+    (NAT timeout, powered off) shows up as a lost connection. Options the platform lacks are
+    left at its defaults."""
+    sock = transport.get_extra_info("socket")
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", probes)):
+        if hasattr(socket, name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), int(value))
+
+
+class WriteCoalescer:
+    def __init__(self, on_write=None):
+        self.on_write = on_write  # called once per flushed transport, for metrics
+        self._pending = {}  # transport -> bytearray of frames queued this tick
+        self._scheduled = False
+
+    def write(self, transport, frame):
+        buf = self._pending.get(transport)
+        if buf is None:
+            self._pending[transport] = bytearray(frame)
+            if not self._scheduled:
+                self._scheduled = True
+                asyncio.get_running_loop().call_soon(self.flush)
+        else:
+            buf += frame
+
+    def buffered(self, transport):
+        """Bytes queued for transport that are not written to it yet."""
+        buf = self._pending.get(transport)
+        return 0 if buf is None else len(buf)
+
+    def flush(self):
+        self._scheduled = False
+        pending, self._pending = self._pending, {}
+        for transport, buf in pending.items():
+            if not transport.is_closing():
+                transport.write(buf)
+                if self.on_write:
+                    self.on_write()
+
+    def close(self, transport):
+        """Write what is queued for transport now, then close it (close() drains the write)."""
+        buf = self._pending.pop(transport, None)
+        if buf and not transport.is_closing():
+            transport.write(buf)
+            if self.on_write:
+                self.on_write()
+        transport.close()
@@ -0,0 +1,66 @@
+# framing.py
+"""
+Incremental newline framing for socket reads.
+A LineBuffer is kept per connection: feed() it whatever recv()/data_received()
+returned and it hands back only the complete lines, keeping any partial line
+for the next read. Bytes are accumulated in a bytearray and decoded straight
+from a memoryview, once per complete line.
+"""
+
+DELIM = b"\n"
+MAX_LINE = 4096  # bytes, excluding the delimiter
+
+
+class LineTooLong(ValueError):
+    """Raised when a peer sends more than max_line bytes without a delimiter."""
+
+
+class LineBuffer:
+    def __init__(self, max_line=MAX_LINE, delim=DELIM, encoding="utf-8"):
+        self.max_line = max_line
+        self.delim = delim
+        self.encoding = encoding
+        self._buf = bytearray()
+        self._scan = 0  # bytes of _buf already known to contain no delimiter
+
+    def feed(self, data, limit=None):
+        """Append data and return the list of complete lines it finished (delimiter stripped).
+        With limit, return at most that many lines and keep the rest buffered (see pending())."""
+        buf = self._buf
+        buf += data
+        lines = []
+        start = 0
+        pos = buf.find(self.delim, self._scan)
+        if pos < 0:
+            self._scan = len(buf)
+            if len(buf) > self.max_line:
+                raise LineTooLong(f"line exceeds {self.max_line} bytes")
+            return lines
+        view = memoryview(buf)
+        try:
+            while pos >= 0:
+                if pos - start > self.max_line:
+                    raise LineTooLong(f"line exceeds {self.max_line} bytes")
+                lines.append(str(view[start:pos], self.encoding, "replace"))
+                start = pos + len(self.delim)
+                if limit is not None and len(lines) >= limit:
+                    break
+                pos = buf.find(self.delim, start)
+        finally:
+            view.release()
+        del buf[:start]
+        if limit is not None and len(lines) >= limit:
+            self._scan = 0  # the remainder has not been scanned
+            return lines
+        self._scan = len(buf)
+        if self._scan > self.max_line:
+            raise LineTooLong(f"line exceeds {self.max_line} bytes")
+        return lines
+
+    def pending(self):
+        """Bytes received after the last complete line."""
+        return bytes(self._buf)
+
+    def clear(self):
+        self._buf.clear()
+        self._scan = 0
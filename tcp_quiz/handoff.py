@@ -0,0 +1,117 @@
+# handoff.py
+"""
+Hand a running server_tcp over to its replacement process without dropping
+anyone (server_tcp --takeover). The old server listens on a Unix
+SOCK_SEQPACKET socket (message boundaries are kept, so file descriptors
+arrive with the message they were sent with). The new one connects and
+receives, in order:
+    {"op": "listen"}                 + the listening socket
+    {"op": "state", "size": n}       then the JSON snapshot in CHUNK-byte messages
+    {"op": "fds", "count": k}        + k connection sockets (MAX_FDS at most per
+                                       message), in the order of snapshot["conns"]
+    {"op": "done"}
+It answers b"ok" once it has restored the snapshot. Only then does the old
+process let go of its copies of the sockets. Closing a copy does not end a
+connection while another process holds one, so players see a short pause, not
+a disconnect. Without the ack (the new process failed) the old one carries on.
+"""
+
+import json
+import os
+import socket
+
+CHUNK = 32 * 1024  # snapshot bytes per message, well under the socket buffer
+MAX_FDS = 250      # descriptors per message (the kernel's SCM_MAX_FD is 253)
+ACK_TIMEOUT = 10.0  # seconds the old server waits for the new one to restore the snapshot
+
+
+class HandoffError(Exception):
+    """The handoff stream was cut short or malformed."""
+
+
+def listen(path):
+    """Unix socket the old server waits for its replacement on (owner-only, non-blocking)."""
+    try:
+        os.unlink(path)  # left by a server that is gone, or by the one being replaced
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    sock.bind(path)
+    os.chmod(path, 0o600)
+    sock.listen(1)
+    sock.setblocking(False)
+    return sock
+
+
+def _send(conn, msg, fds=()):
+    data = json.dumps(msg).encode()
+    if fds:
+        socket.send_fds(conn, [data], list(fds))
+    else:
+        conn.sendall(data)
+
+
+def send_listener(conn, listener):
+    _send(conn, {"op": "listen"}, [listener.fileno()])
+
+
+def send_state(conn, state, fds):
+    """Send the snapshot, then the connection fds it refers to, then done."""
+    data = json.dumps(state, ensure_ascii=False).encode()
+    _send(conn, {"op": "state", "size": len(data)})
+    for i in range(0, len(data), CHUNK):
+        conn.sendall(data[i:i + CHUNK])
+    for i in range(0, len(fds), MAX_FDS):
+        batch = fds[i:i + MAX_FDS]
+        _send(conn, {"op": "fds", "count": len(batch)}, batch)
+    _send(conn, {"op": "done"})
+
+
+def wait_ack(conn, timeout=ACK_TIMEOUT):
+    """True once the replacement confirms it has taken over."""
+    conn.settimeout(timeout)
+    try:
+        return conn.recv(16) == b"ok"
+    except OSError:
+        return False
+
+
+def _recv(conn, maxfds=0):
+    msg, fds, flags, _ = socket.recv_fds(conn, CHUNK + 1024, maxfds)
+    if not msg:
+        raise HandoffError("old server closed the handoff socket")
+    if flags & (socket.MSG_TRUNC | socket.MSG_CTRUNC):
+        raise HandoffError("handoff message truncated")
+    return msg, fds
+
+
+def receive(path):
+    """Connect to the old server at path and read the handoff. Returns (handoff socket,
+    listening socket, snapshot, connection sockets in snapshot order); ack() the handoff
+    socket once the snapshot is restored."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    conn.connect(path)
+    msg, fds = _recv(conn, 1)
+    if json.loads(msg).get("op") != "listen" or len(fds) != 1:
+        raise HandoffError("expected the listening socket first")
+    listener = socket.socket(fileno=fds[0])
+    header = json.loads(_recv(conn)[0])
+    data = bytearray()
+    while len(data) < header["size"]:
+        data += _recv(conn)[0]
+    state = json.loads(data)
+    socks = []
+    while True:
+        msg, fds = _recv(conn, MAX_FDS)
+        op = json.loads(msg).get("op")
+        socks.extend(socket.socket(fileno=fd) for fd in fds)
+        if op == "done":
+            break
+    if len(socks) != len(state["conns"]):
+        raise HandoffError(f"got {len(socks)} connections for {len(state['conns'])} in the snapshot")
+    return conn, listener, state, socks
+
+
+def ack(conn):
+    conn.sendall(b"ok")
+    conn.close()
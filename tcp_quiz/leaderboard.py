@@ -0,0 +1,177 @@
+# leaderboard.py
+"""
+Rank-maintaining score table for server_tcp.
+Players are ids of a quiz_common PlayerTable and their scores live in its
+points column, which the table and RankedScores share; RankedScores tracks
+which ids are ranked (the connected players). Scores are non-negative ints.
+A Fenwick tree over score values counts players
+per score, so awarding points and asking for a player's rank are both
+O(log max_score). Players with the same score share a rank and, in top(), are
+listed in the order they reached that score.
+"""
+
+from bisect import bisect_left, insort
+
+REBUILD_SHARE = 8  # award_many() rebuilds when at least 1/REBUILD_SHARE of the players are awarded
+
+
+class RankedScores:
+    def __init__(self, points, size=1024):
+        self._points = points  # id -> points column (PlayerTable.points)
+        self._ranked = bytearray()  # id -> 1 while ranked
+        self._count = 0
+        self._tree = [0] * (size + 1)  # Fenwick tree: player count per score value
+        self._buckets = {}    # points -> {id: None}, in order reached
+        self._levels = []     # sorted distinct scores that have players
+
+    # Fenwick helpers (index = points + 1)
+    def _update(self, points, delta):
+        i = points + 1
+        if i >= len(self._tree):
+            self._grow(i)
+        tree = self._tree
+        n = len(tree)
+        while i < n:
+            tree[i] += delta
+            i += i & -i
+
+    def _count_upto(self, points):
+        """Players with score <= points."""
+        i = min(points + 1, len(self._tree) - 1)
+        tree = self._tree
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _grow(self, needed):
+        size = len(self._tree) - 1
+        while size < needed:
+            size *= 2
+        self._rebuild(size)
+
+    def _rebuild(self, size):
+        self._tree = [0] * (size + 1)
+        tree = self._tree
+        for points, bucket in self._buckets.items():
+            i = points + 1
+            while i <= size:
+                tree[i] += len(bucket)
+                i += i & -i
+
+    def _place(self, pid, points):
+        self._update(points, 1)  # before bucketing: _grow() rebuilds from the buckets
+        bucket = self._buckets.get(points)
+        if bucket is None:
+            bucket = self._buckets[points] = {}
+            insort(self._levels, points)
+        bucket[pid] = None
+
+    def _unplace(self, pid, points):
+        bucket = self._buckets[points]
+        del bucket[pid]
+        if not bucket:
+            del self._buckets[points]
+            del self._levels[bisect_left(self._levels, points)]
+        self._update(points, -1)
+
+    def add(self, pid):
+        """Rank a player at its points in the column (a rejoin keeps its score)."""
+        if pid in self:
+            return
+        if pid >= len(self._ranked):
+            self._ranked.extend(bytes(pid + 1 - len(self._ranked)))
+        self._ranked[pid] = 1
+        self._count += 1
+        self._place(pid, self._points[pid])
+
+    def award(self, pid, points):
+        """Add points to a player's score (ranking it if it is not) and return the new score."""
+        old = self._points[pid]
+        new = self._points[pid] = old + points
+        if pid not in self:
+            self.add(pid)
+            return new
+        self._unplace(pid, old)
+        self._place(pid, new)
+        return new
+
+    def award_many(self, awards):
+        """Add points for each (id, points) pair, in order. Ranked players move as with award();
+        unranked ones (players who left) only get the points in the column, for a rejoin.
+        When the batch is a large share of the ranked players (every answer to a question
+        scored at once), the buckets and the tree are rebuilt in one pass instead of moving
+        each player separately."""
+        column = self._points
+        if len(awards) * REBUILD_SHARE < self._count:
+            for pid, points in awards:
+                if pid in self:
+                    self.award(pid, points)
+                else:
+                    column[pid] += points
+            return
+        moved = {}
+        for pid, points in awards:
+            column[pid] += points
+            if pid in self:
+                moved[pid] = None
+        buckets = {}
+        for points, bucket in self._buckets.items():  # unawarded players keep their place ...
+            kept = {pid: None for pid in bucket if pid not in moved}
+            if kept:
+                buckets[points] = kept
+        for pid in moved:  # ... and the awarded ones reach their new score in award order
+            buckets.setdefault(column[pid], {})[pid] = None
+        self._buckets = buckets
+        self._levels = sorted(buckets)
+        size = len(self._tree) - 1
+        while self._levels and size <= self._levels[-1]:
+            size *= 2
+        self._rebuild(size)
+
+    def remove(self, pid):
+        """Unrank a player; its points stay in the column. Returns them, or None if not ranked."""
+        if pid not in self:
+            return None
+        points = self._points[pid]
+        self._unplace(pid, points)
+        self._ranked[pid] = 0
+        self._count -= 1
+        return points
+
+    def get(self, pid, default=0):
+        return self._points[pid] if pid < len(self._points) else default
+
+    def rank(self, pid):
+        """1-based competition rank (ties share a rank), or None for unranked players."""
+        if pid not in self:
+            return None
+        return self._count - self._count_upto(self._points[pid]) + 1
+
+    def ranks(self):
+        """{points: rank} for every score a ranked player has: everyone's rank() in one pass."""
+        out = {}
+        above = 0
+        for points in reversed(self._levels):
+            out[points] = above + 1
+            above += len(self._buckets[points])
+        return out
+
+    def top(self, k=None):
+        """The k best (id, points) pairs in rank order (all ranked players if k is None)."""
+        out = []
+        if k is None:
+            k = self._count
+        for points in reversed(self._levels):
+            for pid in self._buckets[points]:
+                if len(out) >= k:
+                    return out
+                out.append((pid, points))
+        return out
+
+    def __contains__(self, pid):
+        return pid < len(self._ranked) and self._ranked[pid] == 1
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,53 @@
+# players.py
+"""
+Player registry for server_tcp: the connected players of a room, by player id.
+Ids, names and points live in the room's quiz_common PlayerTable; the registry
+keeps each id's connection in the table's conns column (None while away) and
+handles join, rejoin (takeover of an existing username) and removal. Every
+lookup is a list index, so handling an answer or a disconnect never scans the
+other players.
+"""
+
+
+class PlayerRegistry:
+    def __init__(self, table):
+        self.table = table
+        self._online = 0
+
+    def add(self, pid, conn):
+        """Register conn as player pid. Returns the connection it took over from, or None."""
+        conns = self.table.conns
+        old = conns[pid]
+        conns[pid] = conn
+        if old is None:
+            self._online += 1
+        return old
+
+    def remove(self, pid, conn=None):
+        """Mark pid away. If conn is given, only while conn is still its registered connection
+        (a taken-over connection must not evict its replacement). Returns the removed
+        connection or None."""
+        conns = self.table.conns
+        current = conns[pid]
+        if current is None or (conn is not None and current is not conn):
+            return None
+        conns[pid] = None
+        self._online -= 1
+        return current
+
+    def get(self, pid):
+        return self.table.conns[pid]
+
+    def names(self):
+        names = self.table.names
+        return [names[pid] for pid, _ in self.items()]
+
+    def items(self):
+        """(id, connection) of every connected player, in id order."""
+        return ((pid, conn) for pid, conn in enumerate(self.table.conns) if conn is not None)
+
+    def __contains__(self, pid):
+        return self.table.conns[pid] is not None
+
+    def __len__(self):
+        return self._online
@@ -0,0 +1,484 @@
+# relay.py
+"""
+Relay (edge) node for server_tcp: players connect here instead of to the game server.
+Per room the relay keeps one upstream connection, joined with relay:<room>, which
+the server treats as a single subscriber carrying all of this relay's players
+(see the relay lines in server_tcp.py):
+- a player's join:/join+bin: line becomes rjoin:<username>, each answer
+  ranswer:<username>:<option> and its disconnect rleave:<username>, so the
+  server still scores every player by name;
+- a broadcast line from upstream is written to every local player, as is for
+  text players and re-encoded once per broadcast for binary players;
+- to:<username>:<line> goes to that player only, kick:<username> disconnects it;
+- ping:<token> (the server's heartbeat) is answered with pong:<token> by the
+  relay itself: a quiet link is this relay's liveness, not its players'.
+Its own players and links get the same heartbeat as the server's: a connection
+quiet for HEARTBEAT seconds is pinged, one silent for IDLE_TIMEOUT is reaped
+(REAP_BATCH per event-loop pass), and a reaped player leaves with rleave.
+A relay accepts relay:<room> links as well, so relays chain into a tree:
+    python server_tcp.py
+    python relay.py --upstream 127.0.0.1:8888 --port 8988
+    python relay.py --upstream 127.0.0.1:8988 --port 8989
+Players run client_tcp / app.py unchanged, pointed at a relay's port. If the
+upstream connection is lost, the room's players here are disconnected so they
+can reconnect (to the server or another relay).
+Writes are coalesced per connection like the server's (coalesce.py), both to
+players and upstream, where the answers of many players share one send().
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import wire
+from coalesce import WriteCoalescer, nodelay
+from framing import LineBuffer, LineTooLong
+from server_tcp import (HEARTBEAT, IDLE_TIMEOUT, JOIN_TIMEOUT, MAX_LINE, MAX_OUTBOUND, REAP_BATCH,
+                        RELAY_MAX_OUTBOUND, SLOW_CLIENT_POLICY, parse_join, parse_relay, setup_logging)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from quiz_common import metrics
+
+HOST = "127.0.0.1"
+PORT = 8988
+UPSTREAM = "127.0.0.1:8888"  # the game server, or another relay
+BACKLOG = 1024
+METRICS_PORT = 0  # Prometheus text on 127.0.0.1; 0 = off
+LOG_LEVEL = "info"
+
+log = logging.getLogger("relay")
+
+upstream_addr = ("127.0.0.1", 8888)
+upstreams = {}  # room name -> Upstream
+
+METRICS = metrics.Registry()
+players_connected = METRICS.gauge("relay_players_connected", "Players on this relay (local and below)",
+                                  fn=lambda: sum(len(up.routes) for up in upstreams.values()))
+links_connected = METRICS.gauge("relay_links_connected", "Relays linked below this one",
+                                fn=lambda: sum(len(up.links) for up in upstreams.values()))
+upstreams_open = METRICS.gauge("relay_upstreams", "Upstream connections (one per room)",
+                               fn=lambda: len(upstreams))
+frames_from_upstream = METRICS.counter("relay_frames_in_total", "Lines read from upstream")
+frames_out = METRICS.counter("relay_frames_out_total", "Frames queued to players and links")
+bytes_out = METRICS.counter("relay_bytes_out_total", "Bytes queued to players and links")
+socket_writes = METRICS.counter("relay_socket_writes_total", "Coalesced transport writes (one send() each)")
+answers_forwarded = METRICS.counter("relay_answers_forwarded_total", "Answers passed upstream")
+broadcast_seconds = METRICS.histogram("relay_broadcast_seconds", "Time to queue one broadcast to every player")
+disconnects = METRICS.counter("relay_disconnects_total", "Downstream connections dropped, by reason", "reason")
+pings = METRICS.counter("relay_pings_total", "Heartbeat pings sent to quiet players and links")
+
+outbox = WriteCoalescer(on_write=socket_writes.inc)
+
+
+def parse_addr(spec):
+    """'host:port' -> (host, port)"""
+    host, _, port = spec.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def get_upstream(room):
+    up = upstreams.get(room)
+    if up is None:
+        up = upstreams[room] = Upstream(room)
+        asyncio.get_running_loop().create_task(up.connect())
+    return up
+
+
+def queue(transport, frame, limit):
+    """Batch frame for this tick unless the connection is closing or would hold more than limit
+    unsent bytes."""
+    if transport.is_closing() or transport.get_write_buffer_size() + outbox.buffered(transport) + len(frame) > limit:
+        return False
+    outbox.write(transport, frame)
+    frames_out.inc()
+    bytes_out.inc(len(frame))
+    return True
+
+
+def too_slow(transport, what):
+    if SLOW_CLIENT_POLICY == "disconnect" and not transport.is_closing():
+        log.warning("⚠ %s is too slow; closing.", what)
+        disconnects.inc(label="slow")
+        transport.close()
+
+
+class Upstream(asyncio.Protocol):
+    """This relay's connection to the next hop for one room, and who below it owns each player."""
+
+    def __init__(self, room):
+        self.room = room
+        self.transport = None
+        self.queued = [f"relay:{room}\n".encode()]  # written once connected
+        self.framer = LineBuffer(wire.MAX_FRAME)
+        self.routes = {}  # username -> the Player or Link it is reached through
+        self.players = set()  # local Players: each gets every broadcast
+        self.links = set()  # Links to relays below: one copy of every broadcast each
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.create_connection(lambda: self, *upstream_addr)
+        except OSError as e:
+            log.warning("⚠ Upstream %s:%d unreachable for room %s: %s", *upstream_addr, self.room, e)
+            self.connection_lost(e)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        nodelay(transport)
+        transport.write(b"".join(self.queued))
+        self.queued = None
+        log.info("🔀 Linked room %s to upstream %s:%d", self.room, *upstream_addr)
+
+    def write(self, data):
+        if self.queued is not None:
+            self.queued.append(data)
+        elif not self.transport.is_closing():
+            outbox.write(self.transport, data)
+
+    def join(self, username, owner):
+        old = self.routes.get(username)
+        if old is not None:
+            self.drop(username, old)  # same name joined again through this relay: takeover
+        self.routes[username] = owner
+        if isinstance(owner, Player):
+            self.players.add(owner)
+        self.write(f"rjoin:{username}\n".encode())
+
+    def leave(self, username, owner):
+        if self.routes.get(username) is owner:
+            del self.routes[username]
+            self.players.discard(owner)
+            self.write(f"rleave:{username}\n".encode())
+
+    def drop(self, username, owner):
+        """Disconnect a player the server (or a takeover) removed; no rleave is sent for it."""
+        del self.routes[username]
+        self.players.discard(owner)
+        owner.kick(username)
+
+    def data_received(self, data):
+        try:
+            lines = self.framer.feed(data)
+        except LineTooLong:
+            log.warning("⚠ Line too long from upstream for room %s; closing.", self.room)
+            self.transport.close()
+            return
+        frames_from_upstream.inc(len(lines))
+        for line in lines:
+            if line.startswith("to:"):
+                username, _, payload = line[3:].partition(":")
+                owner = self.routes.get(username)
+                if owner is not None:
+                    owner.deliver(line, payload)
+            elif line.startswith("kick:"):
+                username = line[5:]
+                owner = self.routes.get(username)
+                if owner is not None:
+                    self.drop(username, owner)
+            elif line.startswith("ping:"):
+                self.write(b"pong:%s\n" % line[5:].encode())
+            elif line:
+                self.broadcast(line)
+
+    def broadcast(self, line):
+        """Fan one upstream line out: the text frame to text players and links, the binary
+        encoding (made at most once) to binary players."""
+        start = time.perf_counter()
+        frames = [(line + "\n").encode(), None]
+        behind = []
+        for player in self.players:
+            if player.binary and frames[1] is None:
+                frames[1] = player.encode(line)
+            if not queue(player.transport, frames[player.binary], MAX_OUTBOUND):
+                behind.append(player)
+        for link in self.links:
+            if not queue(link.transport, frames[0], RELAY_MAX_OUTBOUND):
+                behind.append(link)
+        elapsed = time.perf_counter() - start
+        broadcast_seconds.observe(elapsed)
+        for conn in behind:
+            too_slow(conn.transport, conn.name)
+        log.debug("📡 Fan-out to %d players and %d links in %s took %.2f ms",
+                  len(self.players), len(self.links), self.room, elapsed * 1000)
+
+    def connection_lost(self, exc):
+        if upstreams.get(self.room) is self:
+            del upstreams[self.room]
+        if self.transport is not None:
+            log.warning("⚠ Upstream for room %s lost; disconnecting its %d players.", self.room, len(self.routes))
+        for conn in list(self.players) + list(self.links):
+            if isinstance(conn, Player):
+                queue(conn.transport, conn.encode("error:upstream lost"), MAX_OUTBOUND)
+            disconnects.inc(label="upstream lost")
+            outbox.close(conn.transport)
+        self.routes.clear()
+        self.players.clear()
+        self.links.clear()
+
+
+class Handshake(asyncio.Protocol):
+    """A new downstream connection: its first line makes it a Player (join:/join+bin:) or a
+    Link from a relay below this one (relay:<room>)."""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info("peername")
+        self.framer = LineBuffer(MAX_LINE)
+        self.join_timer = asyncio.get_running_loop().call_later(JOIN_TIMEOUT, self.join_expired)
+
+    def join_expired(self):
+        log.warning("⚠ No join message from %s; closing.", self.addr)
+        disconnects.inc(label="join timeout")
+        self.transport.close()
+
+    def reject(self, reason, message):
+        disconnects.inc(label=reason)
+        self.transport.write(f"error:{message}\n".encode())
+        self.transport.close()
+
+    def data_received(self, data):
+        try:
+            lines = self.framer.feed(data, limit=1)
+        except LineTooLong:
+            self.join_timer.cancel()
+            self.reject("line too long", "line too long")
+            return
+        if not lines:
+            return
+        self.join_timer.cancel()
+        line = lines[0].strip()
+        relay_room = parse_relay(line)
+        joined = parse_join(line)
+        if relay_room is not None:
+            conn = Link(self.transport, self.addr, get_upstream(relay_room))
+        elif joined is None:
+            self.reject("bad join", "expected join:<username>")
+            return
+        elif not joined[1] or ":" in joined[1]:
+            self.reject("bad join", "username must be non-empty and without ':'")
+            return
+        else:
+            room_name, username, binary = joined
+            conn = Player(self.transport, self.addr, get_upstream(room_name), username, binary)
+        self.transport.set_protocol(conn)
+        rest = self.framer.pending()
+        if rest:
+            conn.data_received(rest)
+
+    def connection_lost(self, exc):
+        self.join_timer.cancel()
+
+
+class Player(asyncio.Protocol):
+    """A player connected to this relay; answers go upstream under its username."""
+
+    def __init__(self, transport, addr, upstream, username, binary):
+        self.transport = transport
+        nodelay(transport)
+        self.name = f"player {username}"
+        self.upstream = upstream
+        self.username = username
+        self.binary = binary
+        self.framer = LineBuffer(MAX_LINE)
+        self.decoder = wire.FrameDecoder(MAX_LINE) if binary else None
+        self.last_seen = time.perf_counter()
+        log.info("👤 %s joined room %s from %s", username, upstream.room, addr)
+        upstream.join(username, self)
+
+    def encode(self, line):
+        """Upstream text line -> frame in this player's protocol."""
+        if not self.binary:
+            return (line + "\n").encode()
+        kind, args = wire.decode_text(line)
+        return b"" if kind == "unknown" else wire.encode_binary(kind, *args)
+
+    def deliver(self, line, payload):
+        if not queue(self.transport, self.encode(payload), MAX_OUTBOUND):
+            too_slow(self.transport, self.name)
+
+    def kick(self, username):
+        disconnects.inc(label="kicked")
+        outbox.close(self.transport)
+
+    def reap(self):
+        """Silent for IDLE_TIMEOUT: abort the connection and tell upstream the player left."""
+        self.transport.abort()
+        self.upstream.leave(self.username, self)
+
+    def answer(self, option):
+        answers_forwarded.inc()
+        self.upstream.write(f"ranswer:{self.username}:{option}\n".encode())
+
+    def data_received(self, data):
+        self.last_seen = time.perf_counter()
+        try:
+            if self.decoder is not None:
+                for kind, args in self.decoder.feed(data):
+                    if kind == "answer":
+                        self.answer(args[0].strip())
+                return
+            for line in self.framer.feed(data):
+                if line.startswith("answer:"):
+                    self.answer(line.split(":", 1)[1].strip())
+        except (LineTooLong, wire.FrameTooLarge):
+            disconnects.inc(label="line too long")
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        self.upstream.leave(self.username, self)
+
+
+class Link(asyncio.Protocol):
+    """A relay below this one: its rjoin/ranswer/rleave lines go upstream as they are, and it
+    gets one copy of every broadcast plus the to:/kick: lines of its players."""
+
+    def __init__(self, transport, addr, upstream):
+        self.transport = transport
+        nodelay(transport)
+        self.addr = addr
+        self.name = f"relay {addr}"
+        self.upstream = upstream
+        self.framer = LineBuffer(MAX_LINE)
+        self.usernames = set()  # players reached through this link
+        self.last_seen = time.perf_counter()
+        upstream.links.add(self)
+        log.info("🔀 Relay %s linked to room %s", addr, upstream.room)
+
+    def deliver(self, line, payload):
+        if not queue(self.transport, (line + "\n").encode(), RELAY_MAX_OUTBOUND):
+            too_slow(self.transport, self.name)
+
+    def kick(self, username):
+        self.usernames.discard(username)
+        queue(self.transport, f"kick:{username}\n".encode(), RELAY_MAX_OUTBOUND)
+
+    def reap(self):
+        """Silent for IDLE_TIMEOUT: abort the link; its players leave upstream."""
+        self.transport.abort()
+        self.unlink()
+
+    def data_received(self, data):
+        self.last_seen = time.perf_counter()
+        try:
+            lines = self.framer.feed(data)
+        except LineTooLong:
+            disconnects.inc(label="line too long")
+            self.transport.close()
+            return
+        up = self.upstream
+        for line in lines:
+            kind, _, rest = line.strip().partition(":")
+            if kind == "ranswer":
+                if up.routes.get(rest.partition(":")[0]) is self:
+                    answers_forwarded.inc()
+                    up.write((line + "\n").encode())
+            elif kind == "rjoin" and rest and ":" not in rest:
+                self.usernames.add(rest)
+                up.join(rest, self)
+            elif kind == "rleave":
+                self.usernames.discard(rest)
+                up.leave(rest, self)
+
+    def unlink(self):
+        if self in self.upstream.links:
+            self.upstream.links.discard(self)
+            for username in self.usernames:
+                self.upstream.leave(username, self)
+            log.info("🔀 Relay %s unlinked from room %s", self.addr, self.upstream.room)
+
+    def connection_lost(self, exc):
+        self.unlink()
+
+
+# --- heartbeats -------------------------------------------------------------
+
+def start_heartbeat():
+    """Arm the heartbeat tick, every HEARTBEAT seconds on the event loop's timer heap (0: off)."""
+    if HEARTBEAT > 0:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + HEARTBEAT
+        loop.call_at(when, check_idle, when)
+
+
+def check_idle(when):
+    """Heartbeat tick: ping the players and links that have sent nothing for HEARTBEAT seconds
+    and reap the ones silent for IDLE_TIMEOUT."""
+    now = time.perf_counter()
+    token = f"{now:.6f}"
+    frames = (wire.encode_text("ping", token), wire.encode_binary("ping", token))
+    idle = []
+    sent = 0
+    for up in upstreams.values():
+        for player in up.players:
+            quiet = now - player.last_seen
+            if quiet >= IDLE_TIMEOUT:
+                idle.append(player)
+            elif quiet >= HEARTBEAT and queue(player.transport, frames[player.binary], MAX_OUTBOUND):
+                sent += 1
+        for link in up.links:
+            quiet = now - link.last_seen
+            if quiet >= IDLE_TIMEOUT:
+                idle.append(link)
+            elif quiet >= HEARTBEAT and queue(link.transport, frames[0], RELAY_MAX_OUTBOUND):
+                sent += 1
+    pings.inc(sent)
+    if idle:
+        reap(idle)
+    asyncio.get_running_loop().call_at(when + HEARTBEAT, check_idle, when + HEARTBEAT)
+
+
+def reap(idle):
+    """Close up to REAP_BATCH idle connections and leave the rest to the next loop pass."""
+    batch, rest = idle[:REAP_BATCH], idle[REAP_BATCH:]
+    counts = {"player": 0, "relay": 0}
+    for conn in batch:
+        if conn.transport.is_closing():
+            continue
+        conn.reap()
+        counts["relay" if isinstance(conn, Link) else "player"] += 1
+    if counts["player"] or counts["relay"]:
+        disconnects.inc(counts["player"] + counts["relay"], label="idle")
+    log.info("🧹 Reaped %d idle players and %d relay links (%d more next pass)",
+             counts["player"], counts["relay"], len(rest))
+    if rest:
+        asyncio.get_running_loop().call_soon(reap, rest)
+
+
+async def main(host=HOST, port=PORT, upstream=UPSTREAM, metrics_port=METRICS_PORT, backlog=BACKLOG):
+    global upstream_addr
+    upstream_addr = parse_addr(upstream)
+    loop = asyncio.get_running_loop()
+    if metrics_port:
+        metrics.serve(METRICS, "127.0.0.1", metrics_port)
+    server = await loop.create_server(Handshake, host, port, reuse_address=True, backlog=backlog)
+    start_heartbeat()
+    log.info("🎮 Relay running on %s:%d, upstream %s:%d", host, port, *upstream_addr)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TCP quiz relay (edge fan-out node)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--upstream", default=UPSTREAM, help="host:port of the game server or a parent relay")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT (0 = off)")
+    parser.add_argument("--backlog", type=int, default=BACKLOG)
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT,
+                        help="seconds of silence before a player or link is pinged (0 = no pings, no reaping)")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds of silence (no answer, no pong) before a player or link is reaped")
+    parser.add_argument("--log-level", default=LOG_LEVEL,
+                        choices=["debug", "info", "warning", "error", "off"])
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    HEARTBEAT = args.heartbeat
+    IDLE_TIMEOUT = args.idle_timeout
+    try:
+        asyncio.run(main(args.host, args.port, args.upstream, args.metrics_port, args.backlog))
+    except KeyboardInterrupt:
+        pass
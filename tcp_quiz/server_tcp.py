@@ -1,259 +1,1479 @@
 # server_tcp.py
 """
 TCP quiz server (central broadcast model).
-Messages are newline-delimited (DELIM = '\n') and simple string commands:
+A single asyncio event loop accepts players, reads their answers and broadcasts
+to everyone; there is no accept thread and no per-pass select() rebuild.
+Players are grouped into named rooms, each with its own question set, timer
+and scores; --room-category ROOM=CATEGORY draws a room's questions from one
+bank category. `join:<username>` joins DEFAULT_ROOM, so single-room clients are
+unchanged. With --workers N, a front acceptor reads each join line and passes
+the connection (SCM_RIGHTS) to the worker process that owns the room.
+Writes are coalesced per connection (coalesce.py): the frames one game tick
+produces for a player, e.g. feedback, leaderboard delta and rank when a
+question closes, leave in a single send() on a TCP_NODELAY socket.
+With --scoring speed, a question stays open until its deadline (or until every
+player has answered) and every answer is scored at once by speed and streak
+(quiz_common/scoring.py) instead of POINTS for the first correct one.
+Each game's per-question analytics (answers per option, correctness, response
+time quantiles; quiz_common/analytics.py) are written to ANALYTICS as JSON and
+CSV at quiz_over and shown by the `analytics` host command.
+A restart does not have to drop anyone: `server_tcp.py --takeover` connects to
+the running server's HANDOFF socket and receives its listening socket, every
+connection (SCM_RIGHTS) and a snapshot of rooms, players, scores and game
+positions (handoff.py), then carries on where the old process stopped.
+Half-open connections (a NAT timeout, a laptop closed mid-game) never fail a
+read, so every HEARTBEAT seconds a connection that has sent nothing for that
+long is pinged, and one silent for IDLE_TIMEOUT seconds (no answer, no pong)
+is reaped, in batches of REAP_BATCH per loop pass. --keepalive also has the
+kernel probe idle sockets.
+Counters and histograms are shown by the `stats` host command and served as
+Prometheus text on --metrics-port; per-message output is DEBUG-level logging.
+Messages are newline-delimited (DELIM = '\n') and simple string commands.
+A client that joins with join+bin: instead of join: switches to the
+length-prefixed binary framing in wire.py for everything after its join line.
+A relay (relay.py) joins with relay:<room> and then carries many players of
+that room over its one connection. Broadcasts are written to it once and it
+fans them out to its own players, so fan-out can spread over processes and
+machines in a tree (a relay can sit under another relay).
 - Client -> Server:
-    join:<username>\n
+    join:<username>\n  or  join:<room>:<username>\n
     answer:<option>\n     (option is exact option string as sent in question)
+    pong:<token>\n        (reply to ping, token unchanged)
 - Server -> Client:
     welcome:<msg>\n
     start_quiz\n
     question:<question_text>|<opt1>|<opt2>|... \n
     feedback:<text>\n
-    leaderboard:user1:pts1|user2:pts2|...\n
+    leaderboard_top:user1:pts1|user2:pts2|...\n     (full top-K snapshot, rank order)
+    leaderboard_delta:user1:pts1|user2:-|...\n    (top-K changes; '-' = left the top-K)
+    rank:<rank>:<points>:<players>\n              (per player, only when it changed)
     quiz_over:<text>\n
+    ping:<token>\n        (heartbeat to a connection that has been quiet for HEARTBEAT seconds)
+- Relay -> Server (after relay:<room>\n):
+    rjoin:<username>\n  ranswer:<username>:<option>\n  rleave:<username>\n  pong:<token>\n
+- Server -> Relay:
+    every broadcast line above, unchanged
+    to:<username>:<line>\n    (welcome, rank, error, ... for one relayed player)
+    kick:<username>\n         (the server dropped that player, e.g. taken over)
 """
 
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
 import socket
+import sys
 import threading
 import time
-import select
+import zlib
+from collections import deque
+
+import handoff
+import wire
+from coalesce import WriteCoalescer, keepalive, nodelay
+from framing import LineBuffer, LineTooLong
+from leaderboard import RankedScores
+from players import PlayerRegistry
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from quiz_common import metrics
+from quiz_common.analytics import GameAnalytics
+from quiz_common.journal import Journal
+from quiz_common.players import PlayerTable
+from quiz_common.questions import FRAMES, QuestionBank
+from quiz_common.scoring import AnswerBatch
 
 HOST = "127.0.0.1"   # set to 0.0.0.0 to listen on all interfaces
 PORT = 8888
 DELIM = "\n"
 QUESTION_TIME = 20  # seconds per question
+QUESTION_GAP = 1  # seconds between a question closing and the next one opening
 POINTS = 10
+SCORING = "first"  # "first": POINTS for the first correct answer; "speed": every answer, by speed and streak
+JOIN_TIMEOUT = 5.0  # seconds a new connection has to send its join line
+HEARTBEAT = 15.0  # seconds: ping a player or relay link quiet this long (also the reaper's period); 0 = off
+IDLE_TIMEOUT = 60.0  # seconds without a byte from a player or relay link (answers, pongs) before it is reaped
+REAP_BATCH = 500  # idle connections closed per event-loop pass; the rest follow on the next passes
+KEEPALIVE = 0  # >0: TCP keepalive after this many idle seconds, probing every KEEPALIVE_INTERVAL s; 0 = OS default
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_PROBES = 3  # unanswered probes before the kernel resets the connection
+BACKLOG = 1024      # listen() backlog: connections the kernel queues during a join storm (capped by somaxconn)
+JOIN_RATE_WINDOW = 10.0  # seconds of joins averaged by the quiz_joins_per_second gauge
+MAX_LINE = 1024     # longest join/answer line a client may send (bytes)
+MAX_OUTBOUND = 64 * 1024         # unsent bytes allowed to queue up per client
+RELAY_MAX_OUTBOUND = 1024 * 1024  # the same for a relay link, which carries many players
+SLOW_CLIENT_POLICY = "disconnect"  # "drop" frames or "disconnect" clients over MAX_OUTBOUND
+LEADERBOARD_TOP_K = 10
+DEFAULT_ROOM = "main"
+WORKERS = 0         # >0: run rooms in this many worker processes behind a front acceptor
+METRICS_PORT = 9888  # Prometheus text on 127.0.0.1 (workers use METRICS_PORT + 1 + i); 0 = off
+LOG_LEVEL = "info"   # debug logs every frame; "off" silences the server log
+QUESTION_BANK = "questions.txt"  # JSON-lines bank, relative to this file (see quiz_common/questions.py)
+QUESTIONS_PER_GAME = 10  # sampled per game; smaller banks are played whole, in file order
+JOURNAL = "scores.journal"  # score journal, relative to this file (workers add .w<i>); "" = off
+ANALYTICS = "analytics"  # per-game question analytics (<room>-<time>.json/.csv), relative to this file; "" = off
+HANDOFF = "server_tcp.handoff"  # Unix socket a replacement server (--takeover) connects to, relative to this file; "" = off
+HANDOFF_DRAIN = 2.0  # seconds queued writes get to drain before a connection is handed over (else it is closed)
 
-clients = {}   # username -> socket
-scores = {}    # username -> int
-lock = threading.Lock()
-quiz_started = False
+log = logging.getLogger("server_tcp")
 
-# Example questions; you can load from file instead
-questions = [
-    {"q": "What is 2 + 2?", "options": ["2", "3", "4", "5"], "a": "4"},
-    {"q": "Capital of France?", "options": ["Paris", "London", "Berlin", "Rome"], "a": "Paris"},
-    {"q": "Python is a ____ language?", "options": ["Snake", "Programming", "Car", "Fruit"], "a": "Programming"},
-]
+_bank = None
+listening = None  # asyncio Server accepting players (single-process mode)
+heartbeat = None  # pending heartbeat tick (asyncio.TimerHandle)
+metrics_server = None  # Prometheus HTTP server, stopped while handing over
+journal = None  # quiz_common.journal.Journal: scores and game position survive a restart
+room_categories = {}  # room name -> bank category; rooms not listed sample the whole bank
 
+rooms = {}  # room name -> Room (rooms owned by this process)
+game_analytics = {}  # room name -> GameAnalytics of its running or last game (kept after the room closes)
 
-def broadcast_line(text):
-    """Send text + DELIM to all connected clients, removing dead sockets."""
-    to_remove = []
-    with lock:
-        for user, conn in list(clients.items()):
-            try:
-                conn.sendall((text + DELIM).encode())
-            except Exception:
-                to_remove.append(user)
-        for u in to_remove:
-            print(f"🧹 Removing disconnected client: {u}")
-            try:
-                clients[u].close()
-            except:
-                pass
-            clients.pop(u, None)
-            scores.pop(u, None)
+METRICS = metrics.Registry()
+players_connected = METRICS.gauge("quiz_players_connected", "Joined players (direct and relayed)",
+                                  fn=lambda: sum(len(r.clients) for r in rooms.values()))
+relays_connected = METRICS.gauge("quiz_relays_connected", "Relay links",
+                                 fn=lambda: sum(len(r.relays) for r in rooms.values()))
+rooms_active = METRICS.gauge("quiz_rooms", "Rooms hosted by this process", fn=lambda: len(rooms))
+bytes_in = METRICS.counter("quiz_bytes_in_total", "Bytes read from players")
+bytes_out = METRICS.counter("quiz_bytes_out_total", "Bytes queued to players")
+frames_in = METRICS.counter("quiz_frames_in_total", "Lines read from players")
+frames_out = METRICS.counter("quiz_frames_out_total", "Lines queued to players")
+socket_writes = METRICS.counter("quiz_socket_writes_total", "Coalesced transport writes (one send() each)")
+loop_wakeups = METRICS.counter("quiz_loop_wakeups_total", "Event loop selector wakeups")
+broadcast_seconds = METRICS.histogram("quiz_broadcast_seconds", "Time to queue one broadcast to every player")
+answer_seconds = METRICS.histogram("quiz_answer_seconds", "Read-to-scored time of an answer line")
+scoring_seconds = METRICS.histogram("quiz_scoring_seconds", "Time to score and award all answers to a question")
+transition_lag = METRICS.histogram("quiz_transition_lag_seconds", "How late question deadlines and gaps fired")
+disconnects = METRICS.counter("quiz_disconnects_total", "Connections dropped, by reason", "reason")
+pings = METRICS.counter("quiz_pings_total", "Heartbeat pings sent to quiet connections")
+ping_rtt = METRICS.histogram("quiz_ping_rtt_seconds", "Heartbeat ping to pong time")
+reaped = METRICS.counter("quiz_reaped_total", "Idle connections closed by the heartbeat reaper", "kind")
+handshaking = set()  # connections accepted that have not sent their join line yet
+recent_joins = deque()  # perf_counter() of joins in the last JOIN_RATE_WINDOW
+joins = METRICS.counter("quiz_joins_total", "Join handshakes, by result", "result")
+join_seconds = METRICS.histogram("quiz_join_seconds", "Accept (or hand-off) to join line time of a handshake")
+joins_pending = METRICS.gauge("quiz_joins_pending", "Connections still in the join handshake",
+                              fn=lambda: len(handshaking))
 
 
-def accept_clients(server_sock):
-    """Accept clients and register username from initial 'join:username' message."""
-    while True:
+outbox = WriteCoalescer(on_write=socket_writes.inc)
+
+
+def queue_frame(transport, frame, limit):
+    """Add frame to the transport's batch for this tick. Returns False if the connection is
+    closing or would hold more than limit unsent bytes."""
+    if transport.is_closing():
+        return False
+    if transport.get_write_buffer_size() + outbox.buffered(transport) + len(frame) > limit:
+        return False
+    outbox.write(transport, frame)
+    return True
+
+
+def join_rate():
+    cutoff = time.perf_counter() - JOIN_RATE_WINDOW
+    while recent_joins and recent_joins[0] < cutoff:
+        recent_joins.popleft()
+    return round(len(recent_joins) / JOIN_RATE_WINDOW, 1)
+
+
+joins_per_second = METRICS.gauge("quiz_joins_per_second", "Successful joins per second, recent average",
+                                 fn=join_rate)
+
+
+def record_join(proto, result):
+    """Count one finished handshake on proto (Quiz- or RouterProtocol) and stop its join timer."""
+    proto.join_timer.cancel()
+    handshaking.discard(proto)
+    joins.inc(label=result)
+    if result == "ok":
+        now = time.perf_counter()
+        join_seconds.observe(now - proto.accepted)
+        recent_joins.append(now)
+
+
+def count_loop_wakeups(loop):
+    """Wrap the event loop's selector so every select() return is counted."""
+    selector = getattr(loop, "_selector", None)
+    if selector is None:
+        return
+    select = selector.select
+
+    def counting_select(timeout=None):
+        events = select(timeout)
+        loop_wakeups.inc()
+        return events
+
+    selector.select = counting_select
+
+
+FRAMES["tcp_bin"] = lambda q: wire.encode("question", q["q"], q["options"], binary=True)
+
+
+def parse_join(line):
+    """'join[+bin]:<username>' or 'join[+bin]:<room>:<username>' -> (room, username, binary),
+    else None."""
+    if line.startswith("join:"):
+        binary = False
+    elif line.startswith("join+bin:"):
+        binary = True
+    else:
+        return None
+    rest = line.split(":", 1)[1]
+    if ":" in rest:
+        room, username = rest.split(":", 1)
+        return room.strip() or DEFAULT_ROOM, username.strip(), binary
+    return DEFAULT_ROOM, rest.strip(), binary
+
+
+def parse_relay(line):
+    """'relay:<room>' -> room, else None."""
+    if not line.startswith("relay:"):
+        return None
+    return line.split(":", 1)[1].strip() or DEFAULT_ROOM
+
+
+def question_bank():
+    """The shared QuestionBank, opened (memory-mapped) on first use."""
+    global _bank
+    if _bank is None:
+        _bank = QuestionBank(os.path.join(os.path.dirname(os.path.abspath(__file__)), QUESTION_BANK))
+    return _bank
+
+
+def open_journal(path):
+    """Open (and recover from) the score journal at path, relative to this file."""
+    global journal
+    if not path:
+        return
+    journal = Journal(os.path.join(os.path.dirname(os.path.abspath(__file__)), path))
+    log.info("📒 Score journal %s: %d rooms recovered", journal.path, len(journal.state))
+    for name, saved in journal.state.items():
+        if saved["questions"] is not None and name not in rooms:  # not one handed over running
+            log.info("♻️ %s was at question %d of %d; `start %s` resumes it",
+                     name, saved["position"] + 1, len(saved["questions"]), name)
+
+
+def close_journal():
+    global journal
+    if journal is not None:
+        journal.close()
+        journal = None
+
+
+def get_room(name):
+    room = rooms.get(name)
+    if room is None:
+        room = rooms[name] = Room(name, room_categories.get(name))
+    return room
+
+
+class Room:
+    """One game: its players, ranked scores, question set and quiz task."""
+
+    def __init__(self, name, category=None):
+        self.name = name
+        self.category = category  # bank category this room draws questions from
+        self.players = PlayerTable()  # id <-> username, points; players who leave keep their points
+        self.clients = PlayerRegistry(self.players)  # connected ids -> QuizProtocol or RelayedPlayer
+        self.relays = set()  # RelayLinks: each gets one copy of every broadcast
+        self.scores = RankedScores(self.players.points)  # connected ids, ranked
+        self.resume = None  # (question list, position) of a game interrupted by a restart
+        self.last_top = {}  # top-K as last sent to clients: id -> points
+        self.quiz_started = False
+        self.question_list = None  # bank question indexes of the running (or last) game
+        self.questions = None  # iterator over question_list from the next question on
+        self.current = None  # open question: {"correct", "text", "options", "first_correct"}
+        self.batch = AnswerBatch(POINTS, QUESTION_TIME) if SCORING == "speed" else None  # answers to score at close
+        self.waiting = None  # speed scoring: connected players yet to answer the open question (None: recount)
+        self.analytics = None  # GameAnalytics of the running (or last) game
+        self.timer = None  # pending deadline or gap (asyncio.TimerHandle)
+        self.position = 0  # index of the open question in the game's list
+        saved = journal.room(name) if journal is not None else None
+        if saved is not None:
+            for username, points in saved["scores"].items():
+                self.players.intern(username, points)
+            if saved["questions"] is not None:
+                self.resume = (saved["questions"], saved["position"])
+
+    def snapshot(self, deadline):
+        """JSON-able state for a replacement server process; deadline is the event-loop time of
+        the pending question deadline or gap (None if the room is not playing)."""
+        return {"name": self.name, "category": self.category,
+                "names": self.players.names, "points": self.players.points.tolist(),
+                "ranked": [pid for pid, _ in self.scores.top()], "last_top": list(self.last_top.items()),
+                "quiz_started": self.quiz_started, "resume": self.resume,
+                "questions": self.question_list, "position": self.position, "current": self.current,
+                "deadline": deadline, "batch": self.batch.snapshot() if self.batch is not None else None,
+                "analytics": self.analytics.snapshot() if self.analytics is not None else None}
+
+    @classmethod
+    def restored(cls, snap):
+        """The room snapshot() described, with no connections and no timer yet (resume_timer())."""
+        room = cls(snap["name"], snap["category"])
+        room.players = PlayerTable()
+        for username, points in zip(snap["names"], snap["points"]):
+            room.players.intern(username, points)
+        room.clients = PlayerRegistry(room.players)
+        room.scores = RankedScores(room.players.points)
+        for pid in snap["ranked"]:  # in rank order, so ties keep their order
+            room.scores.add(pid)
+        room.last_top = dict(snap["last_top"])
+        room.quiz_started = snap["quiz_started"]
+        room.resume = snap["resume"]
+        room.question_list, room.position = snap["questions"], snap["position"]
+        if room.question_list is not None:
+            room.questions = iter(room.question_list[room.position:])
+        room.current = snap["current"]
+        if room.batch is not None and snap["batch"] is not None:
+            room.batch.restore(snap["batch"])
+        if snap["analytics"] is not None:
+            room.analytics = game_analytics[room.name] = GameAnalytics()
+            room.analytics.restore(snap["analytics"])
+        return room
+
+    def resume_timer(self, when):
+        """Re-arm the question deadline or gap that was pending at `when` (None: none was)."""
+        if when is not None:
+            self.schedule(when, self.close_question if self.current is not None else self.open_question)
+
+    def record(self, op, **fields):
+        if journal is not None:
+            journal.append(op, self.name, **fields)
+
+    def close(self):
+        """Forget an empty room. Its journalled scores stay, so a player who comes back
+        (e.g. after a connection blip between games) gets their points back; `reset` drops them."""
+        rooms.pop(self.name, None)
+
+    def close_if_idle(self):
+        if not self.clients and not self.relays and not self.quiz_started:
+            self.close()
+
+    def named(self, entries):
+        """(id, points) pairs -> (username, points) pairs, for the wire and the console."""
+        names = self.players.names
+        return [(names[pid], points) for pid, points in entries]
+
+    def add_player(self, username, conn):
+        """Connect username as conn (taking over its old connection); returns its player id."""
+        pid = conn.pid = self.players.intern(username)
+        old = self.clients.add(pid, conn)
+        if old is not None:
+            disconnects.inc(label="takeover")
+            old.transport.close()
+        elif self.waiting is not None and not self.batch.has_answered(pid):
+            self.waiting += 1
+        self.scores.add(pid)
+        self.record("join", user=username)
+        log.info("👤 %s joined room %s from %s", username, self.name, conn.addr)
+        conn.send("welcome", f"Connected as {username}")
+        conn.send("leaderboard_top", self.named(self.last_top.items()))
+        return pid
+
+    def remove_player(self, pid, conn, reason):
+        """Single removal path: drop pid from clients and the ranking while conn is still its
+        connection. Its points stay in the table for a rejoin."""
+        if self.clients.remove(pid, conn) is None:
+            return False
+        self.scores.remove(pid)
+        disconnects.inc(label=reason)
+        log.info("🧹 Removed %s from %s (%s)", self.players.names[pid], self.name, reason)
+        if not conn.transport.is_closing():
+            conn.transport.close()
+        if self.current is not None and self.batch is not None:
+            if self.waiting is not None and not self.batch.has_answered(pid):
+                self.waiting -= 1
+            self.close_if_all_answered()
+        self.close_if_idle()
+        return True
+
+    def handle_answer(self, pid, ans, received):
+        """An answer read at perf_counter() time `received`."""
+        log.debug("📨 Received answer from %s: %s", self.players.names[pid], ans)
+        current = self.current
+        if current is None:
+            return
+        options = current["options"]
+        option = options.index(ans) if ans in options else -1
+        self.analytics.answer(pid, option, received)
+        if self.batch is not None:
+            if self.batch.add(pid, option, received) and self.waiting is not None:
+                self.waiting -= 1
+            self.close_if_all_answered()
+            return
+        if ans == current["correct"] and current["first_correct"] is None:
+            current["first_correct"] = pid
+            self.scores.award(pid, POINTS)
+            self.record("award", user=self.players.names[pid], points=POINTS)
+            self.timer.cancel()
+            self.close_question(asyncio.get_running_loop().time())
+
+    def close_if_all_answered(self):
+        """Speed scoring: close the open question early once every connected player has answered.
+        Answers of players who left since do not count for the ones still here."""
+        if self.waiting is None:  # restored by a handoff: its connections were adopted one by one
+            self.waiting = sum(1 for pid, _ in self.clients.items() if not self.batch.has_answered(pid))
+        if self.waiting <= 0:
+            self.timer.cancel()
+            self.close_question(asyncio.get_running_loop().time())
+
+    def broadcast(self, kind, *args):
+        """Encode a message once per protocol and queue it on every client without blocking.
+        Dead connections are removed; clients over MAX_OUTBOUND are handled per
+        SLOW_CLIENT_POLICY. Returns the fan-out time in seconds."""
+        return self.broadcast_frames(wire.encode_text(kind, *args), wire.encode_binary(kind, *args))
+
+    def broadcast_frames(self, text_frame, binary_frame):
+        """broadcast() for already encoded frames (e.g. a cached question)."""
+        frames = (text_frame, binary_frame)
+        start = time.perf_counter()
+        behind = []
+        sent_frames = sent_bytes = 0
+        for pid, proto in self.clients.items():
+            if proto.link is not None:
+                continue  # gets the copy sent to its relay below
+            frame = frames[proto.binary]
+            if proto.send_frame(frame):
+                sent_frames += 1
+                sent_bytes += len(frame)
+            else:
+                behind.append((pid, proto))
+        links_behind = []
+        for link in self.relays:
+            if link.send_frame(text_frame):
+                sent_frames += 1
+                sent_bytes += len(text_frame)
+            else:
+                links_behind.append(link)
+        elapsed = time.perf_counter() - start
+        sent = len(self.clients) - len(behind)
+        frames_out.inc(sent_frames)
+        bytes_out.inc(sent_bytes)
+        broadcast_seconds.observe(elapsed)
+        for link in links_behind:
+            link.fell_behind()
+        for pid, proto in behind:
+            if proto.transport.is_closing():
+                self.remove_player(pid, proto, "disconnected")
+            elif SLOW_CLIENT_POLICY == "disconnect":
+                self.remove_player(pid, proto, "slow client")
+            else:
+                proto.dropped += 1
+                log.warning("⚠ Dropped frame for slow client %s (%d so far)",
+                            self.players.names[pid], proto.dropped)
+        log.debug("📡 Fan-out to %d clients in %s took %.2f ms", sent, self.name, elapsed * 1000)
+        return elapsed
+
+    def publish_leaderboard(self):
+        """Broadcast the top-K entries that changed since the last publish, then send each
+        player whose standing changed a rank: line. Returns the number of changed entries."""
+        top = dict(self.scores.top(LEADERBOARD_TOP_K))
+        changed = [(pid, p) for pid, p in top.items() if self.last_top.get(pid) != p]
+        changed += [(pid, None) for pid in self.last_top if pid not in top]
+        self.last_top = top
+        if changed:
+            self.broadcast("leaderboard_delta", self.named(changed))
+        total = len(self.scores)
+        points = self.players.points
+        ranks = self.scores.ranks()
+        for pid, proto in self.clients.items():
+            standing = (ranks[points[pid]], points[pid], total)
+            if standing != proto.last_rank:
+                proto.last_rank = standing
+                proto.send("rank", *standing)
+        return len(changed)
+
+    def start(self):
+        if self.quiz_started:
+            log.warning("⚠ Quiz already running in %s.", self.name)
+            return False
+        self.quiz_started = True
+        self.analytics = game_analytics[self.name] = GameAnalytics()
+        log.info("🚀 Quiz started in %s.", self.name)
+        self.broadcast("start_quiz")
+        self.last_top = dict(self.scores.top(LEADERBOARD_TOP_K))
+        self.broadcast("leaderboard_top", self.named(self.last_top.items()))
+        if self.resume is not None:
+            questions, self.position = self.resume
+            self.resume = None
+            log.info("♻️ Resuming %s at question %d of %d.", self.name, self.position + 1, len(questions))
+        else:
+            questions, self.position = question_bank().sample(QUESTIONS_PER_GAME, self.category), 0
+            self.record("game", questions=questions)
+        self.question_list = questions
+        self.questions = iter(questions[self.position:])
+        self.open_question(asyncio.get_running_loop().time())
+        return True
+
+    def schedule(self, when, callback):
+        """Run callback(when) at event-loop time `when`. The loop's monotonic timer heap drives
+        every room's deadlines and gaps, so nothing polls; each transition's lateness is recorded."""
+        loop = asyncio.get_running_loop()
+        self.timer = loop.call_at(when, self._fire, loop, when, callback)
+
+    @staticmethod
+    def _fire(loop, when, callback):
+        transition_lag.observe(loop.time() - when)
+        callback(when)
+
+    def open_question(self, when):
+        """Broadcast the next question and schedule its deadline, or end the game."""
+        bank = question_bank()
+        qid = next(self.questions, None)
+        if qid is None:
+            self.finish()
+            return
+        q = bank.get(qid)
+        self.record("question", index=self.position)
+        self.position += 1
+        self.broadcast_frames(bank.frame(qid, "tcp"), bank.frame(qid, "tcp_bin"))
+        log.info("📤 Broadcasted question in %s: %s", self.name, q["q"])
+        self.current = {"correct": q["a"], "text": q["q"], "options": q["options"], "first_correct": None}
+        options = q["options"]
+        correct = options.index(q["a"]) if q["a"] in options else -1
+        opened = time.perf_counter()
+        self.analytics.open(q["id"], q["q"], options, correct, opened)
+        if self.batch is not None:
+            self.batch.open(len(options), correct, opened)
+            self.waiting = len(self.clients)
+        self.schedule(when + QUESTION_TIME, self.close_question)
+
+    def close_question(self, when):
+        """Deadline reached, first correct answer or (speed scoring) all answered: feedback,
+        leaderboard, then the gap."""
+        current, self.current = self.current, None
+        self.analytics.close()
+        first_correct = current["first_correct"]
+        if self.batch is not None:
+            self.score_answers(current)
+        elif first_correct is not None:
+            first_correct = self.players.names[first_correct]
+            self.broadcast("feedback", f"{first_correct} answered first and got it right!")
+            log.info("🏆 First correct: %s", first_correct)
+        else:
+            self.broadcast("feedback", f"No correct answers. Correct was: {current['correct']}")
+            log.info("⏱ No correct answers for: %s", current["text"])
+
+        changed = self.publish_leaderboard()
+        log.debug("📊 Broadcasted leaderboard: %d top-%d changes", changed, LEADERBOARD_TOP_K)
+        self.schedule(when + QUESTION_GAP, self.open_question)
+
+    def score_answers(self, current):
+        """Speed scoring: award every answer to the closed question in one batch."""
+        start = time.perf_counter()
+        scored = self.batch.close()
+        names = self.players.names
+        self.scores.award_many(scored.awards)
+        if scored.awards:
+            self.record("awards", points={names[pid]: points for pid, points in scored.awards})
+        counts = ", ".join(f"{option} {n}" for option, n in zip(current["options"], scored.counts))
+        if scored.awards:
+            pid, points = scored.awards[0]
+            self.broadcast("feedback", f"{len(scored.awards)} of {scored.answers} answered right, "
+                                       f"{names[pid]} first (+{points}). Answers: {counts}")
+        else:
+            self.broadcast("feedback", f"No correct answers. Correct was: {current['correct']}. Answers: {counts}")
+        scoring_seconds.observe(time.perf_counter() - start)
+        log.info("🏆 %d of %d answers correct for: %s", len(scored.awards), scored.answers, current["text"])
+
+    def export_analytics(self):
+        if not ANALYTICS:
+            return
+        name = f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}"
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ANALYTICS, name)
         try:
-            conn, addr = server_sock.accept()
-            conn.setblocking(True)
-            # short initial recv to capture join message
-            try:
-                conn.settimeout(5.0)
-                raw = conn.recv(4096).decode()
-                conn.settimeout(None)
-                if not raw:
-                    conn.close()
-                    continue
-                line = raw.split(DELIM)[0].strip()
-                if line.startswith("join:"):
-                    username = line.split(":", 1)[1].strip()
-                    with lock:
-                        if username in clients:
-                            try:
-                                clients[username].close()
-                            except:
-                                pass
-                        clients[username] = conn
-                        scores.setdefault(username, 0)
-                    print(f"👤 {username} connected from {addr}")
-                    # send welcome
-                    try:
-                        conn.sendall((f"welcome:Connected as {username}" + DELIM).encode())
-                    except:
-                        pass
-                else:
-                    try:
-                        conn.sendall((f"error:expected join:<username>" + DELIM).encode())
-                    except:
-                        pass
-                    conn.close()
-            except Exception as e:
-                print("⚠ Error receiving join message:", e)
-                try:
-                    conn.close()
-                except:
-                    pass
-        except Exception as e:
-            print("⚠ Error accepting client:", e)
-            time.sleep(0.5)
-
-
-def quiz_loop():
-    """Centralized quiz loop that broadcasts questions and collects answers with select."""
-    global quiz_started
-    print("🚀 Quiz loop starting.")
-    quiz_started = True
-    broadcast_line("start_quiz")
-
-    for q in questions:
-        q_text = q["q"]
-        opts = q["options"]
-        correct = q["a"]
-
-        q_msg = f"question:{q_text}|{'|'.join(opts)}"
-        broadcast_line(q_msg)
-        print("📤 Broadcasted question:", q_msg)
-
-        deadline = time.time() + QUESTION_TIME
-        first_correct = None
-
-        while time.time() < deadline and first_correct is None:
-            with lock:
-                sockets = list(clients.values())
-            if not sockets:
-                print("⚠ No clients connected; waiting a bit...")
-                time.sleep(0.5)
-                continue
+            json_path, csv_path = self.analytics.export(path)
+        except OSError as e:
+            log.warning("⚠️ Could not write analytics for %s: %s", self.name, e)
+            return
+        log.info("📊 Question analytics for %s: %s, %s", self.name, json_path, csv_path)
 
-            timeout = max(0, deadline - time.time())
-            try:
-                readable, _, _ = select.select(sockets, [], [], timeout)
-            except Exception as e:
-                print("⚠ select error:", e)
+    def finish(self):
+        self.broadcast("quiz_over", "Thanks for playing!")
+        log.info("🏁 Quiz finished in %s.", self.name)
+        self.export_analytics()
+        self.quiz_started = False
+        self.timer = None
+        self.record("finish")
+        self.close_if_idle()
+
+
+class QuizProtocol(asyncio.Protocol):
+    """One player connection: the first line must be a join line, then answers, as
+    answer:<option> lines or, after join+bin:, binary answer frames. A relay:<room>
+    line hands the connection over to a RelayLink instead."""
+
+    __slots__ = ("transport", "addr", "username", "pid", "room", "framer", "binary", "decoder", "dropped",
+                 "last_rank", "accepted", "last_seen", "join_timer", "inherited")
+
+    link = None  # set on RelayedPlayer; a direct player gets broadcasts itself
+
+    def __init__(self, inherited=None):
+        self.inherited = inherited  # handoff_state() of this connection in the previous server process
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info("peername")
+        nodelay(transport)
+        if KEEPALIVE > 0:
+            keepalive(transport, KEEPALIVE, KEEPALIVE_INTERVAL, KEEPALIVE_PROBES)
+        self.username = None
+        self.pid = None  # the room's player id once joined
+        self.room = None
+        self.framer = LineBuffer(MAX_LINE)
+        self.binary = False
+        self.decoder = None  # wire.FrameDecoder once a binary client has joined
+        self.dropped = 0  # frames skipped under the "drop" policy
+        self.last_rank = None  # (rank, points, players) last sent
+        # the handshake is just this deadline plus the join line arriving in data_received:
+        # a slow or silent connection never holds up accepting or serving anyone else
+        self.accepted = self.last_seen = time.perf_counter()
+        handshaking.add(self)
+        loop = asyncio.get_running_loop()
+        self.join_timer = loop.call_later(JOIN_TIMEOUT, self.join_expired)
+        if self.inherited is not None:
+            state, self.inherited = self.inherited, None
+            self.resume(state)
+
+    def handoff_state(self):
+        """What a replacement server needs to carry on with this connection (see resume())."""
+        buffered = self.decoder.pending() if self.decoder is not None else self.framer.pending()
+        state = {"kind": "player", "pending": buffered.decode("latin-1")}
+        if self.username is not None:
+            state.update(room=self.room.name, username=self.username, pid=self.pid, binary=self.binary,
+                         dropped=self.dropped, last_rank=self.last_rank)
+        return state
+
+    def resume(self, state):
+        """Carry on with a connection handed over by the previous server process: a joined
+        player goes straight back into its room, a relay link gets its players back and a
+        connection still in its handshake just gets a fresh join deadline."""
+        pending = state["pending"].encode("latin-1")
+        if state["kind"] == "relay" or "username" in state:
+            self.join_timer.cancel()
+            handshaking.discard(self)
+        if state["kind"] == "relay":
+            link = RelayLink(self.transport, self.addr, rooms[state["room"]])
+            link.adopt(state)
+            self.transport.set_protocol(link)
+            if pending:
+                link.lines_received(pending)
+            return
+        if "username" in state:
+            self.room = rooms[state["room"]]
+            self.username, self.pid, self.binary = state["username"], state["pid"], state["binary"]
+            self.dropped = state["dropped"]
+            self.last_rank = tuple(state["last_rank"]) if state["last_rank"] else None
+            if self.binary:
+                self.decoder = wire.FrameDecoder(MAX_LINE)
+            self.room.clients.add(self.pid, self)
+        if pending:
+            self.data_received(pending)
+
+    def join_expired(self):
+        if self.username is None:
+            log.warning("⚠ No join message from %s; closing.", self.addr)
+            record_join(self, "timeout")
+            disconnects.inc(label="join timeout")
+            self.transport.close()
+
+    def reap(self):
+        """Silent for IDLE_TIMEOUT: abort (a half-open socket would never drain a close()) and
+        take the player out of its room."""
+        self.transport.abort()
+        if self.username is not None:
+            self.room.remove_player(self.pid, self, "idle")
+
+    def send_frame(self, frame):
+        """Queue an encoded frame; it is written with the rest of this tick's frames and the
+        transport drains it as the socket becomes writable. Returns False if the connection
+        is closing or already holds MAX_OUTBOUND unsent bytes."""
+        return queue_frame(self.transport, frame, MAX_OUTBOUND)
+
+    def send(self, kind, *args):
+        """Encode one message in this client's protocol and queue it."""
+        frame = wire.encode(kind, *args, binary=self.binary)
+        if not self.send_frame(frame):
+            return False
+        frames_out.inc()
+        bytes_out.inc(len(frame))
+        return True
+
+    def reject(self, reason, message):
+        disconnects.inc(label=reason)
+        self.send("error", message)
+        outbox.close(self.transport)
+
+    def data_received(self, data):
+        start = self.last_seen = time.perf_counter()
+        bytes_in.inc(len(data))
+        if self.decoder is not None:
+            self.binary_received(data, start)
+            return
+        try:
+            if self.username is None:
+                # read only the join line: a binary client's frames follow it
+                lines = self.framer.feed(data, limit=1)
+                if not lines:
+                    return
+                frames_in.inc()
+                self.handle_join(lines[0].strip())
+                if self.username is None or self.transport.is_closing():
+                    return
+                if self.decoder is not None:
+                    rest = self.framer.pending()
+                    self.framer.clear()
+                    if rest:
+                        self.binary_received(rest, start)
+                    return
+                data = b""
+            lines = self.framer.feed(data)
+        except LineTooLong:
+            log.warning("⚠ Line too long from %s; closing.", self.username or self.addr)
+            if self.username is None:
+                record_join(self, "rejected")
+            self.reject("line too long", "line too long")
+            return
+        frames_in.inc(len(lines))
+        for line in lines:
+            if self.transport.is_closing():
                 break
+            line = line.strip()
+            if line.startswith("answer:"):
+                self.room.handle_answer(self.pid, line.split(":", 1)[1].strip(), start)
+                answer_seconds.observe(time.perf_counter() - start)
+            elif line.startswith("pong:"):
+                pong_received(line[5:], start)
 
-            for s in readable:
-                try:
-                    data = s.recv(4096).decode()
-                    if not data:
-                        # socket closed by client -> remove
-                        uname = None
-                        with lock:
-                            for u, c in list(clients.items()):
-                                if c is s:
-                                    uname = u
-                                    break
-                            if uname:
-                                print(f"🧹 Client {uname} closed connection.")
-                                try:
-                                    clients[uname].close()
-                                except:
-                                    pass
-                                clients.pop(uname, None)
-                                scores.pop(uname, None)
-                        continue
-                    # may contain multiple messages
-                    for line in data.split(DELIM):
-                        if not line:
-                            continue
-                        if line.startswith("answer:"):
-                            ans = line.split(":", 1)[1].strip()
-                            username = None
-                            with lock:
-                                for u, c in clients.items():
-                                    if c is s:
-                                        username = u
-                                        break
-                            if username is None:
-                                continue
-                            print(f"📨 Received answer from {username}: {ans}")
-                            if ans == correct and first_correct is None:
-                                first_correct = username
-                                with lock:
-                                    scores[username] = scores.get(username, 0) + POINTS
-                                break
-                except Exception as e:
-                    print("⚠ Error reading socket:", e)
-                    # remove socket
-                    uname = None
-                    with lock:
-                        for u, c in list(clients.items()):
-                            if c is s:
-                                uname = u
-                                break
-                        if uname:
-                            try:
-                                clients[uname].close()
-                            except:
-                                pass
-                            clients.pop(uname, None)
-                            scores.pop(uname, None)
-
-        if first_correct:
-            broadcast_line(f"feedback:{first_correct} answered first and got it right!")
-            print(f"🏆 First correct: {first_correct}")
+    def binary_received(self, data, start):
+        try:
+            frames = self.decoder.feed(data)
+        except wire.FrameTooLarge:
+            log.warning("⚠ Frame too large from %s; closing.", self.username)
+            self.reject("frame too large", "frame too large")
+            return
+        frames_in.inc(len(frames))
+        for kind, args in frames:
+            if self.transport.is_closing():
+                break
+            if kind == "answer":
+                self.room.handle_answer(self.pid, args[0].strip(), start)
+                answer_seconds.observe(time.perf_counter() - start)
+            elif kind == "pong":
+                pong_received(args[0], start)
+
+    def handle_join(self, line):
+        relay_room = parse_relay(line)
+        if relay_room is not None:
+            record_join(self, "relay")
+            link = RelayLink(self.transport, self.addr, get_room(relay_room))
+            self.transport.set_protocol(link)
+            rest = self.framer.pending()
+            self.framer.clear()
+            if rest:
+                link.lines_received(rest)
+            return
+        joined = parse_join(line)
+        if joined is None:
+            record_join(self, "rejected")
+            self.reject("bad join", "expected join:<username>")
+            return
+        record_join(self, "ok")
+        room_name, self.username, self.binary = joined
+        if self.binary:
+            self.decoder = wire.FrameDecoder(MAX_LINE)
+        self.room = get_room(room_name)
+        self.room.add_player(self.username, self)
+
+    def connection_lost(self, exc):
+        self.join_timer.cancel()
+        handshaking.discard(self)
+        if self.username is not None:
+            self.room.remove_player(self.pid, self, "closed" if exc is None else "error")
+
+
+class RelayedPlayer:
+    """A player connected through a relay, standing in for its QuizProtocol in the Room.
+    Its own messages go up the link as to:<username>:<line>; broadcasts reach it
+    through the single copy the Room writes to the link."""
+
+    __slots__ = ("link", "username", "pid", "addr", "prefix", "dropped", "last_rank", "closed", "transport")
+
+    binary = False  # relay links speak the text protocol; the relay re-encodes for its players
+
+    def __init__(self, link, username):
+        self.link = link
+        self.username = username
+        self.pid = None  # set by Room.add_player
+        self.addr = link.addr
+        self.prefix = f"to:{username}:".encode()
+        self.dropped = 0
+        self.last_rank = None
+        self.closed = False
+        self.transport = self  # the Room closes and checks players through .transport
+
+    def is_closing(self):
+        return self.closed or self.link.transport.is_closing()
+
+    def close(self):
+        """Dropped by the server (taken over, slow): tell the relay to disconnect the player."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.link.players.get(self.username) is self:
+            del self.link.players[self.username]
+        if not self.link.transport.is_closing():
+            outbox.write(self.link.transport, b"kick:%s\n" % self.username.encode())
+
+    def send_frame(self, frame):
+        return not self.is_closing() and self.link.send_frame(self.prefix + frame)
+
+    def send(self, kind, *args):
+        frame = wire.encode_text(kind, *args)
+        if not self.send_frame(frame):
+            return False
+        frames_out.inc()
+        bytes_out.inc(len(self.prefix) + len(frame))
+        return True
+
+
+class RelayLink(asyncio.Protocol):
+    """Server end of a relay connection (relay.py), taken over from the QuizProtocol that read
+    its relay:<room> line. Reads rjoin/ranswer/rleave lines for the relay's players and
+    is sent one copy of every broadcast in the room."""
+
+    def __init__(self, transport, addr, room):
+        self.transport = transport
+        self.addr = addr
+        self.room = room
+        self.framer = LineBuffer(MAX_LINE)
+        self.players = {}  # username -> RelayedPlayer
+        self.dropped = 0  # broadcasts skipped under the "drop" policy
+        self.last_seen = time.perf_counter()
+        room.relays.add(self)
+        log.info("🔀 Relay %s linked to room %s", addr, room.name)
+
+    def send_frame(self, frame):
+        return queue_frame(self.transport, frame, RELAY_MAX_OUTBOUND)
+
+    def reap(self):
+        """Silent for IDLE_TIMEOUT: drop the link; connection_lost() removes its players."""
+        disconnects.inc(label="idle relay")
+        self.transport.abort()
+
+    def handoff_state(self):
+        return {"kind": "relay", "room": self.room.name, "pending": self.framer.pending().decode("latin-1"),
+                "dropped": self.dropped,
+                "players": [[p.username, p.pid, p.dropped, p.last_rank] for p in self.players.values()]}
+
+    def adopt(self, state):
+        """Take back the players this link carried in the previous server process."""
+        self.dropped = state["dropped"]
+        for username, pid, dropped, last_rank in state["players"]:
+            player = self.players[username] = RelayedPlayer(self, username)
+            player.pid, player.dropped = pid, dropped
+            player.last_rank = tuple(last_rank) if last_rank else None
+            self.room.clients.add(pid, player)
+
+    def fell_behind(self):
+        """A broadcast did not fit in RELAY_MAX_OUTBOUND: same policy as for a slow player."""
+        if self.transport.is_closing():
+            return
+        if SLOW_CLIENT_POLICY == "disconnect":
+            log.warning("⚠ Relay %s is too slow; dropping it and its %d players.", self.addr, len(self.players))
+            disconnects.inc(label="slow relay")
+            self.transport.close()
         else:
-            broadcast_line(f"feedback:No correct answers. Correct was: {correct}")
-            print("⏱ No correct answers for:", q_text)
+            self.dropped += 1
+            log.warning("⚠ Dropped frame for slow relay %s (%d so far)", self.addr, self.dropped)
+
+    def data_received(self, data):
+        self.last_seen = time.perf_counter()
+        bytes_in.inc(len(data))
+        self.lines_received(data)
+
+    def lines_received(self, data):
+        start = time.perf_counter()
+        try:
+            lines = self.framer.feed(data)
+        except LineTooLong:
+            log.warning("⚠ Line too long from relay %s; closing.", self.addr)
+            disconnects.inc(label="line too long")
+            self.transport.close()
+            return
+        frames_in.inc(len(lines))
+        for line in lines:
+            kind, _, rest = line.strip().partition(":")
+            if kind == "ranswer":
+                username, _, ans = rest.partition(":")
+                player = self.players.get(username)
+                if player is not None:
+                    self.room.handle_answer(player.pid, ans.strip(), start)
+                    answer_seconds.observe(time.perf_counter() - start)
+            elif kind == "rjoin":
+                self.join(rest)
+            elif kind == "rleave":
+                self.leave(rest, "closed")
+            elif kind == "pong":
+                pong_received(rest, start)
+
+    def join(self, username):
+        if not username or ":" in username:
+            return
+        self.leave(username, "rejoined")  # reconnected to the same relay: no kick for the new one
+        player = self.players[username] = RelayedPlayer(self, username)
+        joins.inc(label="relayed")
+        self.room.add_player(username, player)
 
-        # build leaderboard
-        with lock:
-            lb_parts = [f"{u}:{scores.get(u,0)}" for u in scores]
-        broadcast_line("leaderboard:" + ("|".join(lb_parts) if lb_parts else ""))
-        print("📊 Broadcasted leaderboard:", lb_parts)
+    def leave(self, username, reason):
+        player = self.players.pop(username, None)
+        if player is not None:
+            player.closed = True  # the relay already knows, so no kick
+            self.room.remove_player(player.pid, player, reason)
 
-        time.sleep(1)
+    def connection_lost(self, exc):
+        self.room.relays.discard(self)
+        for username in list(self.players):
+            self.leave(username, "relay lost")
+        log.info("🔀 Relay %s unlinked from room %s", self.addr, self.room.name)
+        self.room.close_if_idle()
 
-    broadcast_line("quiz_over:Thanks for playing!")
-    print("🏁 Quiz finished.")
-    quiz_started = False
+
+# --- heartbeats -------------------------------------------------------------
+
+def start_heartbeat():
+    """Arm the heartbeat tick, every HEARTBEAT seconds on the event loop's timer heap (0: off)."""
+    global heartbeat
+    if HEARTBEAT > 0:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + HEARTBEAT
+        heartbeat = loop.call_at(when, check_idle, when)
+
+
+def check_idle(when):
+    """Heartbeat tick: ping the direct players and relay links that have sent nothing for
+    HEARTBEAT seconds and reap the ones silent for IDLE_TIMEOUT. A relayed player is its
+    relay's to watch; here its link's liveness stands for it."""
+    global heartbeat
+    now = time.perf_counter()
+    token = f"{now:.6f}"  # the send time, so a pong gives the round trip
+    frames = (wire.encode_text("ping", token), wire.encode_binary("ping", token))
+    idle = []
+    sent = 0
+    for room in rooms.values():
+        for _, proto in room.clients.items():
+            if proto.link is not None:
+                continue
+            quiet = now - proto.last_seen
+            if quiet >= IDLE_TIMEOUT:
+                idle.append(proto)
+            elif quiet >= HEARTBEAT and proto.send_frame(frames[proto.binary]):
+                sent += 1
+        for link in room.relays:
+            quiet = now - link.last_seen
+            if quiet >= IDLE_TIMEOUT:
+                idle.append(link)
+            elif quiet >= HEARTBEAT and link.send_frame(frames[0]):
+                sent += 1
+    pings.inc(sent)
+    if idle:
+        reap(idle)
+    loop = asyncio.get_running_loop()
+    heartbeat = loop.call_at(when + HEARTBEAT, check_idle, when + HEARTBEAT)
 
 
-def host_control():
-    """Host console loop: start, players, scores, quit."""
-    global quiz_started
+def reap(idle):
+    """Close up to REAP_BATCH idle connections and leave the rest to the next loop pass, so a
+    mass timeout (a NAT dropping many players at once) does not stall everyone else."""
+    batch, rest = idle[:REAP_BATCH], idle[REAP_BATCH:]
+    counts = {"player": 0, "relay": 0}
+    for conn in batch:
+        if conn.transport.is_closing():
+            continue
+        conn.reap()
+        counts["relay" if isinstance(conn, RelayLink) else "player"] += 1
+    for kind, n in counts.items():
+        if n:
+            reaped.inc(n, label=kind)
+    log.info("🧹 Reaped %d idle players and %d relay links (%d more next pass)",
+             counts["player"], counts["relay"], len(rest))
+    if rest:
+        asyncio.get_running_loop().call_soon(reap, rest)
+
+
+def pong_received(token, received):
+    """A pong for the ping sent at perf_counter() time `token`, read at `received`."""
+    try:
+        ping_rtt.observe(received - float(token))
+    except ValueError:
+        pass
+
+
+def handle_command(cmd):
+    """Run one host console command against the rooms owned by this process."""
+    parts = cmd.split()
+    if not parts:
+        return
+    verb = parts[0]
+    name = parts[1] if len(parts) > 1 else DEFAULT_ROOM
+    if verb == "start":
+        get_room(name).start()
+    elif verb == "players":
+        room = rooms.get(name)
+        print(f"👥 Players ({name}):", room.clients.names() if room else [])
+    elif verb == "scores":
+        room = rooms.get(name)
+        print(f"🏆 Scores ({name}):", dict(room.named(room.scores.top())) if room else {})
+    elif verb == "analytics":
+        analytics = game_analytics.get(name)
+        if analytics is None:
+            print(f"📊 No game played in {name} yet.")
+        else:
+            print(f"📊 Questions ({name}):")
+            print("\n".join(analytics.table()) or "(none asked yet)")
+    elif verb == "reset":
+        room = rooms.get(name)
+        if room is not None and (room.clients or room.relays or room.quiz_started):
+            print(f"❌ {name} still has players; reset it once it is empty.")
+        else:
+            rooms.pop(name, None)
+            game_analytics.pop(name, None)
+            if journal is not None:
+                journal.append("reset", name)
+            print(f"🧽 Scores of {name} dropped.")
+    elif verb == "stats":
+        print(f"📈 Stats (pid {os.getpid()}):")
+        print(METRICS.summary())
+    elif verb == "rooms":
+        for room in rooms.values():
+            state = "running" if room.quiz_started else "waiting"
+            print(f"🏠 {room.name}: {len(room.clients)} players, {len(room.relays)} relays, {state}")
+    else:
+        print("❌ Unknown command.")
+
+
+def read_commands(loop):
+    """Host console lines, put on an asyncio.Queue by a daemon thread. It reads stdin with
+    os.read(), holding no lock of sys.stdin, so the event loop keeps serving players and a
+    read still pending when the server hands over does not hold up its exit. EOF reads as quit."""
+    queue = asyncio.Queue()
+
+    def read():
+        buf = b""
+        while True:
+            try:
+                chunk = os.read(0, 4096)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                loop.call_soon_threadsafe(queue.put_nowait, "quit")
+                return
+            *lines, buf = (buf + chunk).split(b"\n")
+            for line in lines:
+                loop.call_soon_threadsafe(queue.put_nowait, line.decode(errors="replace"))
+
+    threading.Thread(target=read, daemon=True).start()
+    return queue
+
+
+async def host_control(dispatch=handle_command):
+    """Host console loop: start/players/scores/analytics/reset [room], rooms, stats, quit."""
+    commands = read_commands(asyncio.get_running_loop())
     while True:
-        try:
-            cmd = input("Command (start/players/scores/quit): ").strip().lower()
-        except EOFError:
-            cmd = "quit"
-        if cmd == "start":
-            if not quiz_started:
-                t = threading.Thread(target=quiz_loop, daemon=True)
-                t.start()
-                print("🚀 Quiz started (thread).")
-            else:
-                print("⚠ Quiz already running.")
-        elif cmd == "players":
-            with lock:
-                print("👥 Players:", list(clients.keys()))
-        elif cmd == "scores":
-            with lock:
-                print("🏆 Scores:", scores)
-        elif cmd in ("quit", "exit"):
-            print("🛑 Exiting server (note: connected sockets may remain).")
+        print("Command (start/players/scores/analytics/reset [room], rooms, stats, quit): ", end="", flush=True)
+        cmd = (await commands.get()).strip().lower()
+        if cmd in ("quit", "exit"):
+            print("🛑 Exiting server (note: connected sockets may remain; --takeover keeps them).")
             break
-        else:
-            print("❌ Unknown command.")
+        dispatch(cmd)
 
 
-if __name__ == "__main__":
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((HOST, PORT))
-    server.listen()
-    print(f"🎮 TCP Server running on {HOST}:{PORT}")
-
-    threading.Thread(target=accept_clients, args=(server,), daemon=True).start()
-    host_control()
+# --- handoff to a replacement process ---------------------------------------
+
+def connections():
+    """Every open connection of this process: in the handshake, direct players and relay links."""
+    conns = [proto for proto in handshaking if isinstance(proto, QuizProtocol)]
+    for room in rooms.values():
+        conns += [proto for _, proto in room.clients.items() if proto.link is None]
+        conns += room.relays
+    return [proto for proto in conns if not proto.transport.is_closing()]
+
+
+async def serve_handoff(path, backlog):
+    """Wait on the HANDOFF socket for a replacement server; returns once one has taken over."""
+    loop = asyncio.get_running_loop()
+    server = handoff.listen(path)
+    log.info("🔁 Waiting for a replacement server on %s", path)
     try:
-        server.close()
-    except:
+        while True:
+            conn, _ = await loop.sock_accept(server)
+            with conn:
+                if await hand_over(conn, backlog):
+                    return
+    finally:
+        server.close()  # the path is left to the replacement, which has bound it again
+
+
+async def hand_over(conn, backlog):
+    """Pass the listening socket, every connection and the rooms' state to the replacement on
+    conn. Accepting, reading and the room timers stop first and queued writes get HANDOFF_DRAIN
+    seconds to drain. Returns True once the replacement has taken over; otherwise this process
+    carries on where it stopped."""
+    global listening, metrics_server
+    loop = asyncio.get_running_loop()
+    log.info("🔁 Replacement server connected; handing over.")
+    metrics_address = None
+    if metrics_server is not None:  # free the port for the replacement while players are still served
+        metrics_address = metrics_server.server_address
+        await loop.run_in_executor(None, metrics_server.shutdown)
+        metrics_server.server_close()
+        metrics_server = None
+    start = time.perf_counter()
+    spare = socket.socket(fileno=os.dup(listening.sockets[0].fileno()))  # keeps listening for a rollback
+    listening.close()
+    if heartbeat is not None:
+        heartbeat.cancel()
+    deadlines = {}
+    for room in rooms.values():
+        deadlines[room.name] = room.timer.when() if room.quiz_started and room.timer is not None else None
+        if room.timer is not None:
+            room.timer.cancel()
+    conns = connections()
+    for proto in conns:
+        proto.transport.pause_reading()
+    outbox.flush()
+    drain_until = loop.time() + HANDOFF_DRAIN
+    while any(proto.transport.get_write_buffer_size() for proto in conns) and loop.time() < drain_until:
+        await asyncio.sleep(0.01)
+    for proto in conns:
+        if proto.transport.get_write_buffer_size():
+            log.warning("⚠ %s still had unsent data after %.1f s; closing it.", proto.addr, HANDOFF_DRAIN)
+            proto.transport.abort()
+    await asyncio.sleep(0)  # let connection_lost() take the closed ones out of their rooms
+    conns = connections()
+    state = {"rooms": [room.snapshot(deadlines.get(room.name)) for room in rooms.values()],
+             "conns": [proto.handoff_state() for proto in conns]}
+    fds = [proto.transport.get_extra_info("socket").fileno() for proto in conns]
+    close_journal()
+    conn.setblocking(True)
+    try:
+        handoff.send_listener(conn, spare)
+        handoff.send_state(conn, state, fds)
+        ok = handoff.wait_ack(conn)
+    except OSError as e:
+        log.warning("⚠ Handoff failed: %s", e)
+        ok = False
+    if ok:
+        for proto in conns:
+            # our copy of the socket goes; the connection lives on in the replacement
+            proto.transport.set_protocol(asyncio.Protocol())
+            proto.transport.abort()
+        for proto in handshaking:
+            proto.join_timer.cancel()
+        spare.close()
+        rooms.clear()
+        log.info("✅ Handed %d connections in %d rooms over; players paused for %.0f ms.",
+                 len(fds), len(state["rooms"]), (time.perf_counter() - start) * 1000)
+        return True
+    log.warning("⚠ Replacement did not take over; carrying on.")
+    open_journal(JOURNAL)
+    if metrics_address is not None:
+        metrics_server = metrics.serve(METRICS, *metrics_address)
+    listening = await loop.create_server(QuizProtocol, sock=spare, backlog=backlog)
+    for proto in conns:
+        proto.transport.resume_reading()
+    for room in rooms.values():
+        room.resume_timer(deadlines.get(room.name))
+    start_heartbeat()
+    return False
+
+
+async def take_over(path, backlog):
+    """--takeover: receive the running server's sockets and state from its HANDOFF socket at
+    path and carry on where it stopped. Returns False if there was nothing to take over."""
+    global listening
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        conn, listener, state, socks = handoff.receive(path)
+    except (OSError, handoff.HandoffError) as e:
+        log.error("❌ Could not take over from %s: %s", path, e)
+        return False
+    for snap in state["rooms"]:
+        rooms[snap["name"]] = Room.restored(snap)
+    open_journal(JOURNAL)
+    try:
+        handoff.ack(conn)
+    except OSError as e:  # the old server gave up waiting and carries on
+        log.error("❌ Takeover was not acknowledged: %s", e)
+        rooms.clear()
+        close_journal()
+        return False
+    for sock, conn_state in zip(socks, state["conns"]):
+        await loop.connect_accepted_socket(lambda conn_state=conn_state: QuizProtocol(conn_state), sock)
+    for snap in state["rooms"]:
+        rooms[snap["name"]].resume_timer(snap["deadline"])
+    listening = await loop.create_server(QuizProtocol, sock=listener, backlog=backlog)
+    log.info("✅ Took over %d connections in %d rooms in %.0f ms.",
+             len(socks), len(rooms), (time.perf_counter() - start) * 1000)
+    return True
+
+
+# --- worker processes -------------------------------------------------------
+
+def worker_for(room_name, n_workers):
+    """Stable room -> worker index, identical in every process."""
+    return zlib.crc32(room_name.encode()) % n_workers
+
+
+class RouterProtocol(asyncio.Protocol):
+    """Front acceptor connection: read up to the join line, then pass the socket and the
+    bytes read so far to the worker that owns the room."""
+
+    def __init__(self, channels):
+        self.channels = channels
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.framer = LineBuffer(MAX_LINE)
+        self.accepted = time.perf_counter()
+        handshaking.add(self)
+        self.join_timer = asyncio.get_running_loop().call_later(JOIN_TIMEOUT, self.join_expired)
+
+    def join_expired(self):
+        record_join(self, "timeout")
+        self.transport.close()
+
+    def data_received(self, data):
+        try:
+            lines = self.framer.feed(data, limit=1)
+        except LineTooLong:
+            lines = None
+        if lines == []:
+            return
+        line = lines[0].strip() if lines else ""
+        joined = parse_join(line)
+        room_name = joined[0] if joined is not None else parse_relay(line)
+        record_join(self, "rejected" if room_name is None else "ok")
+        if room_name is None:
+            self.transport.write(b"error:expected join:<username>" + DELIM.encode())
+            self.transport.close()
+            return
+        self.transport.pause_reading()
+        raw = (lines[0] + DELIM).encode() + self.framer.pending()
+        channel = self.channels[worker_for(room_name, len(self.channels))]
+        fd = self.transport.get_extra_info("socket").fileno()
+        msg = json.dumps({"op": "conn", "data": raw.decode("latin-1")}).encode()
+        try:
+            socket.send_fds(channel, [msg], [fd])
+        except OSError as e:
+            log.warning("⚠ Could not hand connection to worker: %s", e)
+        # the worker holds its own copy of the fd; closing ours does not end the connection
+        self.transport.abort()
+
+    def connection_lost(self, exc):
+        self.join_timer.cancel()
+        handshaking.discard(self)
+
+
+async def serve_worker(channel):
+    """Worker event loop: adopt connections and run commands sent by the front acceptor."""
+    loop = asyncio.get_running_loop()
+    count_loop_wakeups(loop)
+    channel.setblocking(False)
+    stopped = loop.create_future()
+    start_heartbeat()
+
+    async def adopt(sock, initial):
+        _, proto = await loop.connect_accepted_socket(QuizProtocol, sock)
+        if initial:
+            proto.data_received(initial)
+
+    def on_message():
+        try:
+            msg, fds, _, _ = socket.recv_fds(channel, 65536, 1)
+        except BlockingIOError:
+            return
+        if not msg:
+            if not stopped.done():
+                stopped.set_result(None)
+            return
+        req = json.loads(msg)
+        if req["op"] == "conn" and fds:
+            loop.create_task(adopt(socket.socket(fileno=fds[0]), req["data"].encode("latin-1")))
+        elif req["op"] == "cmd":
+            handle_command(req["cmd"])
+        elif req["op"] == "quit" and not stopped.done():
+            stopped.set_result(None)
+
+    loop.add_reader(channel.fileno(), on_message)
+    await stopped
+
+
+def worker_main(channel, log_level, metrics_port, journal_path="", questions=QUESTION_BANK, scoring=SCORING,
+                analytics=ANALYTICS, heartbeat=HEARTBEAT, idle_timeout=IDLE_TIMEOUT, keepalive=KEEPALIVE,
+                categories=None):
+    """Room worker process. Settings come in as arguments, not inherited globals, so a
+    spawned or forkserver worker runs with the same options as the front acceptor."""
+    global QUESTION_BANK, SCORING, ANALYTICS, HEARTBEAT, IDLE_TIMEOUT, KEEPALIVE
+    QUESTION_BANK, SCORING, ANALYTICS = questions, scoring, analytics
+    HEARTBEAT, IDLE_TIMEOUT, KEEPALIVE = heartbeat, idle_timeout, keepalive
+    room_categories.update(categories or {})
+    setup_logging(log_level)
+    if metrics_port:
+        metrics.serve(METRICS, "127.0.0.1", metrics_port)
+    open_journal(journal_path)
+    try:
+        asyncio.run(serve_worker(channel))
+    except KeyboardInterrupt:
         pass
+    finally:
+        close_journal()
+
+
+def start_workers(n_workers, log_level=LOG_LEVEL, metrics_port=METRICS_PORT):
+    """Fork n_workers room workers; returns (front-side channels, processes).
+    Each worker journals its own rooms to JOURNAL.w<i>, so keep --workers the same across restarts."""
+    channels, procs = [], []
+    for i in range(n_workers):
+        front, back = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        port = metrics_port + 1 + i if metrics_port else 0
+        journal_path = f"{JOURNAL}.w{i}" if JOURNAL else ""
+        proc = multiprocessing.Process(target=worker_main, daemon=True,
+                                       args=(back, log_level, port, journal_path, QUESTION_BANK, SCORING,
+                                             ANALYTICS, HEARTBEAT, IDLE_TIMEOUT, KEEPALIVE, room_categories))
+        proc.start()
+        back.close()
+        channels.append(front)
+        procs.append(proc)
+    return channels, procs
+
+
+def dispatch_to_workers(channels):
+    """Host command dispatcher for the front acceptor: route room commands to their worker."""
+    def send(i, payload):
+        channels[i].send(json.dumps(payload).encode())
+
+    def dispatch(cmd):
+        parts = cmd.split()
+        if not parts:
+            return
+        if parts[0] in ("rooms", "stats"):
+            for i in range(len(channels)):
+                send(i, {"op": "cmd", "cmd": cmd})
+        else:
+            name = parts[1] if len(parts) > 1 else DEFAULT_ROOM
+            send(worker_for(name, len(channels)), {"op": "cmd", "cmd": cmd})
+    return dispatch
+
+
+def setup_logging(level=LOG_LEVEL):
+    """Log to stderr at `level` ("debug", "info", "warning", ... or "off")."""
+    value = logging.CRITICAL + 1 if level == "off" else getattr(logging, level.upper())
+    logging.basicConfig(level=value, format="%(message)s")
+
+
+async def main(host=HOST, port=PORT, workers=WORKERS, metrics_port=METRICS_PORT, log_level=LOG_LEVEL,
+               backlog=BACKLOG, takeover=False):
+    global listening, metrics_server
+    loop = asyncio.get_running_loop()
+    count_loop_wakeups(loop)
+    bank = question_bank()  # mapped before forking so workers share it
+    log.info("📚 Question bank %s: %d questions, %d categories", bank.path, len(bank), len(bank.categories))
+    for name, category in room_categories.items():
+        if category not in bank.categories:
+            log.warning("⚠ Room %s: category %r is not in the bank, so its games have no questions.", name, category)
+    if workers > 0:
+        channels, procs = start_workers(workers, log_level, metrics_port)
+        if metrics_port:
+            metrics.serve(METRICS, "127.0.0.1", metrics_port)
+        server = await loop.create_server(lambda: RouterProtocol(channels), host, port, reuse_address=True,
+                                          backlog=backlog)
+        log.info("🎮 TCP Server running on %s:%d with %d room workers", host, port, workers)
+        try:
+            await host_control(dispatch_to_workers(channels))
+        finally:
+            server.close()
+            for ch in channels:
+                try:
+                    ch.send(json.dumps({"op": "quit"}).encode())
+                except OSError:
+                    pass
+            for proc in procs:
+                proc.join(timeout=2)
+        return
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), HANDOFF) if HANDOFF else ""
+    if takeover:
+        if not path or not await take_over(path, backlog):
+            return
+    else:
+        open_journal(JOURNAL)
+        listening = await loop.create_server(QuizProtocol, host, port, reuse_address=True, backlog=backlog)
+    if metrics_port:
+        metrics_server = metrics.serve(METRICS, "127.0.0.1", metrics_port)
+    start_heartbeat()
+    log.info("🎮 TCP Server running on %s:%d", host, port)
+    tasks = [loop.create_task(host_control())]
+    if path:
+        tasks.append(loop.create_task(serve_handoff(path, backlog)))
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        listening.close()
+        close_journal()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TCP quiz server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="room worker processes behind a front acceptor (0 = single process)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT (0 = off)")
+    parser.add_argument("--backlog", type=int, default=BACKLOG,
+                        help="listen backlog for bursts of connecting players")
+    parser.add_argument("--questions", default=QUESTION_BANK, help="question bank (JSON lines)")
+    parser.add_argument("--room-category", action="append", default=[], metavar="ROOM=CATEGORY",
+                        help="draw ROOM's questions from one bank category (repeatable); others use the whole bank")
+    parser.add_argument("--scoring", default=SCORING, choices=["first", "speed"],
+                        help="first: POINTS for the first correct answer; speed: score every answer at the deadline")
+    parser.add_argument("--journal", default=JOURNAL,
+                        help="score journal for crash recovery, relative to this file ('' = off)")
+    parser.add_argument("--analytics", default=ANALYTICS,
+                        help="directory for per-game question analytics, relative to this file ('' = off)")
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT,
+                        help="seconds of silence before a connection is pinged (0 = no pings, no reaping)")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds of silence (no answer, no pong) before a connection is reaped")
+    parser.add_argument("--keepalive", type=float, default=KEEPALIVE,
+                        help="TCP keepalive: probe after this many idle seconds (0 = OS default)")
+    parser.add_argument("--handoff", default=HANDOFF,
+                        help="Unix socket for handing over to a replacement server, relative to this file ('' = off)")
+    parser.add_argument("--takeover", action="store_true",
+                        help="take over players and games from the server running with the same --handoff")
+    parser.add_argument("--log-level", default=LOG_LEVEL,
+                        choices=["debug", "info", "warning", "error", "off"])
+    args = parser.parse_args()
+    if args.takeover and args.workers > 0:
+        parser.error("--takeover works in single-process mode only")
+    for spec in args.room_category:
+        room_name, _, category = spec.partition("=")
+        if not room_name or not category:
+            parser.error(f"--room-category expects ROOM=CATEGORY, got {spec!r}")
+        room_categories[room_name] = category
+    setup_logging(args.log_level)
+    QUESTION_BANK = args.questions
+    JOURNAL = args.journal
+    SCORING = args.scoring
+    ANALYTICS = args.analytics
+    HANDOFF = args.handoff
+    HEARTBEAT = args.heartbeat
+    IDLE_TIMEOUT = args.idle_timeout
+    KEEPALIVE = args.keepalive
+    asyncio.run(main(args.host, args.port, args.workers, args.metrics_port, args.log_level, args.backlog,
+                     args.takeover))
@@ -0,0 +1,189 @@
+# wire.py
+"""
+Message encoding for server_tcp / client_tcp.
+Every message is a kind plus arguments, e.g. ("question", text, options) or
+("rank", rank, points, players), and can be written in either protocol:
+- text: the newline protocol described in server_tcp.py
+- binary (opt-in, requested with join+bin:<username> instead of join:): after
+  the join line every frame in both directions is
+      1-byte type | 4-byte big-endian payload length | payload
+  A string list is a u32 count, the u32 byte size of its UTF-8 blob, count x
+  u16 lengths in characters, then the blob: one encode() on write and one
+  decode() plus str slicing on read, and '|' or ':' need no escaping.
+  Leaderboard entries are a string list of names followed by count x i32
+  points (-1 = left the top-K).
+"""
+
+import struct
+from itertools import accumulate
+
+HEADER = struct.Struct(">BI")
+LIST = struct.Struct(">II")  # item count, blob bytes
+RANK = struct.Struct(">III")
+MAX_FRAME = 1 << 20  # largest binary payload accepted
+
+TYPES = {
+    "welcome": 1, "start_quiz": 2, "question": 3, "feedback": 4,
+    "leaderboard_top": 5, "leaderboard_delta": 6, "rank": 7, "quiz_over": 8, "error": 9, "ping": 10,
+    "answer": 16, "pong": 17,
+}
+KINDS = {code: kind for kind, code in TYPES.items()}
+
+
+class FrameTooLarge(ValueError):
+    """Raised when a binary frame announces a payload over MAX_FRAME."""
+
+
+# --- binary helpers -----------------------------------------------------------
+
+def pack_strings(items):
+    blob = "".join(items).encode()
+    n = len(items)
+    return LIST.pack(n, len(blob)) + struct.pack(f">{n}H", *map(len, items)) + blob
+
+
+def unpack_strings(buf, pos=0):
+    """-> (list of str, position after the list)"""
+    n, size = LIST.unpack_from(buf, pos)
+    pos += LIST.size
+    ends = list(accumulate(struct.unpack_from(f">{n}H", buf, pos)))
+    pos += 2 * n
+    text = str(buf[pos:pos + size], "utf-8", "replace")
+    items = [text[start:end] for start, end in zip([0] + ends, ends)]
+    return items, pos + size
+
+
+def pack_entries(entries):
+    names = [u for u, _ in entries]
+    points = [-1 if p is None else p for _, p in entries]
+    return pack_strings(names) + struct.pack(f">{len(points)}i", *points)
+
+
+def unpack_entries(buf, pos=0):
+    names, pos = unpack_strings(buf, pos)
+    points = struct.unpack_from(f">{len(names)}i", buf, pos)
+    if min(points, default=0) >= 0:
+        return list(zip(names, points))
+    return [(u, None if p < 0 else p) for u, p in zip(names, points)]
+
+
+# --- encoders -----------------------------------------------------------------
+
+def _entries_text(entries):
+    return "|".join(f"{u}:-" if p is None else f"{u}:{p}" for u, p in entries)
+
+
+def encode_text(kind, *args):
+    if kind == "start_quiz":
+        line = "start_quiz"
+    elif kind == "question":
+        text, options = args
+        line = f"question:{text}|{'|'.join(options)}"
+    elif kind in ("leaderboard_top", "leaderboard_delta"):
+        line = f"{kind}:{_entries_text(args[0])}"
+    elif kind == "rank":
+        line = "rank:%d:%d:%d" % args
+    else:  # welcome, feedback, quiz_over, error, ping, answer, pong
+        line = f"{kind}:{args[0]}"
+    return (line + "\n").encode()
+
+
+def encode_binary(kind, *args):
+    if kind == "start_quiz":
+        payload = b""
+    elif kind == "question":
+        text, options = args
+        payload = pack_strings([text, *options])
+    elif kind in ("leaderboard_top", "leaderboard_delta"):
+        payload = pack_entries(args[0])
+    elif kind == "rank":
+        payload = RANK.pack(*args)
+    else:
+        payload = str(args[0]).encode()
+    return HEADER.pack(TYPES[kind], len(payload)) + payload
+
+
+def encode(kind, *args, binary=False):
+    return encode_binary(kind, *args) if binary else encode_text(kind, *args)
+
+
+def decode_binary(code, payload):
+    """(type, payload) -> (kind, args)"""
+    kind = KINDS.get(code, "unknown")
+    if kind == "start_quiz":
+        return kind, ()
+    if kind == "question":
+        items, _ = unpack_strings(payload)
+        return kind, (items[0], items[1:])
+    if kind in ("leaderboard_top", "leaderboard_delta"):
+        return kind, (unpack_entries(payload),)
+    if kind == "rank":
+        return kind, RANK.unpack_from(payload)
+    return kind, (str(payload, "utf-8", "replace"),)
+
+
+def _decode_entries(payload):
+    """'user:pts|user:-|...' -> [(user, pts or None)]"""
+    entries = []
+    if payload:
+        for entry in payload.split("|"):
+            if ":" in entry:
+                u, p = entry.rsplit(":", 1)
+                try:
+                    entries.append((u, None if p == "-" else int(p)))
+                except ValueError:
+                    entries.append((u, 0))
+    return entries
+
+
+def decode_text(line):
+    """Text protocol line (no newline) -> (kind, args), the same shape decode_binary returns."""
+    kind, sep, payload = line.partition(":")
+    if kind == "start_quiz":
+        return kind, ()
+    if kind == "question" and sep:
+        parts = payload.split("|")
+        return kind, (parts[0], parts[1:])
+    if kind in ("leaderboard_top", "leaderboard_delta") and sep:
+        return kind, (_decode_entries(payload),)
+    if kind == "rank" and sep:
+        try:
+            return kind, tuple(int(x) for x in payload.split(":")[:3])
+        except ValueError:
+            return "unknown", (line,)
+    if kind in ("welcome", "feedback", "quiz_over", "error", "ping", "pong") and sep:
+        return kind, (payload,)
+    return "unknown", (line,)
+
+
+class FrameDecoder:
+    """Incremental binary frame reader: feed() bytes, get back decoded (kind, args)."""
+
+    def __init__(self, max_frame=MAX_FRAME):
+        self.max_frame = max_frame
+        self._buf = bytearray()
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        out = []
+        pos = 0
+        view = memoryview(buf)
+        try:
+            while len(buf) - pos >= HEADER.size:
+                code, length = HEADER.unpack_from(buf, pos)
+                if length > self.max_frame:
+                    raise FrameTooLarge(f"frame of {length} bytes exceeds {self.max_frame}")
+                end = pos + HEADER.size + length
+                if end > len(buf):
+                    break
+                out.append(decode_binary(code, view[pos + HEADER.size:end]))
+                pos = end
+        finally:
+            view.release()
+        del buf[:pos]
+        return out
+
+    def pending(self):
+        """Bytes of a frame not complete yet."""
+        return bytes(self._buf)
@@ -0,0 +1,10 @@
+# conftest.py
+"""Put the repo root and both servers' directories on sys.path, as running the scripts does."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "tcp_quiz"), os.path.join(ROOT, "udp_quiz")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,69 @@
+# test_analytics.py
+"""quiz_common/analytics.py: QuantileSketch against exact quantiles."""
+
+import json
+import random
+
+import pytest
+
+from quiz_common.analytics import RELATIVE_ACCURACY, QuantileSketch
+
+QS = (0.0, 0.01, 0.25, 0.5, 0.9, 0.99, 1.0)
+
+
+def exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def assert_close(sketch, values):
+    for q in QS:
+        want = exact(values, q)
+        assert sketch.quantile(q) == pytest.approx(want, rel=RELATIVE_ACCURACY + 1e-9), q
+
+
+def response_times(seed, n):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(0, 1.5) for _ in range(n)]  # seconds, about 10 ms .. 100 s
+
+
+def sketch_of(values):
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_quantiles_within_relative_accuracy():
+    values = response_times(1, 5000)
+    sketch = sketch_of(values)
+    assert len(sketch) == len(values)
+    assert_close(sketch, values)
+
+
+def test_merge_matches_the_combined_stream():
+    a, b = response_times(2, 3000), response_times(3, 700)
+    sketch = sketch_of(a)
+    sketch.merge(sketch_of(b))
+    assert len(sketch) == len(a) + len(b)
+    assert_close(sketch, a + b)
+
+
+def test_snapshot_restore_round_trip():
+    values = response_times(4, 2000)
+    sketch = sketch_of(values)
+    restored = QuantileSketch()
+    restored.restore(json.loads(json.dumps(sketch.snapshot())))  # as the journal stores it
+    assert_close(restored, values)
+    more = response_times(5, 500)
+    for value in more:
+        restored.add(value)
+    assert_close(restored, values + more)
+
+
+def test_zeros_and_empty():
+    assert QuantileSketch().quantile(0.5) == 0.0
+    values = [0.0] * 10 + [0.5] * 10
+    sketch = sketch_of(values)
+    assert sketch.quantile(0.25) == 0.0
+    assert_close(sketch, values)
@@ -0,0 +1,94 @@
+# test_multicast.py
+"""udp_quiz/multicast.py: the group stream and its fallbacks to unicast."""
+
+import pytest
+
+import multicast
+from reliable import ReliableReceiver
+
+GROUP = "239.255.42.99"
+A, B, C = (("127.0.0.1", port) for port in (40000, 40001, 40002))
+
+
+class Recorder:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def sendto(self, data, addr):
+        if self.fail:
+            raise OSError("network is unreachable")
+        self.sent.append((data, addr))
+        return len(data)
+
+
+def channel(members=(A, B, C), fail=False):
+    group, unicast = Recorder(fail), Recorder()
+    chan = multicast.MulticastChannel(group, unicast, GROUP, 8890, rto=0)
+    for addr in members:
+        chan.subscribe(addr)
+    return chan, group, unicast
+
+
+def test_a_player_that_cannot_join_gets_an_error():
+    with pytest.raises(OSError):
+        multicast.member_socket("127.0.0.1", 0)  # not a multicast group: the client stays on unicast
+
+
+def test_a_failing_group_send_raises_for_the_server_to_fall_back():
+    chan, _, _ = channel(fail=True)
+    with pytest.raises(OSError):
+        chan.send(b"broadcast:hi")
+
+
+def test_a_minority_miss_is_resent_by_unicast():
+    chan, group, unicast = channel()
+    chan.send(b"broadcast:hi")
+    chan.ack(A, "gack:0")
+    chan.ack(B, "gack:0")
+    assert chan.retransmit() == 1
+    assert unicast.sent == [(multicast.frame(0, 0, b"broadcast:hi", b"g"), C)]
+    assert len(group.sent) == 1
+    chan.ack(C, "gack:0")
+    assert chan.pending() == 0
+
+
+def test_a_majority_miss_is_resent_to_the_group():
+    chan, group, unicast = channel()
+    chan.send(b"broadcast:hi")
+    chan.ack(A, "gack:0")
+    assert chan.retransmit() == 1
+    assert [addr for _, addr in group.sent] == [(GROUP, 8890)] * 2
+    assert not unicast.sent
+
+
+def test_leaving_members_stop_holding_datagrams():
+    chan, _, _ = channel()
+    chan.send(b"broadcast:hi")
+    chan.ack(A, "gack:0")
+    chan.unsubscribe(B)
+    chan.unsubscribe(C)
+    assert chan.retransmit() == 0
+    assert chan.pending() == 0
+    assert chan.subscribe(B) == 1  # a late subscriber starts at the next group seq
+
+
+def test_group_datagrams_reach_a_member_over_loopback():
+    try:
+        member = multicast.member_socket(GROUP, 0, "127.0.0.1")
+    except OSError as e:
+        pytest.skip(f"multicast unavailable: {e}")
+    with member, multicast.sender_socket("127.0.0.1") as sender:
+        addr = ("127.0.0.1", 40000)
+        chan = multicast.MulticastChannel(sender, Recorder(), GROUP, member.getsockname()[1])
+        chan.subscribe(addr)
+        member.settimeout(2)
+        receiver = ReliableReceiver(ack=b"gack")
+        delivered = []
+        for payload in (b"question 1", b"question 2"):
+            chan.send(payload)
+            out, ack = receiver.receive(member.recvfrom(65535)[0])
+            delivered += out
+            chan.ack(addr, ack.decode())
+    assert delivered == [b"question 1", b"question 2"]
+    assert chan.pending() == 0
@@ -0,0 +1,56 @@
+# test_players.py
+"""quiz_common/players.py: the KeyIndex behind PlayerTable, checked against a dict."""
+
+import random
+
+from quiz_common.players import KeyIndex, PlayerTable
+
+
+def test_intern_gives_one_id_per_name():
+    table = PlayerTable()
+    ids = [table.intern(f"p{i}") for i in range(1000)]
+    assert ids == list(range(1000))
+    assert [table.intern(f"p{i}", points=5) for i in range(1000)] == ids
+    assert table.get("p999") == 999
+    assert table.get("nobody") is None
+    assert sum(table.points) == 0  # points only apply to a new name
+
+
+def test_index_matches_a_dict_through_adds_and_removes():
+    rng = random.Random(7)
+    column, index, expected = [], None, {}
+    index = KeyIndex(column)
+    for step in range(20000):
+        addr = ("10.0.0.1", rng.randrange(3000))
+        pid = expected.get(addr)
+        if pid is None:
+            pid = len(column)
+            column.append(addr)
+            index.add(addr, pid)
+            expected[addr] = pid
+        elif rng.random() < 0.5:
+            assert index.remove(addr) == pid
+            column[pid] = None
+            del expected[addr]
+        assert index.get(addr) == expected.get(addr)
+    assert len(index) == len(expected)
+    assert sorted(index) == sorted(expected)
+    for addr, pid in expected.items():
+        assert addr in index and index.get(addr) == pid
+    assert index.remove(("10.0.0.2", 1)) is None
+
+
+def test_removed_slots_are_reused_without_growing():
+    column = []
+    index = KeyIndex(column)
+    for i in range(4):
+        column.append(i)
+        index.add(i, i)
+    size = len(index.slots)
+    for _ in range(1000):
+        index.remove(column[-1])
+        column[-1] = None
+        column.append(len(column))
+        index.add(column[-1], len(column) - 1)
+    assert len(index) == 4
+    assert len(index.slots) <= 2 * size
@@ -0,0 +1,103 @@
+# test_relay_chain.py
+"""tcp_quiz/relay.py: a player two relays below server_tcp plays a whole game."""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+
+TCP_QUIZ = os.path.join(ROOT, "tcp_quiz")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def read_until(sock, prefix, lines, timeout=10):
+    """Collect lines from sock into lines until one starts with prefix; returns that line."""
+    deadline = time.monotonic() + timeout
+    buf = b""
+    while time.monotonic() < deadline:
+        sock.settimeout(max(deadline - time.monotonic(), 0.01))
+        try:
+            data = sock.recv(65536)
+        except socket.timeout:
+            break
+        if not data:
+            break
+        buf += data
+        *done, buf = buf.split(b"\n")
+        for line in map(bytes.decode, done):
+            lines.append(line)
+            if line.startswith(prefix):
+                sock.settimeout(None)
+                return line
+    raise AssertionError(f"no {prefix!r} line in {lines}")
+
+
+@pytest.fixture
+def chain(tmp_path):
+    """server_tcp <- relay <- relay, on free ports; yields (server, leaf relay port)."""
+    bank = tmp_path / "questions.jsonl"
+    bank.write_text(json.dumps({"id": "1", "category": "math", "q": "What is 2 + 2?",
+                                "options": ["2", "3", "4", "5"], "a": "4"}) + "\n")
+    server_port, mid_port, leaf_port = free_port(), free_port(), free_port()
+    log = open(tmp_path / "chain.log", "w")
+    procs = []
+
+    def spawn(*args, **kwargs):
+        proc = subprocess.Popen([sys.executable, "-u", *args], cwd=TCP_QUIZ, stdout=log,
+                                stderr=subprocess.STDOUT, text=True, **kwargs)
+        procs.append(proc)
+        return proc
+
+    try:
+        server = spawn("server_tcp.py", "--port", str(server_port), "--metrics-port", "0",
+                       "--journal", "", "--analytics", "", "--questions", str(bank),
+                       stdin=subprocess.PIPE)
+        wait_for_port(server_port)
+        spawn("relay.py", "--port", str(mid_port), "--upstream", f"127.0.0.1:{server_port}")
+        wait_for_port(mid_port)
+        spawn("relay.py", "--port", str(leaf_port), "--upstream", f"127.0.0.1:{mid_port}")
+        wait_for_port(leaf_port)
+        yield server, leaf_port
+    finally:
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+        log.close()
+
+
+def test_a_player_through_two_relays_is_asked_and_scored(chain):
+    server, port = chain
+    lines = []
+    with socket.create_connection(("127.0.0.1", port)) as player:
+        player.sendall(b"join:alice\n")
+        read_until(player, "welcome:", lines)
+        server.stdin.write("start\n")
+        server.stdin.flush()
+        assert read_until(player, "question:", lines) == "question:What is 2 + 2?|2|3|4|5"
+        player.sendall(b"answer:4\n")
+        read_until(player, "quiz_over:", lines)
+    assert "feedback:alice answered first and got it right!" in lines
+    assert "rank:1:10:1" in lines  # scored by the server and routed back down to alice alone
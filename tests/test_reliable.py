@@ -0,0 +1,102 @@
+# test_reliable.py
+"""udp_quiz/reliable.py: answer de-duplication, and delivery through a seeded lossy.py socket."""
+
+import select
+import socket
+import time
+
+import lossy
+from reliable import AnswerDedup, ReliableReceiver, ReliableSender
+
+
+ADDR = ("127.0.0.1", 40000)
+
+
+def test_repeat_is_a_duplicate():
+    seen = AnswerDedup()
+    assert seen.first_time(ADDR, 0)
+    assert not seen.first_time(ADDR, 0)
+    assert seen.duplicates == 1
+
+
+def test_reordered_retransmit_counts_once():
+    seen = AnswerDedup()
+    assert seen.first_time(ADDR, 0)
+    assert seen.first_time(ADDR, 2)
+    assert seen.first_time(ADDR, 1)  # the resend of 1 arrived after 2
+    assert not seen.first_time(ADDR, 1)
+    assert not seen.first_time(ADDR, 2)
+
+
+def test_ids_older_than_the_window_are_duplicates():
+    seen = AnswerDedup(window=4)
+    for aid in (0, 1, 2, 9):
+        assert seen.first_time(ADDR, aid)
+    assert not seen.first_time(ADDR, 5)  # 9 - 4: out of the window
+    assert seen.first_time(ADDR, 6)
+    assert len(seen.seen[ADDR][1]) <= 4 + 1
+
+
+def test_players_are_tracked_apart_and_forgotten():
+    seen = AnswerDedup()
+    other = ("127.0.0.1", 40001)
+    assert seen.first_time(ADDR, 3)
+    assert seen.first_time(other, 3)
+    seen.forget(ADDR)
+    assert seen.first_time(ADDR, 3)
+
+
+def loopback():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def test_seeded_loss_delivers_everything_once_in_order(monkeypatch):
+    """A QUIZ_UDP_LOSS run on both ends: every datagram reaches the player exactly once and in
+    order, and every answer is counted exactly once however often it is resent."""
+    monkeypatch.setenv("QUIZ_UDP_LOSS", "loss=0.3,reorder=0.3,dup=0.1,delay=0.02,seed=3")
+    rto = 0.01
+    with loopback() as server_end, loopback() as player_end:
+        server, player = lossy.wrap(server_end), lossy.wrap(player_end)
+        server_addr, player_addr = server_end.getsockname(), player_end.getsockname()
+        sender = ReliableSender(server, rto=rto, max_retries=100)
+        sender.add(player_addr)
+        receiver = ReliableReceiver()
+        dedup = AnswerDedup()
+        sent = [b"question %d" % i for i in range(200)]
+        for payload in sent:
+            sender.send(player_addr, payload)
+        delivered, counted = [], []
+        unanswered = {aid: 0.0 for aid in range(50)}  # aid -> last sent
+        deadline = time.monotonic() + 20
+        while (sender.pending() or unanswered) and time.monotonic() < deadline:
+            now = time.monotonic()
+            for aid, last in unanswered.items():
+                if now - last >= rto:
+                    player.sendto(b"answer:a:1:%d" % aid, server_addr)
+                    unanswered[aid] = now
+            ready, _, _ = select.select([server_end, player_end], [], [], rto / 2)
+            if player_end in ready:
+                data, _ = player_end.recvfrom(65535)
+                if data.startswith(b"d:"):
+                    out, ack = receiver.receive(data)
+                    delivered += out
+                    player.sendto(ack, server_addr)
+                else:
+                    unanswered.pop(int(data.split(b":")[1]), None)  # answered:<aid>
+            if server_end in ready:
+                msg = server_end.recvfrom(65535)[0].decode()
+                if msg.startswith("ack:"):
+                    sender.ack(player_addr, msg)
+                else:
+                    aid = int(msg.rsplit(":", 1)[1])
+                    server.sendto(b"answered:%d" % aid, player_addr)
+                    if dedup.first_time(player_addr, aid):
+                        counted.append(aid)
+            sender.retransmit()
+    assert server.dropped and server.reordered and server.duplicated  # the run did exercise the shim
+    assert delivered == sent
+    assert sender.given_up == 0 and receiver.skipped == 0
+    assert sender.retransmits and receiver.duplicates
+    assert sorted(counted) == list(range(50)) and dedup.duplicates
@@ -0,0 +1,24 @@
+# test_rooms.py
+"""server_tcp rooms: a room configured with --room-category plays only that category."""
+
+import asyncio
+
+import server_tcp
+
+
+def test_room_draws_from_its_category(monkeypatch):
+    monkeypatch.setattr(server_tcp, "room_categories", {"maths": "geography"})
+    monkeypatch.setattr(server_tcp, "rooms", {})
+    monkeypatch.setattr(server_tcp, "journal", None)
+
+    async def scenario():
+        room = server_tcp.get_room("maths")
+        assert room.category == "geography"
+        assert server_tcp.get_room("main").category is None
+        room.start()
+        bank = server_tcp.question_bank()
+        assert all(bank.get(qid)["category"] == "geography" for qid in room.question_list)
+        assert room.current["text"] == "Capital of France?"
+        room.timer.cancel()
+
+    asyncio.run(scenario())
@@ -0,0 +1,125 @@
+# test_speed_scoring.py
+"""server_tcp Room in speed scoring: a question closes early only once every player still
+connected has answered."""
+
+import asyncio
+import time
+
+import pytest
+
+import server_tcp
+
+
+class FakeTransport:
+    def __init__(self):
+        self.closing = False
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+    abort = close
+
+    def get_write_buffer_size(self):
+        return 0
+
+
+class FakeConn:
+    """Stands in for a QuizProtocol: records the frames the room sends it."""
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.addr = ("127.0.0.1", 0)
+        self.pid = None
+        self.binary = False
+        self.link = None
+        self.last_rank = None
+        self.dropped = 0
+        self.frames = []
+
+    def send_frame(self, frame):
+        self.frames.append(frame)
+        return True
+
+    def send(self, kind, *args):
+        return self.send_frame(server_tcp.wire.encode(kind, *args, binary=False))
+
+
+@pytest.fixture
+def speed(monkeypatch):
+    monkeypatch.setattr(server_tcp, "SCORING", "speed")
+    monkeypatch.setattr(server_tcp, "journal", None)
+
+
+def play(*usernames):
+    """A started speed room with these players; returns (room, {username: conn})."""
+    room = server_tcp.Room("speed-test")
+    conns = {name: FakeConn() for name in usernames}
+    for name, conn in conns.items():
+        room.add_player(name, conn)
+    room.start()
+    return room, conns
+
+
+def answer(room, conn):
+    room.handle_answer(conn.pid, room.current["correct"], time.perf_counter())
+
+
+def test_closes_once_everyone_answered(speed):
+    async def scenario():
+        room, conns = play("alice", "bob")
+        answer(room, conns["alice"])
+        assert room.current is not None
+        answer(room, conns["bob"])
+        assert room.current is None
+        room.timer.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_answered_player_leaving_does_not_close_for_the_others(speed):
+    async def scenario():
+        room, conns = play("alice", "bob")
+        question = room.current
+        answer(room, conns["alice"])
+        room.remove_player(conns["alice"].pid, conns["alice"], "closed")
+        assert room.current is question  # bob has not answered yet
+        answer(room, conns["bob"])
+        assert room.current is None
+        room.timer.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_last_unanswered_player_leaving_closes(speed):
+    async def scenario():
+        room, conns = play("alice", "bob", "carol")
+        answer(room, conns["alice"])
+        answer(room, conns["bob"])
+        assert room.current is not None
+        room.remove_player(conns["carol"].pid, conns["carol"], "closed")
+        assert room.current is None
+        room.timer.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_rejoining_player_is_waited_for(speed):
+    async def scenario():
+        room, conns = play("alice", "bob")
+        room.remove_player(conns["bob"].pid, conns["bob"], "closed")
+        answer(room, conns["alice"])
+        assert room.current is None  # bob left before answering: nobody else to wait for
+        room.timer.cancel()
+        room.open_question(asyncio.get_running_loop().time())
+        bob = FakeConn()
+        room.add_player("bob", bob)
+        answer(room, conns["alice"])
+        assert room.current is not None  # bob is back and has not answered
+        answer(room, bob)
+        assert room.current is None
+        room.timer.cancel()
+
+    asyncio.run(scenario())
@@ -1,43 +1,123 @@
 # client_udp.py
 import socket
 import threading
+import time
 import sys
 
+import lossy
+import multicast
+from reliable import RTO, MAX_RETRIES, ReliableReceiver
+
 SERVER_IP = "127.0.0.1"  # or the LAN IP of the server
 PORT = 8888
+MAX_DATAGRAM = 65535
+
+receiver = ReliableReceiver()  # in-order, de-duplicated delivery (see reliable.py)
+group_receiver = ReliableReceiver(ack=b"gack")  # broadcasts, once subscribed to multicast (see multicast.py)
+group_lock = threading.Lock()  # group datagrams arrive on both sockets
+subscribed = threading.Event()
+welcomed = threading.Event()
+current_qid = None
+answered = set()  # answer ids the server has confirmed
+
+
+def show(msg):
+    global current_qid
+    if msg.startswith("question"):
+        # question <id>: <text>\na)x | b)y ...
+        current_qid = msg[len("question "):].split(":", 1)[0]
+        print(f"\n📢 {msg}")
+        print("Type your answer (a, b, c, etc.) and press Enter.")
+    elif msg.startswith("broadcast:"):
+        print("📣", msg.split(":", 1)[1])
+    elif msg.startswith("score:"):
+        _, user, points = msg.split(":")
+        print(f"🏅 {user}: {points} points")
+    elif msg.startswith("multicast:"):
+        _, group, port = msg.split(":")
+        join_group(group, int(port))
+    elif msg.startswith("subscribed:"):
+        with group_lock:
+            group_receiver.expected = int(msg.split(":")[1])
+        subscribed.set()
+    else:
+        if msg.startswith("Welcome"):
+            welcomed.set()
+        print(msg)
+
+
+def join_group(group, port):
+    """Receive broadcasts from the multicast group; stay on unicast if that fails."""
+    iface = "127.0.0.1" if SERVER_IP.startswith("127.") else "0.0.0.0"
+    try:
+        msock = multicast.member_socket(group, port, iface)
+    except OSError as e:
+        print(f"⚠️ Multicast unavailable ({e}), staying on unicast")
+        return
+    threading.Thread(target=listen_for_messages, args=(msock,), daemon=True).start()
+    threading.Thread(target=send_until, args=(sock, "subscribe", subscribed.is_set), daemon=True).start()
+
+
+def group_datagram(data):
+    """Deliver a g: datagram (multicast, or a unicast retransmit of one) once subscribed."""
+    if not subscribed.is_set():
+        return []  # sent before our first group seq; it reaches us by unicast as well
+    with group_lock:
+        payloads, ack = group_receiver.receive(data)
+    sock.sendto(ack, (SERVER_IP, PORT))
+    return payloads
+
 
 def listen_for_messages(sock):
-    """Background thread to receive messages from server."""
+    """Background thread to receive messages from server (unicast or multicast socket)."""
     while True:
         try:
-            data, _ = sock.recvfrom(1024)
-            msg = data.decode().strip()
-            if msg.startswith("question:"):
-                parts = msg.split(":")
-                qid, text, opts = parts[1], parts[2], parts[3]
-                print(f"\n📢 Question {qid}: {text}")
-                print("Type your answer (a, b, c, etc.) and press Enter.")
-            elif msg.startswith("broadcast:"):
-                print("📣", msg.split(":", 1)[1])
-            elif msg.startswith("score:"):
-                _, user, points = msg.split(":")
-                print(f"🏅 {user}: {points} points")
+            data, _ = sock.recvfrom(MAX_DATAGRAM)
+            if data.startswith(b"d:"):
+                payloads, ack = receiver.receive(data)
+                sock.sendto(ack, (SERVER_IP, PORT))
+            elif data.startswith(b"g:"):
+                payloads = group_datagram(data)
+            elif data.startswith(b"answered:"):
+                answered.add(data[len(b"answered:"):].decode())
+                continue
             else:
-                print(msg)
+                payloads = [data]
+            for payload in payloads:
+                show(payload.decode().strip())
         except:
             break
 
+
+def send_until(sock, message, done):
+    """Send message, resending with backoff until done() or MAX_RETRIES tries."""
+    for attempt in range(MAX_RETRIES):
+        sock.sendto(message.encode(), (SERVER_IP, PORT))
+        deadline = time.monotonic() + RTO * (1 << min(attempt, 3))
+        while time.monotonic() < deadline:
+            if done():
+                return True
+            time.sleep(0.01)
+    return done()
+
+
 username = input("Enter your username: ")
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.sendto(f"join:{username}".encode(), (SERVER_IP, PORT))
+sock = lossy.wrap(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))  # no-op unless QUIZ_UDP_LOSS is set
 
 # Start listening thread
 threading.Thread(target=listen_for_messages, args=(sock,), daemon=True).start()
+if not send_until(sock, f"join+rel:{username}", welcomed.is_set):
+    print("⚠️ No answer from the server yet, still waiting...")
 
+next_aid = 0
 while True:
     msg = input("")  # allow user to type answer
     if msg.lower() in ["a", "b", "c", "d"]:
-        sock.sendto(f"answer:{msg}".encode(), (SERVER_IP, PORT))
+        aid = str(next_aid)
+        next_aid += 1
+        message = f"answer:{msg.lower()}:{current_qid}:{aid}"
+        threading.Thread(target=send_until, args=(sock, message, lambda: aid in answered),
+                         daemon=True).start()
     elif msg.lower() == "quit":
         print("Leaving the game...")
         break
@@ -0,0 +1,89 @@
+# ingress.py
+"""
+Admission control for datagrams reaching server_udp, applied in the listener
+thread before anything is decoded or queued:
+- classify() looks only at the raw prefix; anything that is not a known
+  message kind is dropped as malformed.
+- Only join datagrams are accepted from addresses that have not joined.
+- RateLimiter gives every address a token bucket (RATE datagrams per second,
+  bursts up to BURST). Acks cost ACK_COST of a token because a reliable player
+  acks every datagram it gets. A spamming address only ever spends its own
+  tokens, so it cannot crowd out other players' answers.
+Only answers are queued for the quiz thread, on a bounded queue; when it is
+full the answer is dropped and counted instead of waiting behind a backlog.
+"""
+
+import threading
+import time
+
+RATE = 20.0        # datagrams per second per address, sustained
+BURST = 40.0       # bucket size: datagrams an address may send at once
+ACK_COST = 0.05    # tokens an ack/gack costs
+MAX_TRACKED = 65536  # addresses with a bucket; idle (full) buckets are forgotten first
+
+KINDS = (
+    (b"ack:", "ack"),
+    (b"gack:", "gack"),
+    (b"answer:", "answer"),
+    (b"join:", "join"),
+    (b"join+rel:", "join"),
+    (b"subscribe", "subscribe"),
+)
+COST = {"ack": ACK_COST, "gack": ACK_COST}
+
+
+def classify(data):
+    """Message kind of a raw datagram, or None if it is not one the server accepts."""
+    for prefix, kind in KINDS:
+        if data.startswith(prefix):
+            return kind
+    return None
+
+
+def answer_ok(msg):
+    """answer:<letter> or answer:<letter>:<qid>:<aid> with a one-letter option."""
+    parts = msg.split(":")
+    return len(parts) in (2, 4) and len(parts[1]) == 1
+
+
+class RateLimiter:
+    """Per-address token buckets. Thread-safe."""
+
+    def __init__(self, rate=RATE, burst=BURST, max_tracked=MAX_TRACKED, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self.buckets = {}  # addr -> [tokens, last refill time]
+        self._lock = threading.Lock()
+
+    def allow(self, addr, cost=1.0):
+        now = self.clock()
+        with self._lock:
+            bucket = self.buckets.get(addr)
+            if bucket is None:
+                if len(self.buckets) >= self.max_tracked and not self._prune(now):
+                    return False
+                bucket = self.buckets[addr] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < cost:
+                return False
+            bucket[0] -= cost
+            return True
+
+    def _prune(self, now):
+        """Forget buckets that have refilled completely (nothing is lost); True if any were."""
+        idle = self.burst / self.rate
+        stale = [addr for addr, (_, last) in self.buckets.items() if now - last >= idle]
+        for addr in stale:
+            del self.buckets[addr]
+        return bool(stale)
+
+    def forget(self, addr):
+        with self._lock:
+            self.buckets.pop(addr, None)
+
+    def __len__(self):
+        return len(self.buckets)
@@ -0,0 +1,74 @@
+# lossy.py
+"""
+Local packet-loss / reordering shim for trying the UDP quiz on a perfect loopback.
+Wraps a socket so that sendto() randomly drops, delays (and so reorders) or
+duplicates datagrams; everything else goes to the real socket. Enabled by
+QUIZ_UDP_LOSS in the environment of the server, the client, or both:
+
+    QUIZ_UDP_LOSS="loss=0.2,reorder=0.2,dup=0.05,delay=0.05,seed=1" python server_udp.py
+"""
+
+import os
+import random
+import threading
+
+
+class LossySocket:
+    def __init__(self, sock, loss=0.0, reorder=0.0, dup=0.0, delay=0.05, seed=None):
+        self._sock = sock
+        self.loss = loss
+        self.reorder = reorder
+        self.dup = dup
+        self.delay = delay
+        self.rng = random.Random(seed)
+        self.dropped = 0
+        self.reordered = 0
+        self.duplicated = 0
+
+    def sendto(self, data, addr):
+        rng = self.rng
+        if rng.random() < self.loss:
+            self.dropped += 1
+            return len(data)
+        copies = 2 if rng.random() < self.dup else 1
+        self.duplicated += copies - 1
+        for _ in range(copies):
+            if rng.random() < self.reorder:
+                self.reordered += 1
+                timer = threading.Timer(rng.uniform(0, self.delay), self._late, (data, addr))
+                timer.daemon = True
+                timer.start()
+            else:
+                self._sock.sendto(data, addr)
+        return len(data)
+
+    def _late(self, data, addr):
+        try:
+            self._sock.sendto(data, addr)
+        except OSError:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._sock.close()
+
+
+def parse(spec):
+    """'loss=0.2,seed=1' -> keyword arguments for LossySocket."""
+    kwargs = {}
+    for item in filter(None, spec.split(",")):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        kwargs[key] = int(value) if key == "seed" else float(value)
+    return kwargs
+
+
+def wrap(sock, spec=None):
+    """sock wrapped per spec (default: $QUIZ_UDP_LOSS), or sock itself when unset."""
+    spec = os.environ.get("QUIZ_UDP_LOSS", "") if spec is None else spec
+    return LossySocket(sock, **parse(spec)) if spec else sock
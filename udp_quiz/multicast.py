@@ -0,0 +1,162 @@
+# multicast.py
+"""
+Multicast fan-out for the UDP quiz (optional, e.g. QUIZ_MULTICAST=239.255.42.99:8890).
+Broadcasts go to the group with a single sendto instead of one per player.
+- A reliable player is told the group with multicast:<group>:<port> on its
+  unicast stream. It joins the group and replies subscribe.
+- The server answers subscribed:<seq>. From then on the player gets
+  broadcasts only as g:<seq>:<base>:<payload> group datagrams, starting at
+  that seq, and acks them with gack:<cumulative>[:<seq>,...].
+- A group datagram that some members have not acked after the RTO is resent
+  by unicast to just those members, or to the group again when most of them
+  missed it.
+A player that cannot join the group never subscribes and keeps getting
+per-player unicast.
+"""
+
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from reliable import MAX_RETRIES, RTO, WINDOW, frame
+
+TTL = 1  # stay on the local network
+
+
+def parse_group(spec):
+    """'239.255.42.99:8890' -> ('239.255.42.99', 8890)"""
+    group, _, port = spec.rpartition(":")
+    return group, int(port)
+
+
+def sender_socket(iface, ttl=TTL):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(iface))
+    return sock
+
+
+def member_socket(group, port, iface="0.0.0.0"):
+    """Socket bound to port and joined to group; raises OSError when multicast is unavailable."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", port))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        socket.inet_aton(group) + socket.inet_aton(iface))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class MulticastChannel:
+    """Server side of the group stream: one sequence for every member, acks per member."""
+
+    def __init__(self, sock, unicast, group, port, rto=RTO, max_retries=MAX_RETRIES, window=WINDOW,
+                 on_send=None):
+        self.sock = sock  # multicast sender socket
+        self.unicast = unicast  # the server's own socket, for per-member retransmits
+        self.group = (group, port)
+        self.rto = rto
+        self.max_retries = max_retries
+        self.window = window
+        self.on_send = on_send
+        self.members = set()
+        self.next_seq = 0
+        self.unacked = OrderedDict()  # seq -> [payload, last sent, tries, members yet to ack]
+        self.retransmits = 0
+        self.given_up = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, addr):
+        return addr in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def subscribe(self, addr):
+        """Add addr; returns the first group seq it will be sent."""
+        with self._lock:
+            self.members.add(addr)
+            return self.next_seq
+
+    def unsubscribe(self, addr):
+        with self._lock:
+            self.members.discard(addr)
+            for entry in self.unacked.values():
+                entry[3].discard(addr)
+
+    def base(self):
+        return next(iter(self.unacked), self.next_seq)
+
+    def send(self, payload):
+        """One datagram to the whole group. Raises OSError if the group can't be reached."""
+        with self._lock:
+            if not self.members:
+                return
+            seq = self.next_seq
+            self.next_seq += 1
+            if len(self.unacked) >= self.window:
+                self.unacked.popitem(last=False)
+                self.given_up += 1
+            self.unacked[seq] = [payload, time.monotonic(), 1, set(self.members)]
+            data = frame(seq, self.base(), payload, b"g")
+        self.sock.sendto(data, self.group)
+        if self.on_send:
+            self.on_send(len(data))
+
+    def pending(self):
+        return len(self.unacked)
+
+    def ack(self, addr, msg):
+        """Apply a 'gack:<cum>[:<seq>,...]' message from member addr."""
+        parts = msg.split(":")
+        try:
+            cumulative = int(parts[1])
+            selective = {int(s) for s in parts[2].split(",") if s} if len(parts) > 2 else set()
+        except (IndexError, ValueError):
+            return
+        with self._lock:
+            for seq, entry in list(self.unacked.items()):
+                if seq <= cumulative or seq in selective:
+                    entry[3].discard(addr)
+                    if not entry[3]:
+                        del self.unacked[seq]
+
+    def retransmit(self):
+        now = time.monotonic()
+        to_group, to_members = [], []
+        with self._lock:
+            for seq, entry in list(self.unacked.items()):
+                payload, sent, tries, pending = entry
+                pending &= self.members
+                if not pending:
+                    del self.unacked[seq]
+                    continue
+                if now - sent < self.rto * (1 << min(tries - 1, 3)):
+                    continue
+                if tries >= self.max_retries:
+                    del self.unacked[seq]
+                    self.given_up += 1
+                    continue
+                entry[1] = now
+                entry[2] = tries + 1
+                data = frame(seq, self.base(), payload, b"g")
+                if 2 * len(pending) > len(self.members):
+                    to_group.append(data)
+                else:
+                    to_members.extend((data, addr) for addr in pending)
+        sends = [(self.sock, data, self.group) for data in to_group]
+        sends += [(self.unicast, data, addr) for data, addr in to_members]
+        for sock, data, addr in sends:
+            try:
+                sock.sendto(data, addr)
+            except OSError:
+                continue
+            if self.on_send:
+                self.on_send(len(data))
+        self.retransmits += len(sends)
+        return len(sends)
@@ -0,0 +1,209 @@
+# reliable.py
+"""
+Sequenced, acknowledged delivery for the UDP quiz (opt-in: join+rel:<username>).
+Every server -> player datagram of a reliable player is sent as
+    d:<seq>:<base>:<payload>
+where seq counts up per player and base is the oldest seq the server may still
+retransmit. The player answers each one with
+    ack:<cumulative>[:<seq>,<seq>...]
+(highest seq delivered in order, plus any later seqs already buffered), and
+the server only retransmits what is still missing. Retransmits are bounded:
+an entry is given up after MAX_RETRIES tries or when more than WINDOW are in
+flight, base moves past it and the player skips the gap instead of stalling.
+Answers travel the other way as answer:<letter>:<qid>:<aid> and are resent
+until answered:<aid> comes back; the server ignores any aid it has already
+seen, so a retransmitted answer is never counted twice, even when it arrives
+after a later answer.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+RTO = 0.2          # seconds before the first retransmit, doubled per try (capped at 8x)
+MAX_RETRIES = 6    # tries per datagram before giving up on it
+WINDOW = 256       # unacknowledged datagrams kept per player
+
+
+class Peer:
+    __slots__ = ("next_seq", "unacked")
+
+    def __init__(self):
+        self.next_seq = 0
+        self.unacked = OrderedDict()  # seq -> [payload, last sent, tries]
+
+    def base(self):
+        return next(iter(self.unacked), self.next_seq)
+
+
+def frame(seq, base, payload, stream=b"d"):
+    return b"%s:%d:%d:" % (stream, seq, base) + payload
+
+
+class ReliableSender:
+    """Server side: numbers, remembers and retransmits datagrams per player.
+    Thread-safe; call retransmit() every rto/2 or so."""
+
+    def __init__(self, sock, rto=RTO, max_retries=MAX_RETRIES, window=WINDOW, on_send=None):
+        self.sock = sock
+        self.rto = rto
+        self.max_retries = max_retries
+        self.window = window
+        self.on_send = on_send  # called with the datagram size, for metrics
+        self.peers = {}
+        self.retransmits = 0
+        self.given_up = 0
+        self._lock = threading.Lock()
+
+    def add(self, addr):
+        with self._lock:
+            self.peers.setdefault(addr, Peer())
+
+    def remove(self, addr):
+        with self._lock:
+            self.peers.pop(addr, None)
+
+    def __contains__(self, addr):
+        return addr in self.peers
+
+    def send(self, addr, payload):
+        with self._lock:
+            peer = self.peers.get(addr)
+            if peer is None:
+                return
+            seq = peer.next_seq
+            peer.next_seq += 1
+            if len(peer.unacked) >= self.window:
+                peer.unacked.popitem(last=False)
+                self.given_up += 1
+            peer.unacked[seq] = [payload, time.monotonic(), 1]
+            data = frame(seq, peer.base(), payload)
+        self._sendto(data, addr)
+
+    def pending(self):
+        """Datagrams sent but not yet acknowledged, over all players."""
+        with self._lock:
+            return sum(len(peer.unacked) for peer in self.peers.values())
+
+    def ack(self, addr, msg):
+        """Apply an 'ack:<cum>[:<seq>,...]' message from addr."""
+        parts = msg.split(":")
+        try:
+            cumulative = int(parts[1])
+            selective = [int(s) for s in parts[2].split(",") if s] if len(parts) > 2 else ()
+        except (IndexError, ValueError):
+            return
+        with self._lock:
+            peer = self.peers.get(addr)
+            if peer is None:
+                return
+            unacked = peer.unacked
+            while unacked and next(iter(unacked)) <= cumulative:
+                unacked.popitem(last=False)
+            for seq in selective:
+                unacked.pop(seq, None)
+
+    def retransmit(self):
+        now = time.monotonic()
+        resend = []
+        with self._lock:
+            for addr, peer in self.peers.items():
+                for seq, entry in list(peer.unacked.items()):
+                    payload, sent, tries = entry
+                    if now - sent < self.rto * (1 << min(tries - 1, 3)):
+                        continue
+                    if tries >= self.max_retries:
+                        del peer.unacked[seq]
+                        self.given_up += 1
+                        continue
+                    entry[1] = now
+                    entry[2] = tries + 1
+                    resend.append((addr, seq, peer, payload))
+            resend = [(addr, frame(seq, peer.base(), payload)) for addr, seq, peer, payload in resend]
+        for addr, data in resend:
+            self._sendto(data, addr)
+        self.retransmits += len(resend)
+        return len(resend)
+
+    def _sendto(self, data, addr):
+        try:
+            self.sock.sendto(data, addr)
+        except OSError:
+            return
+        if self.on_send:
+            self.on_send(len(data))
+
+
+class ReliableReceiver:
+    """Player side: acks every datagram and hands payloads back in order, once."""
+
+    def __init__(self, window=WINDOW, ack=b"ack"):
+        self.window = window
+        self.ack_kind = ack
+        self.expected = None
+        self.buffer = {}  # seq -> payload, received ahead of a gap
+        self.duplicates = 0
+        self.skipped = 0
+
+    def receive(self, data):
+        """'d:...' (or 'g:...') datagram -> (payloads now deliverable, ack datagram to send)."""
+        try:
+            _, seq, base, payload = data.split(b":", 3)
+            seq, base = int(seq), int(base)
+        except ValueError:
+            return [], None
+        if self.expected is None:
+            self.expected = base
+        out = []
+        if base > self.expected:
+            # the sender gave up on [expected, base): deliver what arrived and move on
+            for s in range(self.expected, base):
+                if s in self.buffer:
+                    out.append(self.buffer.pop(s))
+                else:
+                    self.skipped += 1
+            self.expected = base
+        if seq < self.expected or seq in self.buffer:
+            self.duplicates += 1
+        elif seq - self.expected < self.window:
+            self.buffer[seq] = payload
+        while self.expected in self.buffer:
+            out.append(self.buffer.pop(self.expected))
+            self.expected += 1
+        return out, self.ack()
+
+    def ack(self):
+        cumulative = -1 if self.expected is None else self.expected - 1
+        if self.buffer:
+            return b"%s:%d:%s" % (self.ack_kind, cumulative, ",".join(map(str, sorted(self.buffer))).encode())
+        return b"%s:%d" % (self.ack_kind, cumulative)
+
+
+class AnswerDedup:
+    """Server side: the answer ids seen per player. Ids are tracked individually within WINDOW
+    of the highest one, so a retransmitted answer that arrives after a later one (reordered)
+    still counts once; anything older than that is taken as already seen."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.seen = {}  # addr -> [highest aid, {aids seen above highest - window}]
+        self.duplicates = 0
+
+    def first_time(self, addr, aid):
+        entry = self.seen.get(addr)
+        if entry is None:
+            self.seen[addr] = [aid, {aid}]
+            return True
+        highest, ids = entry
+        if aid <= highest - self.window or aid in ids:
+            self.duplicates += 1
+            return False
+        ids.add(aid)
+        if aid > highest:
+            entry[0] = aid
+            if len(ids) > self.window:
+                entry[1] = {i for i in ids if i > aid - self.window}
+        return True
+
+    def forget(self, addr):
+        self.seen.pop(addr, None)
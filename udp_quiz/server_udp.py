@@ -1,98 +1,444 @@
 # server_udp_test.py
 import socket
 import threading
-import json
 import time
 import queue
+import logging
+import os
+import sys
 
-questions = []
+import ingress
+import lossy
+import multicast
+from reliable import RTO, AnswerDedup, ReliableSender
 
-with open('questions.json') as file:
-    questions = json.load(file)["questions"]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from quiz_common import metrics
+from quiz_common.analytics import GameAnalytics
+from quiz_common.journal import Journal
+from quiz_common.players import KeyIndex, PlayerTable
+from quiz_common.questions import LETTERS, QuestionBank, answer_letter
+from quiz_common.scheduler import Scheduler
+from quiz_common.scoring import AnswerBatch
 
 HOST = "127.0.0.1"   # or "0.0.0.0" to listen on all network interfaces
 PORT = 8888
 TIME = 30  # seconds
+GAP = 2  # seconds between the scores of one question and the next question
 POINTS = 10
+SCORING = os.environ.get("QUIZ_SCORING", "first")  # or "speed": score every answer at close (quiz_common/scoring.py)
+QUESTION_BANK = "questions.jsonl"  # JSON-lines bank, relative to this file (see quiz_common/questions.py)
+QUESTIONS_PER_GAME = 10  # sampled per game; smaller banks are played whole, in file order
+CATEGORY = None  # only ask questions from this bank category
+METRICS_PORT = 9889  # Prometheus text on 127.0.0.1; 0 = off
+MULTICAST = os.environ.get("QUIZ_MULTICAST", "")  # "group:port" (e.g. 239.255.42.99:8890) to fan out via multicast
+JOURNAL = os.environ.get("QUIZ_JOURNAL", "scores.journal")  # crash-recovery journal, relative to this file; "" = off
+ROOM = "main"  # room name used in the journal
+ANALYTICS = os.environ.get("QUIZ_ANALYTICS", "analytics")  # per-game question analytics (JSON/CSV), relative to this file; "" = off
+DRAIN_TIME = 5  # seconds to keep retransmitting unacknowledged datagrams after the game
+MAX_DATAGRAM = 65535  # read whole datagrams: a selective ack can list up to WINDOW seqs
+INGRESS_QUEUE = 1024  # answers waiting for the quiz thread; more are dropped (see ingress.py)
+LOG_LEVEL = os.environ.get("QUIZ_LOG_LEVEL", "info")  # debug logs every datagram; "off" silences it
 
-clients = {}
-scores = {}
+logging.basicConfig(level=logging.CRITICAL + 1 if LOG_LEVEL == "off" else getattr(logging, LOG_LEVEL.upper()),
+                    format="%(message)s")
+log = logging.getLogger("server_udp")
+
+bank = QuestionBank(os.path.join(os.path.dirname(os.path.abspath(__file__)), QUESTION_BANK))
+
+players = PlayerTable()  # id <-> username, points; conns holds each player's current address
+clients = KeyIndex(players.conns)  # addr -> player id, over the conns column
+
+journal = Journal(os.path.join(os.path.dirname(os.path.abspath(__file__)), JOURNAL)) if JOURNAL else None
+saved = journal.room(ROOM) if journal is not None else None
+if saved is not None:
+    for username, points in saved["scores"].items():
+        players.intern(username, points)  # a returning player gets their points back when they rejoin
+
+
+def record(op, **fields):
+    if journal is not None:
+        journal.append(op, ROOM, **fields)
+
+current_qid = None  # id of the question being asked; answers for any other are stale
+batch = AnswerBatch(POINTS, TIME) if SCORING == "speed" else None  # answers to score at close
+
+reliable = ReliableSender(None)  # players that joined with join+rel: (see reliable.py); socket set below
+answers_seen = AnswerDedup()
+channel = None  # multicast.MulticastChannel when MULTICAST is set and usable
+fanout_lock = threading.Lock()  # keeps a broadcast and a multicast subscribe from interleaving
+
+message_queue = queue.Queue(INGRESS_QUEUE)  # answers: (addr, msg, receive time)
+limiter = ingress.RateLimiter()  # per-address token buckets
+
+METRICS = metrics.Registry()
+players_connected = METRICS.gauge("quiz_players_connected", "Joined players", fn=lambda: len(clients))
+bytes_in = METRICS.counter("quiz_bytes_in_total", "Bytes received from players")
+bytes_out = METRICS.counter("quiz_bytes_out_total", "Bytes sent to players")
+frames_in = METRICS.counter("quiz_frames_in_total", "Datagrams received from players")
+frames_out = METRICS.counter("quiz_frames_out_total", "Datagrams sent to players")
+wakeups = METRICS.counter("quiz_loop_wakeups_total", "Listener recv and quiz queue wakeups", "loop")
+broadcast_seconds = METRICS.histogram("quiz_broadcast_seconds", "Time to send one broadcast to every player")
+queue_wait_seconds = METRICS.histogram("quiz_queue_wait_seconds", "Time a datagram waited in message_queue")
+answer_seconds = METRICS.histogram("quiz_answer_seconds", "Receive-to-scored time of an answer")
+scoring_seconds = METRICS.histogram("quiz_scoring_seconds", "Time to score and award all answers to a question")
+transition_lag = METRICS.histogram("quiz_transition_lag_seconds", "How late question deadlines and gaps fired")
+retransmits = METRICS.counter("quiz_retransmits_total", "Datagrams resent to reliable players")
+given_up = METRICS.counter("quiz_retransmits_given_up_total", "Datagrams dropped after the retry window", "stream")
+multicast_members = METRICS.gauge("quiz_multicast_members", "Players receiving broadcasts via multicast",
+                                  fn=lambda: len(channel) if channel is not None else 0)
+duplicate_answers = METRICS.counter("quiz_duplicate_answers_total", "Retransmitted answers ignored")
+duplicate_joins = METRICS.counter("quiz_duplicate_joins_total", "Repeated joins answered without rejoining")
+ingress_dropped = METRICS.counter("quiz_ingress_dropped_total", "Datagrams dropped on arrival, by reason", "reason")
+ingress_queue = METRICS.gauge("quiz_ingress_queue", "Answers waiting for the quiz thread",
+                              fn=lambda: message_queue.qsize())
+ingress_tracked = METRICS.gauge("quiz_ingress_tracked_addresses", "Addresses with a token bucket",
+                                fn=lambda: len(limiter))
+
+
+def count_sent(size):
+    frames_out.inc()
+    bytes_out.inc(size)
+
+
+reliable.on_send = count_sent
+
+
+def send_to(server, message, addr, sequenced=True):
+    data = message.encode()
+    if sequenced and addr in reliable:
+        reliable.send(addr, data)
+        return
+    server.sendto(data, addr)
+    count_sent(len(data))
 
-message_queue = queue.Queue()
 
 # Send a message to all connected clients.
 def broadcast(server, message):
-    for addr in clients:
-        server.sendto(message.encode(), addr)
+    data = message if isinstance(message, bytes) else message.encode()
+    start = time.perf_counter()
+    plain = 0
+    with fanout_lock:
+        for addr in list(clients):
+            if channel is not None and addr in channel:
+                continue
+            if addr in reliable:
+                reliable.send(addr, data)
+            else:
+                server.sendto(data, addr)
+                plain += 1
+        if channel is not None and len(channel):
+            try:
+                channel.send(data)
+            except OSError as e:
+                log.warning("⚠️ Multicast send failed (%s); falling back to unicast", e)
+                for addr in stop_multicast():
+                    reliable.send(addr, data)
+    broadcast_seconds.observe(time.perf_counter() - start)
+    frames_out.inc(plain)
+    bytes_out.inc(plain * len(data))
 
-# Main quiz loop once started by operator.
-def quiz_game(server):
-    print("\n✅ Quiz starting now!")
-    broadcast(server, "broadcast:The quiz is starting now!\n")
 
-    for q in questions:
-        question_msg = f"question {q['id']}: {q['question']}\n{q['options']}"
-        broadcast(server, question_msg)
-        print(f"\n📨 Sent: {q['question']}")
+def forget_address(addr):
+    """Stop sending to addr (its player rejoined from another address)."""
+    pid = clients.remove(addr)
+    if pid is not None:
+        players.conns[pid] = None
+    reliable.remove(addr)
+    answers_seen.forget(addr)
+    if channel is not None:
+        channel.unsubscribe(addr)
+    log.info("🔁 %s was taken over by a newer join", addr)
 
-        start_time = time.time()
-        answered = False
 
-        while time.time() - start_time < TIME:
-            server.settimeout(1)
-            try:
-                addr, msg = message_queue.get(timeout=1)
-                if msg.startswith("answer:"):
-                    answer = msg.split(":")[1]
-                    user = clients.get(addr, "Unknown")
-                    if answer == q["correct_answer"] and not answered:
-                        scores[user] += POINTS
-                        broadcast(server, f"broadcast:{user} answered correctly and got {POINTS} points!")
-                        answered = True
-                        break
-            except queue.Empty:
-                continue
-            except socket.timeout:
-                continue
+def stop_multicast():
+    """Send everything by unicast from now on; returns the former group members."""
+    global channel
+    members, channel = channel.members, None
+    return members
+
+
+def count_given_up(stream, total):
+    given_up.inc(total - given_up.values.get(stream, 0), label=stream)
+
 
-        if not answered:
-            broadcast(server, f"broadcast:Time’s up! Correct answer was {q['correct_answer']}.")
+def retransmit_loop():
+    while True:
+        time.sleep(RTO / 2)
+        retransmits.inc(reliable.retransmit())
+        count_given_up("unicast", reliable.given_up)
+        group = channel
+        if group is not None:
+            retransmits.inc(group.retransmit())
+            count_given_up("multicast", group.given_up)
 
-        # Send scores
-        for u, s in scores.items():
-            broadcast(server, f"score:{u}:{s}")
-        time.sleep(2)
+def open_question(server, game, when):
+    """Broadcast the next question and schedule its deadline, or end the game."""
+    global current_qid
+    qid = next(game["questions"], None)
+    if qid is None:
+        broadcast(server, "broadcast:Game over! Thanks for playing.")
+        record("finish")
+        game["over"] = True
+        report_analytics(game["analytics"])
+        return
+    q = bank.get(qid)
+    record("question", index=game["position"])
+    game["position"] += 1
+    current_qid = str(q["id"])
+    letters, correct = tuple(LETTERS[:len(q["options"])]), answer_letter(q)
+    game["current"] = {"correct": correct, "answered": False, "letters": letters}
+    index, opened = letters.index(correct) if correct else -1, time.perf_counter()
+    game["analytics"].open(q["id"], q["q"], q["options"], index, opened)
+    if batch is not None:
+        batch.open(len(letters), index, opened)
+    broadcast(server, bank.frame(qid, "udp"))
+    log.info("\n📨 Sent: %s", q['q'])
+    deadline = when + TIME
+    game["timer"] = game["scheduler"].call_at(deadline, close_question, server, game, deadline)
 
-    broadcast(server, "broadcast:Game over! Thanks for playing.")
-    print("\n🏁 Game finished.")
+
+def close_question(server, game, when):
+    """Deadline reached or answered: announce, send scores, schedule the next question."""
+    global current_qid
+    current, game["current"] = game["current"], None
+    current_qid = None
+    game["analytics"].close()
+    if batch is not None:
+        score_answers(server, current)
+    elif not current["answered"]:
+        broadcast(server, f"broadcast:Time’s up! Correct answer was {current['correct']}.")
+
+    # Send scores
+    for u, s in zip(players.names, players.points):
+        broadcast(server, f"score:{u}:{s}")
+    game["timer"] = game["scheduler"].call_at(when + GAP, open_question, server, game, when + GAP)
+
+
+def report_analytics(analytics):
+    """Log the game's question analytics and write them to ANALYTICS as JSON and CSV."""
+    log.info("\n📊 Questions:\n%s", "\n".join(analytics.table()))
+    if not ANALYTICS:
+        return
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ANALYTICS,
+                        f"{ROOM}-{time.strftime('%Y%m%d-%H%M%S')}")
+    try:
+        log.info("📊 Written to %s and %s", *analytics.export(path))
+    except OSError as e:
+        log.warning("⚠️ Could not write analytics: %s", e)
+
+
+def score_answers(server, current):
+    """Speed scoring: award every answer to the closed question in one batch."""
+    start = time.perf_counter()
+    scored = batch.close()
+    points, names = players.points, players.names
+    for pid, pts in scored.awards:
+        points[pid] += pts
+    if scored.awards:
+        record("awards", points={names[pid]: pts for pid, pts in scored.awards})
+    counts = ", ".join(f"{letter}) {n}" for letter, n in zip(current["letters"], scored.counts))
+    if scored.awards:
+        pid, pts = scored.awards[0]
+        broadcast(server, f"broadcast:{len(scored.awards)} of {scored.answers} answered {current['correct']} "
+                          f"correctly, {names[pid]} first (+{pts}). Answers: {counts}")
+    else:
+        broadcast(server, f"broadcast:Time’s up! Correct answer was {current['correct']}. Answers: {counts}")
+    scoring_seconds.observe(time.perf_counter() - start)
+
+
+def handle_answer(server, game, addr, msg, received):
+    # answer:<letter> or, from reliable players, answer:<letter>:<qid>:<aid>
+    current = game["current"]
+    parts = msg.split(":")
+    answer = parts[1]
+    if current is None or len(parts) > 2 and parts[2] != current_qid:
+        return
+    pid = clients.get(addr)
+    if pid is None:
+        return  # not joined (or taken over by a newer join under the same name)
+    user = players.names[pid]
+    log.debug("📨 Received answer from %s: %s", user, answer)
+    letters = current["letters"]
+    option = letters.index(answer) if answer in letters else -1
+    game["analytics"].answer(pid, option, received)
+    if batch is not None:
+        batch.add(pid, option, received)
+        answer_seconds.observe(time.perf_counter() - received)
+        if len(batch) >= len(clients):
+            game["timer"].cancel()  # everyone has answered
+            close_question(server, game, game["scheduler"].time())
+        return
+    if answer == current["correct"] and not current["answered"]:
+        players.points[pid] += POINTS
+        record("award", user=user, points=POINTS)
+        answer_seconds.observe(time.perf_counter() - received)
+        broadcast(server, f"broadcast:{user} answered correctly and got {POINTS} points!")
+        current["answered"] = True
+        game["timer"].cancel()
+        close_question(server, game, game["scheduler"].time())
+        return
+    answer_seconds.observe(time.perf_counter() - received)
+
+
+def handle_join(server, addr, msg):
+    """join:<username> or join+rel:<username>. A repeat from the same address under the same
+    name only gets its welcome again (a lost welcome), without rejoining."""
+    reliable_join = msg.startswith("join+rel:")
+    username = msg.split(":", 1)[1]
+    previous = clients.get(addr)
+    if len(username) == 0:
+        username = players.names[previous] if previous is not None else f"Guest {len(clients) + 1}"
+    pid = players.intern(username)
+    if previous == pid and reliable_join == (addr in reliable):
+        duplicate_joins.inc()
+        if not reliable_join:
+            send_to(server, f"Welcome {username}! Waiting for quiz to start...", addr)
+        return  # a reliable player's welcome is already being retransmitted
+    if previous is not None and previous != pid:
+        clients.remove(addr)  # this address rejoined under another name
+        players.conns[previous] = None
+    old = players.conns[pid]
+    if old is not None and old != addr:
+        forget_address(old)  # same name from a new address: it takes over, one score per name
+    if previous != pid:
+        players.conns[pid] = addr
+        clients.add(addr, pid)
+    record("join", user=username)
+    answers_seen.forget(addr)
+    if channel is not None:
+        channel.unsubscribe(addr)
+    if reliable_join:
+        reliable.add(addr)
+    else:
+        reliable.remove(addr)
+    log.info("👤 %s joined from %s", username, addr)
+    send_to(server, f"Welcome {username}! Waiting for quiz to start...", addr)
+    if channel is not None and addr in reliable:
+        send_to(server, "multicast:%s:%d" % channel.group, addr)
+
+
+# Main quiz loop once started by operator.
+def quiz_game(server):
+    """Deadlines and gaps are timers on a monotonic Scheduler; the thread blocks on the
+    message queue exactly until the next one is due, instead of polling."""
+    log.info("\n✅ Quiz starting now!")
+    broadcast(server, "broadcast:The quiz is starting now!\n")
+
+    if saved is not None and saved["questions"] is not None:
+        questions, position = saved["questions"], saved["position"]
+        log.info("♻️ Resuming the interrupted game at question %d of %d.", position + 1, len(questions))
+    else:
+        questions, position = bank.sample(QUESTIONS_PER_GAME, CATEGORY), 0
+        record("game", questions=questions)
+    scheduler = Scheduler(lag=transition_lag)
+    game = {"scheduler": scheduler, "questions": iter(questions[position:]), "position": position,
+            "current": None, "timer": None, "over": False, "analytics": GameAnalytics()}
+    open_question(server, game, scheduler.time())
+    while not game["over"]:
+        try:
+            addr, msg, received = message_queue.get(timeout=scheduler.timeout())
+        except queue.Empty:
+            wakeups.inc(label="queue")
+            scheduler.run_due()
+            continue
+        wakeups.inc(label="queue")
+        queue_wait_seconds.observe(time.perf_counter() - received)
+        scheduler.run_due()  # a deadline that passed first closes the question before this answer
+        if msg.startswith("answer:") and not game["over"]:
+            handle_answer(server, game, addr, msg, received)
+
+    log.info("\n🏁 Game finished.")
 
 
 # Server setup
 with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
     server.bind((HOST, PORT))
-    print(f"🎮 UDP Server listening on {HOST}:{PORT}")
+    server = lossy.wrap(server)  # no-op unless QUIZ_UDP_LOSS is set
+    reliable.sock = server
+    if MULTICAST:
+        try:
+            group, group_port = multicast.parse_group(MULTICAST)
+            channel = multicast.MulticastChannel(lossy.wrap(multicast.sender_socket(HOST)), server,
+                                                 group, group_port, on_send=count_sent)
+            log.info("📡 Broadcasting to multicast group %s:%d", group, group_port)
+        except (OSError, ValueError) as e:
+            log.warning("⚠️ Multicast unavailable (%s); using unicast", e)
+    log.info("🎮 UDP Server listening on %s:%d", HOST, PORT)
+    if saved is not None:
+        log.info("📒 Recovered %d scores from %s", len(saved["scores"]), journal.path)
+    if METRICS_PORT:
+        metrics.serve(METRICS, "127.0.0.1", METRICS_PORT)
 
     # Run listener in a separate thread to allow manual quiz start
     def listen_for_clients():
+        """Admit datagrams (see ingress.py): drop what is malformed, from an address that has
+        not joined or over its rate before decoding it; handle acks and joins here and queue
+        only answers for the quiz thread."""
         while True:
             try:
-                data, addr = server.recvfrom(1024)
-                msg = data.decode().strip()
-                message_queue.put((addr, msg))
-                if msg.startswith("join:"):
-                    username = msg.split(":", 1)[1]
-                    if len(username) == 0:
-                        username = f"Guest {len(clients) + 1}" 
-                    clients[addr] = username
-                    scores[username] = 0
-                    print(f"👤 {username} joined from {addr}")
-                    server.sendto(f"Welcome {username}! Waiting for quiz to start...".encode(), addr)
-
+                data, addr = server.recvfrom(MAX_DATAGRAM)
             except socket.timeout:
                 continue
+            received = time.perf_counter()
+            wakeups.inc(label="recv")
+            frames_in.inc()
+            bytes_in.inc(len(data))
+            kind = ingress.classify(data)
+            if kind is None:
+                ingress_dropped.inc(label="malformed")
+                continue
+            if kind != "join" and addr not in clients:
+                ingress_dropped.inc(label="unknown sender")
+                continue
+            if not limiter.allow(addr, ingress.COST.get(kind, 1.0)):
+                ingress_dropped.inc(label="rate")
+                continue
+            try:
+                msg = data.decode().strip()
+            except UnicodeDecodeError:
+                ingress_dropped.inc(label="malformed")
+                continue
+            if kind == "ack":
+                reliable.ack(addr, msg)
+            elif kind == "gack":
+                if channel is not None:
+                    channel.ack(addr, msg)
+            elif kind == "subscribe":
+                with fanout_lock:
+                    if channel is not None and addr in reliable:
+                        send_to(server, f"subscribed:{channel.subscribe(addr)}", addr)
+            elif kind == "join":
+                handle_join(server, addr, msg)
+            elif not ingress.answer_ok(msg):
+                ingress_dropped.inc(label="malformed")
+            elif message_queue.full():
+                # not acknowledged either, so a reliable player sends it again
+                ingress_dropped.inc(label="queue full")
+            else:
+                if msg.count(":") >= 3:
+                    aid = msg.rsplit(":", 1)[1]
+                    send_to(server, f"answered:{aid}", addr, sequenced=False)
+                    if not aid.isdigit() or not answers_seen.first_time(addr, int(aid)):
+                        duplicate_answers.inc()
+                        continue
+                message_queue.put_nowait((addr, msg, received))
 
     listener_thread = threading.Thread(target=listen_for_clients, daemon=True)
     listener_thread.start()
+    threading.Thread(target=retransmit_loop, daemon=True).start()
+
+    while True:
+        cmd = input("\n🕹️ Press ENTER to start the quiz once all players have joined (or type 'stats')...")
+        if cmd.strip().lower() == "stats":
+            print(METRICS.summary())
+            continue
+        break
+    quiz_game(server)
 
-    input("\n🕹️ Press ENTER to start the quiz once all players have joined...")
-    quiz_game(server)
\ No newline at end of file
+    # the retransmit thread dies with the process: give the last messages time to be acked
+    deadline = time.monotonic() + DRAIN_TIME
+    while (reliable.pending() or channel is not None and channel.pending()) and time.monotonic() < deadline:
+        time.sleep(RTO / 2)
+    if journal is not None:
+        journal.close()